@@ -0,0 +1,125 @@
+import os
+import zlib
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#files are split into fixed size chunks. ES segment files are written once and
+#never modified, so whole-file reuse (see manifest.scan_source) does most of the
+#deduplication and fixed chunks keep hashing at hashlib speed
+CHUNK_SIZE = 4 * 1024 * 1024
+
+#the codec of a chunk is the suffix of its file name
+RAW = ""
+ZSTD = ".zst"
+ZLIB = ".zz"
+CODECS = {"none": RAW, "zstd": ZSTD, "zlib": ZLIB}
+
+ZSTD_LEVEL = 3
+#zlib is only the fallback when zstandard is not installed, favour speed
+ZLIB_LEVEL = 1
+
+def default_compression() -> str:
+    return "zstd" if zstandard is not None else "zlib"
+
+class ChunkStore():
+    """
+    Content addressed storage shared by all backups in a repository.
+
+    Every chunk is stored once, at <root>/<first two hex digits>/<sha256>, so a
+    chunk that is already present costs nothing to back up again. Chunks are
+    compressed unless that does not make them smaller; the file name suffix
+    says how (none, .zst or .zz).
+
+    put and get can be called from several threads.
+    """
+    def __init__(self, root: Path, compression: str = None):
+        self.root = Path(root)
+        compression = compression or default_compression()
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard module (pip install zstandard)")
+        self.codec = CODECS[compression]
+        #look for the codec new chunks are written with first
+        self.lookup_order = [self.codec] + [c for c in CODECS.values() if c != self.codec]
+        #zstandard compressors must not be shared between threads
+        self.local = threading.local()
+
+    def path(self, digest: str, codec: str = RAW) -> Path:
+        return self.root / digest[:2] / f"{digest}{codec}"
+
+    def find(self, digest: str) -> Optional[Path]:
+        for codec in self.lookup_order:
+            path = self.path(digest, codec)
+            if path.exists():
+                return path
+        return None
+
+    def has(self, digest: str) -> bool:
+        return self.find(digest) is not None
+
+    def stored_size(self, digest: str) -> int:
+        return self.find(digest).stat().st_size
+
+    def compress(self, data: bytes) -> Tuple[str, bytes]:
+        if self.codec == ZSTD:
+            if not hasattr(self.local, "compressor"):
+                self.local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            packed = self.local.compressor.compress(data)
+        elif self.codec == ZLIB:
+            packed = zlib.compress(data, ZLIB_LEVEL)
+        else:
+            return RAW, data
+        #already compressed data (gzipped logs, compressed ES stored fields) stays raw
+        if len(packed) >= len(data):
+            return RAW, data
+        return self.codec, packed
+
+    def put(self, data: bytes) -> Tuple[str, int, bool]:
+        """
+        Stores data unless a chunk with the same content exists.
+
+        Returns:
+            (sha256 of data, bytes used in the store, whether the chunk was new)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self.find(digest)
+        if existing is not None:
+            return digest, existing.stat().st_size, False
+
+        codec, stored = self.compress(data)
+        path = self.path(digest, codec)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        #write then rename, so an interrupted backup never leaves a partial chunk
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(stored)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return digest, len(stored), True
+
+    def decode(self, path: Path, data) -> bytes:
+        """Returns the content of the chunk at path, given the bytes stored there."""
+        if path.suffix == ZSTD:
+            if zstandard is None:
+                raise RuntimeError(f"Chunk {path.name} is zstd compressed, install the zstandard module to read it")
+            return zstandard.ZstdDecompressor().decompress(data)
+        if path.suffix == ZLIB:
+            return zlib.decompress(data)
+        return data
+
+    def get(self, digest: str) -> bytes:
+        path = self.find(digest)
+        if path is None:
+            raise FileNotFoundError(f"Chunk {digest} is missing from {self.root}")
+        with open(path, 'rb') as fp:
+            return self.decode(path, fp.read())
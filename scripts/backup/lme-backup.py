@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from chunkstore import CODECS, ChunkStore, default_compression
+from manifest import RESTORABLE_STATUSES, Manifest, list_backups, repository_lock, scan_source
+from restore import restore_source
+from retention import RetentionPolicy, legacy_backups, prune_backups, repository_usage, select_backups, stored_bytes
+from verify import verify_backup
+from snapshot import (DEFAULT_LOCATION, DEFAULT_REPOSITORY, ElasticsearchClient, SnapshotError, create_snapshot,
+                      delete_snapshot, register_repository, repository_snapshot_state, restore_snapshot,
+                      snapshot_summary)
+
+CHUNKS_DIR = ".chunks"
+#written next to manifest.json when the backup has an Elasticsearch snapshot
+SNAPSHOT_INFO = "elasticsearch_snapshot.json"
+#snapshots of pruned backups that could not be deleted yet, retried by the next prune
+PENDING_SNAPSHOTS = ".snapshots_to_delete.json"
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+def parse_size(value: str) -> int:
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value or 0)
+
+def default_repo() -> Path:
+    #backup_lme keeps backups next to the podman storage
+    try:
+        graphroot = subprocess.run(["podman", "info", "--format", "{{.Store.GraphRoot}}"],
+                                   capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        graphroot = ""
+    return Path(graphroot or "/var/lib/containers/storage") / "backups"
+
+def parse_sources(values: List[str]) -> List[Tuple[str, str]]:
+    sources = []
+    for value in values:
+        name, sep, path = value.partition("=")
+        if not sep or not name or not path:
+            raise argparse.ArgumentTypeError(f"Expected NAME=PATH, got '{value}'")
+        sources.append((name, path))
+    return sources
+
+def write_status(backup_dir: Path, source: str, status: str):
+    #per source status files, read by backup_lme and rollback_lme
+    status_dir = backup_dir / source
+    status_dir.mkdir(parents=True, exist_ok=True)
+    (status_dir / "backup_status.txt").write_text(status + "\n")
+
+def previous_entries(repo: Path, name: str) -> Dict[str, Dict[str, Dict]]:
+    """Entries of the newest other backup, per source and path."""
+    backups = [b for b in list_backups(repo) if b.name != name]
+    if not backups:
+        return {}
+    manifest = Manifest.load(backups[-1])
+    return {
+        source: {entry["path"]: entry for entry in data["entries"]}
+        for source, data in manifest.sources.items()
+    }
+
+def backup(args) -> int:
+    with repository_lock(Path(args.repo)):
+        return run_backup(args)
+
+def run_backup(args) -> int:
+    repo = Path(args.repo)
+    backup_dir = repo / args.name
+    backup_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        store = ChunkStore(repo / CHUNKS_DIR, args.compression)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    previous = previous_entries(repo, args.name)
+    manifest = Manifest(args.name)
+    sources = parse_sources(args.source)
+
+    #sources are walked concurrently, and changed files from all of them are
+    #hashed and compressed in one shared pool (hashlib, zlib and zstandard
+    #release the GIL), so one large volume does not hold up the others
+    with ThreadPoolExecutor(args.workers) as file_pool, ThreadPoolExecutor(min(len(sources), args.workers)) as source_pool:
+        futures = {
+            source: source_pool.submit(scan_source, path, store, manifest, previous.get(source), executor=file_pool)
+            for source, path in sources if os.path.isdir(path)
+        }
+
+        failed = False
+        for source, path in sources:
+            if source not in futures:
+                print(f"{source}: {path} not found")
+                manifest.sources[source] = {"path": path, "status": "FAILED", "entries": [], "stats": {}}
+                write_status(backup_dir, source, "FAILED")
+                failed = True
+                continue
+
+            result = futures[source].result()
+            #only the root directory itself
+            status = "EMPTY" if len(result["entries"]) <= 1 else "SUCCESS"
+            manifest.sources[source] = {"path": path, "status": status, **result}
+            write_status(backup_dir, source, status)
+
+            stats = result["stats"]
+            print(f"{source}: {stats['files']} files, {format_bytes(stats['bytes'])}, "
+                  f"{stats['reused_files']} unchanged, {format_bytes(stats['new_bytes'])} new after compression")
+
+    manifest.save(backup_dir)
+
+    if args.json:
+        print(json.dumps({s: {"status": d["status"], **d["stats"]} for s, d in manifest.sources.items()}))
+    return 1 if failed else 0
+
+def restore(args) -> int:
+    backup_dir = Path(args.backup)
+    manifest = Manifest.load(backup_dir)
+    store = ChunkStore(backup_dir.parent / CHUNKS_DIR)
+
+    #NAME restores to the recorded path, NAME=PATH somewhere else
+    targets = {}
+    for value in args.source or manifest.sources:
+        name, _, path = value.partition("=")
+        if name not in manifest.sources:
+            print(f"{name}: not in backup {backup_dir.name}")
+            return 1
+        state = manifest.sources[name]["status"]
+        if state not in RESTORABLE_STATUSES and not args.force:
+            print(f"{name}: backup status is {state}, not restoring it (--force to restore anyway)")
+            return 1
+        targets[name] = path or manifest.sources[name]["path"]
+
+    with repository_lock(backup_dir.parent, exclusive=False):
+        for name, target in targets.items():
+            stats = restore_source(manifest.entries(name), Path(target), store, args.workers,
+                                   checksum=args.checksum, reflink=not args.no_reflink)
+            print(f"{name}: restored {stats['files']} files, {format_bytes(stats['bytes'])} to {target} "
+                  f"({format_bytes(stats['cloned_bytes'])} cloned), {stats['unchanged']} unchanged, {stats['removed']} removed")
+    return 0
+
+def status(args) -> int:
+    """Exits 0 when the backup has the source and it can be restored, for rollback_lme."""
+    source = Manifest.load(Path(args.backup)).sources.get(args.source)
+    state = source["status"] if source is not None else "MISSING"
+    print(f"{args.source}: {state}")
+    return 0 if state in RESTORABLE_STATUSES else 1
+
+def verify(args) -> int:
+    backup_dir = Path(args.backup)
+    store = ChunkStore(backup_dir.parent / CHUNKS_DIR)
+    with repository_lock(backup_dir.parent, exclusive=False):
+        report = verify_backup(backup_dir, store, args.workers, use_cache=not args.full,
+                               required_sources=args.source or ())
+
+    print(f"{report['backup']}: {report['files']} files, {report['chunks']} chunks, "
+          f"{report['read_chunks']} read, {report['chunks'] - report['read_chunks']} already verified")
+    for digest in report["missing_chunks"]:
+        print(f"missing chunk: {digest}")
+    for digest in report["corrupt_chunks"]:
+        print(f"corrupt chunk: {digest}")
+    for path in report["bad_files"]:
+        print(f"bad file: {path}")
+    for source in report["failed_sources"]:
+        print(f"source not backed up: {source}")
+
+    if args.json:
+        print(json.dumps(report))
+    ok = not (report["missing_chunks"] or report["corrupt_chunks"] or report["bad_files"] or report["failed_sources"])
+    print("Backup verified" if ok else "Backup verification FAILED")
+    return 0 if ok else 1
+
+def usage(args) -> int:
+    repo = Path(args.repo) if args.repo else default_repo()
+    with repository_lock(repo, exclusive=False):
+        backups = repository_usage(repo)
+
+    if args.json:
+        print(json.dumps([{"name": b.name, "created": b.created.isoformat(), "files": b.files,
+                           "unique_bytes": b.unique_bytes, "shared_bytes": b.shared_bytes} for b in backups]))
+        return 0
+
+    print(f"{'Backup':<20} {'Created (UTC)':<20} {'Files':>9} {'Unique':>10} {'Shared':>10}")
+    for b in backups:
+        print(f"{b.name:<20} {b.created:%Y-%m-%d %H:%M:%S}  {b.files:>9} {format_bytes(b.unique_bytes):>10} {format_bytes(b.shared_bytes):>10}")
+    print(f"{len(backups)} backups, {format_bytes(stored_bytes(backups))} in the chunk store")
+    legacy = legacy_backups(repo)
+    if legacy:
+        print(f"{len(legacy)} backups without a manifest (older LME versions) are not counted: {', '.join(p.name for p in legacy)}")
+    return 0
+
+def load_pending_snapshots(repo: Path) -> List[str]:
+    path = repo / PENDING_SNAPSHOTS
+    return json.loads(path.read_text()) if path.exists() else []
+
+def save_pending_snapshots(repo: Path, names: List[str]):
+    path = repo / PENDING_SNAPSHOTS
+    if names:
+        path.write_text(json.dumps(sorted(set(names))) + "\n")
+    elif path.exists():
+        path.unlink()
+
+def delete_pruned_snapshots(args, repo: Path, snapshots: List[str]):
+    """
+    Deletes the Elasticsearch snapshots of pruned backups. Snapshots that
+    cannot be deleted now (no password, Elasticsearch down) are remembered in
+    the repository and retried by the next prune.
+    """
+    pending = sorted(set(load_pending_snapshots(repo) + snapshots))
+    if not pending:
+        return
+    if not os.environ.get(args.password_env):
+        print(f"Elasticsearch snapshots of pruned backups are kept until a prune with ${args.password_env} set: {', '.join(pending)}")
+        save_pending_snapshots(repo, pending)
+        return
+
+    client = es_client(args)
+    remaining = []
+    for name in pending:
+        try:
+            delete_snapshot(client, name, args.repository)
+            print(f"elasticsearch: deleted snapshot {name}")
+        except SnapshotError as e:
+            if "snapshot_missing_exception" in str(e):
+                continue
+            print(f"elasticsearch: {e}")
+            remaining.append(name)
+    save_pending_snapshots(repo, remaining)
+
+def prune(args) -> int:
+    repo = Path(args.repo) if args.repo else default_repo()
+    policy = RetentionPolicy(args.keep_last, args.keep_daily, args.keep_weekly, parse_size(args.max_bytes), args.min_free)
+    if policy == RetentionPolicy():
+        print("No retention policy given, pass --keep-last, --keep-daily, --keep-weekly, --max-bytes or --min-free")
+        return 1
+
+    snapshots = []
+    with repository_lock(repo):
+        backups = repository_usage(repo)
+        legacy = legacy_backups(repo)
+        fs = os.statvfs(repo)
+        selected = select_backups(backups, policy, fs.f_bavail * fs.f_frsize, fs.f_blocks * fs.f_frsize)
+        pruned = {b.name for b in selected}
+        kept = [b for b in backups if b.name not in pruned]
+        for b in selected:
+            print(f"prune {b.name}: {format_bytes(b.unique_bytes)} unique")
+        print(f"Keeping {len(kept)} of {len(backups)} backups, "
+              f"{format_bytes(stored_bytes(backups) - stored_bytes(kept))} to free")
+        if legacy:
+            #their space counts against --min-free but they are never removed
+            print(f"{len(legacy)} backups without a manifest are not pruned, remove them by hand: "
+                  f"{', '.join(p.name for p in legacy)}")
+        if args.dry_run:
+            return 0
+
+        if selected:
+            #the Elasticsearch snapshots of snapshot mode backups live in the lme_backups volume
+            snapshots = [json.loads((b.path / SNAPSHOT_INFO).read_text())["snapshot"]
+                         for b in selected if (b.path / SNAPSHOT_INFO).exists()]
+            save_pending_snapshots(repo, load_pending_snapshots(repo) + snapshots)
+            stats = prune_backups(repo, ChunkStore(repo / CHUNKS_DIR), selected)
+            print(f"Pruned {len(selected)} backups, deleted {stats['chunks']} chunks, freed {format_bytes(stats['bytes'])}")
+
+    delete_pruned_snapshots(args, repo, snapshots)
+    return 0
+
+def es_client(args) -> ElasticsearchClient:
+    password = os.environ.get(args.password_env)
+    if not password:
+        raise SystemExit(f"Set the Elasticsearch password in ${args.password_env}")
+    return ElasticsearchClient(args.host, args.port, args.username, password)
+
+def snapshot(args) -> int:
+    client = es_client(args)
+    try:
+        register_repository(client, args.repository, args.location)
+        result = create_snapshot(client, args.name, args.repository)
+    except SnapshotError as e:
+        print(f"elasticsearch: {e}")
+        if args.backup:
+            write_status(Path(args.backup), "elasticsearch", "FAILED")
+        return 1
+
+    summary = snapshot_summary(result, args.repository)
+    shards = summary["shards"] or {}
+    print(f"elasticsearch: snapshot {args.name} {summary['state']}, {summary['indices']} indices, "
+          f"{shards.get('successful', 0)}/{shards.get('total', 0)} shards")
+
+    if args.backup:
+        backup_dir = Path(args.backup)
+        backup_dir.mkdir(parents=True, exist_ok=True)
+        (backup_dir / SNAPSHOT_INFO).write_text(json.dumps(summary, indent=2) + "\n")
+        write_status(backup_dir, "elasticsearch", summary["state"])
+    return 0
+
+def snapshot_check(args) -> int:
+    """Checks on disk, with Elasticsearch stopped, that the backup's snapshot is complete."""
+    name = json.loads((Path(args.backup) / SNAPSHOT_INFO).read_text())["snapshot"]
+    try:
+        state = repository_snapshot_state(Path(args.repository_path), name)
+    except SnapshotError as e:
+        print(f"elasticsearch: {e}")
+        return 1
+    print(f"elasticsearch: snapshot {name} {state}")
+    return 0 if state == "SUCCESS" else 1
+
+def snapshot_restore(args) -> int:
+    name = args.name
+    if not name:
+        name = json.loads((Path(args.backup) / SNAPSHOT_INFO).read_text())["snapshot"]
+
+    client = es_client(args)
+    try:
+        client.wait_until_ready()
+        register_repository(client, args.repository, args.location)
+        result = restore_snapshot(client, name, args.repository)
+    except SnapshotError as e:
+        print(f"elasticsearch: {e}")
+        return 1
+
+    shards = result.get("shards", {})
+    print(f"elasticsearch: restored snapshot {name}, {len(result.get('indices', []))} indices, "
+          f"{shards.get('successful', 0)}/{shards.get('total', 0)} shards")
+    return 0 if shards.get("failed", 0) == 0 else 1
+
+def add_es_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--host", default="localhost", help="Elasticsearch host")
+    parser.add_argument("--port", type=int, default=9200, help="Elasticsearch port")
+    parser.add_argument("--username", default="elastic", help="Elasticsearch user")
+    parser.add_argument("--password-env", default="ES_PASSWORD", help="Environment variable holding the password")
+    parser.add_argument("--repository", default=DEFAULT_REPOSITORY, help="Snapshot repository name")
+    parser.add_argument("--location", default=DEFAULT_LOCATION, help="Repository path inside the Elasticsearch container")
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental, deduplicated backups of the LME installation and volumes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = subparsers.add_parser("backup", help="Back up directories into a new backup in the repository")
+    backup_parser.add_argument("--repo", required=True, help="Backup repository, e.g. <graphroot>/backups")
+    backup_parser.add_argument("--name", required=True, help="Name of the backup, e.g. the timestamp")
+    backup_parser.add_argument("--source", action="append", required=True, metavar="NAME=PATH",
+                               help="Directory to back up, e.g. volumes/lme_esdata01=/var/lib/containers/storage/volumes/lme_esdata01/_data")
+    backup_parser.add_argument("--json", action="store_true", help="Also print per source statistics as JSON")
+    backup_parser.add_argument("--compression", choices=sorted(CODECS), default=default_compression(),
+                               help="Compression for new chunks (default: zstd if the zstandard module is installed, else zlib)")
+    backup_parser.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                               help="Threads hashing and compressing files (default: number of CPUs)")
+    backup_parser.set_defaults(func=backup)
+
+    restore_parser = subparsers.add_parser("restore", help="Restore sources from a backup, rewriting only files that differ")
+    restore_parser.add_argument("--backup", required=True, help="Backup directory, e.g. <graphroot>/backups/<timestamp>")
+    restore_parser.add_argument("--source", action="append", metavar="NAME[=PATH]",
+                                help="Source to restore, optionally to another path (default: all, to their original paths)")
+    restore_parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Files written concurrently (default: number of CPUs)")
+    restore_parser.add_argument("--checksum", action="store_true", help="Compare existing files by sha256 instead of size and mtime")
+    restore_parser.add_argument("--no-reflink", action="store_true", help="Always copy chunk data, never clone it")
+    restore_parser.add_argument("--force", action="store_true",
+                                help="Also restore sources whose backup did not succeed, emptying their targets")
+    restore_parser.set_defaults(func=restore)
+
+    status_parser = subparsers.add_parser("status", help="Check that a source was backed up and can be restored")
+    status_parser.add_argument("--backup", required=True, help="Backup directory, e.g. <graphroot>/backups/<timestamp>")
+    status_parser.add_argument("--source", required=True, help="Source name, e.g. etc_lme")
+    status_parser.set_defaults(func=status)
+
+    verify_parser = subparsers.add_parser("verify", help="Check that every file of a backup can be restored")
+    verify_parser.add_argument("--backup", required=True, help="Backup directory, e.g. <graphroot>/backups/<timestamp>")
+    verify_parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Threads reading chunks (default: number of CPUs)")
+    verify_parser.add_argument("--full", action="store_true", help="Re-read chunks that were already verified")
+    verify_parser.add_argument("--source", action="append", metavar="NAME", help="Source the backup must contain (repeatable)")
+    verify_parser.add_argument("--json", action="store_true", help="Also print the report as JSON")
+    verify_parser.set_defaults(func=verify)
+
+    usage_parser = subparsers.add_parser("usage", help="Show the space used by each backup")
+    usage_parser.add_argument("--repo", help="Backup repository (default: <podman graphroot>/backups)")
+    usage_parser.add_argument("--json", action="store_true", help="Print the usage as JSON")
+    usage_parser.set_defaults(func=usage)
+
+    prune_parser = subparsers.add_parser("prune", help="Remove backups outside the retention policy and their unused chunks")
+    prune_parser.add_argument("--repo", help="Backup repository (default: <podman graphroot>/backups)")
+    prune_parser.add_argument("--keep-last", type=int, default=0, help="Keep the N newest backups")
+    prune_parser.add_argument("--keep-daily", type=int, default=0, help="Keep the newest backup of each of the last N days with backups")
+    prune_parser.add_argument("--keep-weekly", type=int, default=0, help="Keep the newest backup of each of the last N weeks with backups")
+    prune_parser.add_argument("--max-bytes", default="0", help="Prune the oldest kept backups until the chunk store fits, e.g. 500G (0: no limit)")
+    prune_parser.add_argument("--min-free", type=float, default=0,
+                              help="Prune the oldest kept backups until this percent of the filesystem is free (0: off)")
+    prune_parser.add_argument("--dry-run", action="store_true", help="Only show what would be pruned")
+    add_es_arguments(prune_parser)
+    prune_parser.set_defaults(func=prune)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Take an Elasticsearch snapshot while the stack is running")
+    snapshot_parser.add_argument("--name", required=True, help="Snapshot name, lowercase, e.g. lme-<timestamp>")
+    snapshot_parser.add_argument("--backup", help="Backup directory to record the snapshot in")
+    add_es_arguments(snapshot_parser)
+    snapshot_parser.set_defaults(func=snapshot)
+
+    snapshot_check_parser = subparsers.add_parser("snapshot-check", help="Check that a backup's snapshot is complete, reading the repository on disk")
+    snapshot_check_parser.add_argument("--backup", required=True, help=f"Backup directory with a {SNAPSHOT_INFO}")
+    snapshot_check_parser.add_argument("--repository-path", required=True, help="Host path of the repository, e.g. the lme_backups volume mountpoint")
+    snapshot_check_parser.set_defaults(func=snapshot_check)
+
+    snapshot_restore_parser = subparsers.add_parser("snapshot-restore", help="Restore an Elasticsearch snapshot")
+    target = snapshot_restore_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--name", help="Snapshot name")
+    target.add_argument("--backup", help=f"Backup directory with a {SNAPSHOT_INFO}")
+    add_es_arguments(snapshot_restore_parser)
+    snapshot_restore_parser.set_defaults(func=snapshot_restore)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import os
+import json
+import fcntl
+import stat
+import hashlib
+import datetime
+import contextlib
+from concurrent.futures import Executor, Future
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from chunkstore import ChunkStore, CHUNK_SIZE
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+FORMAT_VERSION = 1
+
+#a source with another status (FAILED) was not backed up, and restoring its
+#empty entry list would delete everything at the target
+RESTORABLE_STATUSES = ("SUCCESS", "EMPTY")
+
+FILE = "file"
+DIR = "dir"
+SYMLINK = "symlink"
+
+class Manifest():
+    """
+    Describes one backup: every backed up source with the metadata and chunk
+    list of each file, plus the stored size of every chunk it references.
+    """
+    def __init__(self, name: str, data: Dict = None):
+        self.name = name
+        self.data = data or {
+            "format": FORMAT_VERSION,
+            "name": name,
+            "created": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "chunk_size": CHUNK_SIZE,
+            "sources": {},
+            "chunks": {},
+        }
+
+    @property
+    def sources(self) -> Dict[str, Dict]:
+        return self.data["sources"]
+
+    @property
+    def chunks(self) -> Dict[str, int]:
+        #digest -> bytes used in the chunk store
+        return self.data["chunks"]
+
+    def entries(self, source: str) -> List[Dict]:
+        return self.sources[source]["entries"]
+
+    @classmethod
+    def load(cls, backup_dir: Path) -> "Manifest":
+        with open(Path(backup_dir) / MANIFEST_NAME, 'r') as fp:
+            data = json.load(fp)
+        if data.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported manifest format {data.get('format')} in {backup_dir}")
+        return cls(data["name"], data)
+
+    def save(self, backup_dir: Path):
+        path = Path(backup_dir) / MANIFEST_NAME
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.data, fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+
+def has_manifest(backup_dir: Path) -> bool:
+    return (Path(backup_dir) / MANIFEST_NAME).exists()
+
+def list_backups(repo: Path) -> List[Path]:
+    """Backups in the repository that have a manifest, oldest first."""
+    backups = [p for p in Path(repo).iterdir() if p.is_dir() and not p.name.startswith(".") and has_manifest(p)]
+    return sorted(backups, key=lambda p: Manifest.load(p).data["created"])
+
+@contextlib.contextmanager
+def repository_lock(repo: Path, exclusive: bool = True):
+    """
+    flock on <repo>/.lock. Backups and pruning take it exclusively, so chunks
+    written by a running backup are never collected; restore and verify share it.
+    """
+    Path(repo).mkdir(parents=True, exist_ok=True)
+    with open(Path(repo) / LOCK_NAME, 'a') as fp:
+        fcntl.flock(fp.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+def iter_tree(root: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Walks root with os.scandir, yielding (relative path, lstat) for the root
+    itself and everything below it, in sorted order. Symlinks are not followed.
+    """
+    yield ".", os.lstat(root)
+    stack = [("", root)]
+    while stack:
+        relative_dir, directory = stack.pop()
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        subdirs = []
+        for entry in entries:
+            relative = f"{relative_dir}{entry.name}"
+            st = entry.stat(follow_symlinks=False)
+            yield relative, st
+            if stat.S_ISDIR(st.st_mode):
+                subdirs.append((relative + "/", entry.path))
+        stack.extend(reversed(subdirs))
+
+def chunk_file(path: str, store: ChunkStore, chunk_size: int, chunk_sizes: Dict[str, int]) -> Tuple[str, List[str], int, int]:
+    """
+    Splits a file into chunks and stores the ones the store does not have yet.
+
+    Returns:
+        (sha256 of the file, chunk digests, bytes read, bytes newly stored)
+    """
+    file_hash = hashlib.sha256()
+    chunks = []
+    read_bytes = new_bytes = 0
+    with open(path, 'rb') as fp:
+        while True:
+            data = fp.read(chunk_size)
+            if not data:
+                break
+            file_hash.update(data)
+            digest, stored_size, new = store.put(data)
+            chunks.append(digest)
+            chunk_sizes[digest] = stored_size
+            read_bytes += len(data)
+            if new:
+                new_bytes += stored_size
+    return file_hash.hexdigest(), chunks, read_bytes, new_bytes
+
+def scan_source(root: str, store: ChunkStore, manifest: Manifest, previous: Optional[Dict[str, Dict]] = None,
+                chunk_size: int = CHUNK_SIZE, executor: Optional[Executor] = None) -> Dict:
+    """
+    Backs up the tree at root into the store.
+
+    Files whose size and mtime match the previous backup reuse its chunk list
+    without being read, so unchanged files cost nothing.
+
+    Args:
+        previous: The previous backup's entries for this source, keyed by path.
+        executor: Thread pool to hash and compress changed files in while the
+                  walk continues. Without one files are chunked inline.
+
+    Returns:
+        {"entries": manifest entries, "stats": counters for the summary}
+    """
+    previous = previous or {}
+    previous_chunks = {}
+    entries = []
+    pending = []
+    stats = {"files": 0, "bytes": 0, "reused_files": 0, "read_bytes": 0, "new_bytes": 0, "skipped": 0}
+
+    for relative, st in iter_tree(root):
+        entry = {
+            "path": relative,
+            "mode": stat.S_IMODE(st.st_mode),
+            "uid": st.st_uid,
+            "gid": st.st_gid,
+            "mtime_ns": st.st_mtime_ns,
+        }
+        full_path = os.path.join(root, relative)
+
+        if stat.S_ISDIR(st.st_mode):
+            entry["type"] = DIR
+        elif stat.S_ISLNK(st.st_mode):
+            entry["type"] = SYMLINK
+            entry["target"] = os.readlink(full_path)
+        elif stat.S_ISREG(st.st_mode):
+            entry["type"] = FILE
+            entry["size"] = st.st_size
+            stats["files"] += 1
+            stats["bytes"] += st.st_size
+
+            old = previous.get(relative)
+            if (old is not None and old.get("type") == FILE and old["size"] == st.st_size
+                    and old["mtime_ns"] == st.st_mtime_ns and all(store.has(d) for d in old["chunks"])):
+                entry["sha256"], entry["chunks"] = old["sha256"], old["chunks"]
+                previous_chunks.update({d: None for d in old["chunks"]})
+                stats["reused_files"] += 1
+            elif executor is not None:
+                pending.append((entry, executor.submit(chunk_file, full_path, store, chunk_size, manifest.chunks)))
+            else:
+                pending.append((entry, chunk_file(full_path, store, chunk_size, manifest.chunks)))
+        else:
+            #sockets, fifos and devices are recreated by the services that use them
+            stats["skipped"] += 1
+            continue
+
+        entries.append(entry)
+
+    for entry, result in pending:
+        if isinstance(result, Future):
+            result = result.result()
+        entry["sha256"], entry["chunks"], read_bytes, new_bytes = result
+        stats["read_bytes"] += read_bytes
+        stats["new_bytes"] += new_bytes
+
+    #reused chunks keep the stored size recorded when they were written
+    for digest in previous_chunks:
+        if digest not in manifest.chunks:
+            manifest.chunks[digest] = store.stored_size(digest)
+
+    return {"entries": entries, "stats": stats}
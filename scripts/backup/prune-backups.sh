@@ -0,0 +1,24 @@
+#!/bin/bash
+# Run by lme-backup-retention.service. Prunes backups with the retention settings
+# from the environment, and passes the elastic password from the LME vault so the
+# Elasticsearch snapshots of pruned snapshot-mode backups are deleted too.
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+export ANSIBLE_VAULT_PASSWORD_FILE="${ANSIBLE_VAULT_PASSWORD_FILE:-/etc/lme/pass.sh}"
+
+if [ -z "$ES_PASSWORD" ]; then
+    ELASTIC_SECRET_ID=$(podman secret inspect elastic --format '{{.ID}}' 2>/dev/null)
+    if [ -n "$ELASTIC_SECRET_ID" ] && [ -f "/etc/lme/vault/$ELASTIC_SECRET_ID" ]; then
+        ES_PASSWORD=$(ansible-vault view "/etc/lme/vault/$ELASTIC_SECRET_ID" 2>/dev/null) && export ES_PASSWORD
+    fi
+    if [ -z "$ES_PASSWORD" ]; then
+        echo "Could not read the elastic password, snapshots of pruned backups are deleted by a later run"
+    fi
+fi
+
+exec python3 "$SCRIPT_DIR/lme-backup.py" prune \
+    --keep-last "${LME_BACKUP_KEEP_LAST:-3}" \
+    --keep-daily "${LME_BACKUP_KEEP_DAILY:-7}" \
+    --keep-weekly "${LME_BACKUP_KEEP_WEEKLY:-4}" \
+    --max-bytes "${LME_BACKUP_MAX_BYTES:-0}" \
+    --min-free "${LME_BACKUP_MIN_FREE:-15}"
@@ -0,0 +1,185 @@
+import os
+import stat
+import errno
+import fcntl
+import shutil
+import struct
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from chunkstore import ChunkStore, RAW
+from manifest import FILE, DIR, SYMLINK, iter_tree
+
+#linux/fs.h: _IOW(0x94, 13, struct file_clone_range)
+FICLONERANGE = 0x4020940d
+#filesystems without reflinks (ext4), or chunk store and target on different filesystems
+NO_REFLINK_ERRORS = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS)
+
+class ChunkWriter():
+    """
+    Writes files from chunks. Uncompressed chunks are cloned into the file
+    (FICLONERANGE) on filesystems with reflinks, such as XFS and btrfs, so
+    their data is shared with the chunk store instead of copied. Writing to a
+    restored file later only unshares the blocks it touches.
+
+    Hardlinks into the chunk store are never used: services write to their
+    files and that would change the backup.
+    """
+    def __init__(self, store: ChunkStore, reflink: bool = True):
+        self.store = store
+        self.reflink = reflink
+
+    def clone(self, fd: int, digest: str, offset: int) -> Optional[int]:
+        path = self.store.path(digest, RAW)
+        try:
+            src = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            #compressed chunk
+            return None
+        try:
+            length = os.fstat(src).st_size
+            fcntl.ioctl(fd, FICLONERANGE, struct.pack("qQQQ", src, 0, length, offset))
+            return length
+        except OSError as e:
+            if e.errno not in NO_REFLINK_ERRORS:
+                raise
+            self.reflink = False
+            return None
+        finally:
+            os.close(src)
+
+    def write(self, path: str, entry: Dict) -> int:
+        """Writes the file of entry to path, returns the bytes cloned rather than copied."""
+        tmp_path = f"{path}.lme-restore"
+        cloned = offset = 0
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            for digest in entry["chunks"]:
+                length = self.clone(fd, digest, offset) if self.reflink else None
+                if length is not None:
+                    cloned += length
+                else:
+                    data = self.store.get(digest)
+                    length = len(data)
+                    view = memoryview(data)
+                    while view:
+                        written = os.pwrite(fd, view, offset + len(data) - len(view))
+                        view = view[written:]
+                offset += length
+            os.ftruncate(fd, offset)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+        return cloned
+
+def apply_metadata(path: str, entry: Dict):
+    if entry["type"] == SYMLINK:
+        os.lchown(path, entry["uid"], entry["gid"])
+        return
+    os.chown(path, entry["uid"], entry["gid"])
+    os.chmod(path, entry["mode"])
+    os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+def file_sha256(path: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        while True:
+            data = fp.read(1024 * 1024)
+            if not data:
+                break
+            file_hash.update(data)
+    return file_hash.hexdigest()
+
+def live_type(st: os.stat_result) -> Optional[str]:
+    if stat.S_ISDIR(st.st_mode):
+        return DIR
+    if stat.S_ISLNK(st.st_mode):
+        return SYMLINK
+    if stat.S_ISREG(st.st_mode):
+        return FILE
+    return None
+
+def file_unchanged(path: str, st: os.stat_result, entry: Dict, checksum: bool) -> bool:
+    if st.st_size != entry["size"]:
+        return False
+    if checksum:
+        return file_sha256(path) == entry["sha256"]
+    return st.st_mtime_ns == entry["mtime_ns"]
+
+def metadata_differs(st: os.stat_result, entry: Dict) -> bool:
+    return (stat.S_IMODE(st.st_mode) != entry["mode"] or st.st_uid != entry["uid"]
+            or st.st_gid != entry["gid"] or st.st_mtime_ns != entry["mtime_ns"])
+
+def remove(path: str, st: os.stat_result):
+    if stat.S_ISDIR(st.st_mode):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+def restore_source(entries: List[Dict], target: Path, store: ChunkStore, workers: int = 1,
+                   checksum: bool = False, reflink: bool = True) -> Dict[str, int]:
+    """
+    Makes the tree under target match a backup's manifest entries.
+
+    Only files that differ from the backup are written, concurrently. Files
+    are compared by size and mtime, or by sha256 with checksum. Anything under
+    target that is not in the backup is removed.
+    """
+    stats = {"files": 0, "bytes": 0, "unchanged": 0, "removed": 0, "cloned_bytes": 0}
+    target.mkdir(parents=True, exist_ok=True)
+
+    wanted = {entry["path"]: entry for entry in entries}
+    live = dict(iter_tree(str(target)))
+
+    #extra files and type changes first, so nothing is in the way of the restore
+    for relative in sorted(live, reverse=True):
+        if relative == ".":
+            continue
+        entry = wanted.get(relative)
+        st = live[relative]
+        if entry is None or entry["type"] != live_type(st):
+            full_path = os.path.join(target, relative)
+            if os.path.lexists(full_path):
+                remove(full_path, st)
+                stats["removed"] += 1
+            del live[relative]
+
+    writer = ChunkWriter(store, reflink)
+    with ThreadPoolExecutor(workers) as pool:
+        futures = []
+        for entry in entries:
+            path = os.path.normpath(os.path.join(target, entry["path"]))
+            st = live.get(entry["path"])
+            if entry["type"] == DIR:
+                if st is None:
+                    os.makedirs(path, exist_ok=True)
+            elif entry["type"] == SYMLINK:
+                if st is None or os.readlink(path) != entry["target"]:
+                    if st is not None:
+                        os.unlink(path)
+                    os.symlink(entry["target"], path)
+                    apply_metadata(path, entry)
+                elif st.st_uid != entry["uid"] or st.st_gid != entry["gid"]:
+                    apply_metadata(path, entry)
+            elif entry["type"] == FILE:
+                if st is not None and file_unchanged(path, st, entry, checksum):
+                    stats["unchanged"] += 1
+                    if metadata_differs(st, entry):
+                        apply_metadata(path, entry)
+                    continue
+                futures.append((path, entry, pool.submit(writer.write, path, entry)))
+
+        for path, entry, future in futures:
+            stats["cloned_bytes"] += future.result()
+            apply_metadata(path, entry)
+            stats["files"] += 1
+            stats["bytes"] += entry["size"]
+
+    #directory mtimes change while their contents are written, so set them last, deepest first
+    for entry in reversed(entries):
+        if entry["type"] == DIR:
+            apply_metadata(os.path.normpath(os.path.join(target, entry["path"])), entry)
+
+    return stats
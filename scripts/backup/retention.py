@@ -0,0 +1,146 @@
+import os
+import shutil
+import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Set
+
+from chunkstore import ChunkStore
+from manifest import Manifest, has_manifest, list_backups
+
+class BackupUsage(NamedTuple):
+    path: Path
+    name: str
+    created: datetime.datetime
+    chunks: Dict[str, int]
+    files: int
+    #bytes of chunks no other backup uses, freed when this backup is pruned
+    unique_bytes: int
+    shared_bytes: int
+
+class RetentionPolicy(NamedTuple):
+    keep_last: int = 0
+    keep_daily: int = 0
+    keep_weekly: int = 0
+    #0 means no limit
+    max_bytes: int = 0
+    #free space (percent of the filesystem) to reach by pruning, 0 to disable
+    min_free_percent: float = 0
+
+def repository_usage(repo: Path) -> List[BackupUsage]:
+    """
+    Space used by each backup, oldest first, from the chunk lists in the
+    manifests. The backup trees and the chunk store are not walked.
+    """
+    manifests = [(path, Manifest.load(path)) for path in list_backups(repo)]
+    users: Dict[str, int] = {}
+    for _, manifest in manifests:
+        for digest in manifest.chunks:
+            users[digest] = users.get(digest, 0) + 1
+
+    usage = []
+    for path, manifest in manifests:
+        unique = sum(size for digest, size in manifest.chunks.items() if users[digest] == 1)
+        usage.append(BackupUsage(
+            path=path,
+            name=manifest.name,
+            created=datetime.datetime.strptime(manifest.data["created"], "%Y-%m-%dT%H:%M:%SZ"),
+            chunks=manifest.chunks,
+            files=sum(source["stats"].get("files", 0) for source in manifest.sources.values()),
+            unique_bytes=unique,
+            shared_bytes=sum(manifest.chunks.values()) - unique,
+        ))
+    return usage
+
+def legacy_backups(repo: Path) -> List[Path]:
+    """Backups made by older LME versions, full copies without a manifest. Pruning leaves them alone."""
+    return sorted(p for p in Path(repo).iterdir()
+                  if p.is_dir() and not p.name.startswith(".") and not has_manifest(p))
+
+def stored_bytes(backups: List[BackupUsage]) -> int:
+    """Chunk store bytes needed by a set of backups, counting shared chunks once."""
+    chunks: Dict[str, int] = {}
+    for backup in backups:
+        chunks.update(backup.chunks)
+    return sum(chunks.values())
+
+def newest_per_period(backups: List[BackupUsage], count: int, period) -> Set[str]:
+    keep = []
+    seen = set()
+    for backup in reversed(backups):
+        key = period(backup.created)
+        if key not in seen:
+            seen.add(key)
+            keep.append(backup.name)
+        if len(keep) >= count:
+            break
+    return set(keep)
+
+def select_backups(backups: List[BackupUsage], policy: RetentionPolicy, free_bytes: int = 0, fs_bytes: int = 0) -> List[BackupUsage]:
+    """
+    Backups to prune, oldest first. The newest backup is always kept.
+
+    A backup is kept if any of keep_last, keep_daily or keep_weekly selects it,
+    or, when none of them is set, every backup starts out kept. Kept backups
+    are then dropped oldest first while the chunks they need exceed
+    max_bytes, or while pruning has not freed enough to leave
+    min_free_percent of the filesystem free.
+    """
+    if not backups:
+        return []
+
+    if not (policy.keep_last or policy.keep_daily or policy.keep_weekly):
+        keep = {b.name for b in backups}
+    elif policy.keep_last:
+        keep = {b.name for b in backups[-policy.keep_last:]}
+    else:
+        keep = set()
+    if policy.keep_daily:
+        keep |= newest_per_period(backups, policy.keep_daily, lambda d: d.date())
+    if policy.keep_weekly:
+        keep |= newest_per_period(backups, policy.keep_weekly, lambda d: d.isocalendar()[:2])
+    keep.add(backups[-1].name)
+
+    kept = [b for b in backups if b.name in keep]
+    total = stored_bytes(backups)
+    needed_free = fs_bytes * policy.min_free_percent / 100
+
+    while len(kept) > 1:
+        kept_bytes = stored_bytes(kept)
+        over_limit = policy.max_bytes and kept_bytes > policy.max_bytes
+        #pruning frees whatever the kept backups do not need
+        short_of_space = needed_free and free_bytes + (total - kept_bytes) < needed_free
+        if not (over_limit or short_of_space):
+            break
+        kept.pop(0)
+
+    kept_names = {b.name for b in kept}
+    return [b for b in backups if b.name not in kept_names]
+
+def collect_garbage(repo: Path, store: ChunkStore) -> Dict[str, int]:
+    """
+    Deletes chunks that no remaining manifest references, and temporary files
+    left by interrupted backups. Must run under the repository lock.
+    """
+    referenced = set()
+    for path in list_backups(repo):
+        referenced.update(Manifest.load(path).chunks)
+
+    stats = {"chunks": 0, "bytes": 0}
+    if not store.root.is_dir():
+        return stats
+    for prefix in os.scandir(store.root):
+        if not prefix.is_dir(follow_symlinks=False):
+            continue
+        for entry in os.scandir(prefix.path):
+            digest = entry.name.split(".", 1)[0]
+            if entry.name.startswith(".tmp-") or digest not in referenced:
+                stats["bytes"] += entry.stat(follow_symlinks=False).st_size
+                os.unlink(entry.path)
+                stats["chunks"] += 1
+    return stats
+
+def prune_backups(repo: Path, store: ChunkStore, backups: List[BackupUsage]) -> Dict[str, int]:
+    """Removes backups, then their chunks that no other backup uses."""
+    for backup in backups:
+        shutil.rmtree(backup.path)
+    return collect_garbage(repo, store)
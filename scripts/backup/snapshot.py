@@ -0,0 +1,173 @@
+import ssl
+import json
+import time
+import struct
+import base64
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+#path.repo in config/elasticsearch.yml, backed by the lme_backups volume
+DEFAULT_REPOSITORY = "lme_backups"
+DEFAULT_LOCATION = "/usr/share/elasticsearch/backups"
+
+#SnapshotState ids in the repository's index-N file
+SNAPSHOT_STATES = {0: "IN_PROGRESS", 1: "SUCCESS", 2: "FAILED", 3: "PARTIAL", 4: "INCOMPATIBLE"}
+
+class SnapshotError(Exception):
+    pass
+
+class ElasticsearchClient():
+    def __init__(self, host: str, port: int, username: str, password: str, timeout: int = 3600):
+        self.base_url = f"https://{host}:{port}"
+        self.timeout = timeout
+        token = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.headers = {"Authorization": f"Basic {token}", "Content-Type": "application/json"}
+        #LME uses self-signed certificates
+        self.context = ssl.create_default_context()
+        self.context.check_hostname = False
+        self.context.verify_mode = ssl.CERT_NONE
+
+    def request(self, method: str, path: str, body: Dict = None, params: Dict = None):
+        url = f"{self.base_url}/{path}"
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(url, data=data, headers=self.headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout, context=self.context) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode(errors="replace")
+            raise SnapshotError(f"{method} {path} failed with status {e.code}: {detail}") from e
+        except urllib.error.URLError as e:
+            raise SnapshotError(f"{method} {path} failed: {e.reason}") from e
+
+    def wait_until_ready(self, timeout: int = 600):
+        #after a restart Elasticsearch answers before the cluster is usable
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.request("GET", "_cluster/health", params={"wait_for_status": "yellow", "timeout": "30s"})
+                return
+            except SnapshotError as e:
+                if time.monotonic() > deadline:
+                    raise SnapshotError(f"Elasticsearch not ready after {timeout}s: {e}") from e
+                time.sleep(5)
+
+def register_repository(client: ElasticsearchClient, repository: str = DEFAULT_REPOSITORY, location: str = DEFAULT_LOCATION):
+    #idempotent, registering an existing repository with the same settings is a no-op
+    client.request("PUT", f"_snapshot/{repository}", {
+        "type": "fs",
+        "settings": {"location": location, "compress": True},
+    })
+
+def create_snapshot(client: ElasticsearchClient, name: str, repository: str = DEFAULT_REPOSITORY) -> Dict:
+    """
+    Snapshots every index and data stream plus the cluster state while the
+    stack keeps running. Snapshots are incremental: segments already in the
+    repository from earlier snapshots are not copied again.
+    """
+    response = client.request("PUT", f"_snapshot/{repository}/{urllib.parse.quote(name)}", {
+        "indices": "*",
+        "ignore_unavailable": True,
+        "include_global_state": True,
+    }, params={"wait_for_completion": "true"})
+
+    snapshot = response["snapshot"]
+    if snapshot["state"] == "PARTIAL":
+        #shards are missing, a rollback to it would lose their data. Nothing refers to it, so drop it
+        shards = snapshot.get("shards", {})
+        delete_snapshot(client, name, repository)
+        raise SnapshotError(f"Snapshot {name} was PARTIAL, {shards.get('failed', 0)} of {shards.get('total', 0)} "
+                            f"shards failed, and was deleted: {snapshot.get('failures')}")
+    if snapshot["state"] != "SUCCESS":
+        raise SnapshotError(f"Snapshot {name} finished with state {snapshot['state']}: {snapshot.get('failures')}")
+    return snapshot
+
+def delete_snapshot(client: ElasticsearchClient, name: str, repository: str = DEFAULT_REPOSITORY):
+    client.request("DELETE", f"_snapshot/{repository}/{urllib.parse.quote(name)}")
+
+def get_snapshot(client: ElasticsearchClient, name: str, repository: str = DEFAULT_REPOSITORY) -> Dict:
+    snapshots = client.request("GET", f"_snapshot/{repository}/{urllib.parse.quote(name)}")["snapshots"]
+    if not snapshots:
+        raise SnapshotError(f"Snapshot {name} not found in {repository}")
+    return snapshots[0]
+
+def repository_snapshot_state(repository_path: Path, name: str) -> str:
+    """
+    State of a snapshot read from an fs repository on disk, for when
+    Elasticsearch is not running. index.latest holds the current generation
+    N as a big endian long, and index-N lists the snapshots as JSON.
+    """
+    repository_path = Path(repository_path)
+    try:
+        generation = struct.unpack(">q", (repository_path / "index.latest").read_bytes())[0]
+        data = json.loads((repository_path / f"index-{generation}").read_text())
+    except (OSError, ValueError, struct.error) as e:
+        raise SnapshotError(f"Cannot read the snapshot repository at {repository_path}: {e}") from e
+
+    for snapshot in data.get("snapshots", []):
+        if snapshot.get("name") != name:
+            continue
+        state = snapshot.get("state")
+        state = SNAPSHOT_STATES.get(state, state) if isinstance(state, int) else state
+        if not (repository_path / f"snap-{snapshot.get('uuid')}.dat").exists():
+            raise SnapshotError(f"Snapshot {name} is listed in {repository_path} but its metadata file is missing")
+        return state
+    raise SnapshotError(f"Snapshot {name} not found in {repository_path}")
+
+def existing_indices(client: ElasticsearchClient) -> List[str]:
+    rows = client.request("GET", "_cat/indices", params={"format": "json", "h": "index", "expand_wildcards": "all"})
+    return [row["index"] for row in rows]
+
+def existing_data_streams(client: ElasticsearchClient) -> List[str]:
+    response = client.request("GET", "_data_stream/*", params={"expand_wildcards": "all", "filter_path": "data_streams.name"})
+    return [stream["name"] for stream in response.get("data_streams", [])]
+
+def batched(names: List[str], size: int = 50) -> List[str]:
+    #explicit names are required for destructive actions, keep each URL short
+    return [",".join(urllib.parse.quote(n) for n in names[i:i + size]) for i in range(0, len(names), size)]
+
+def restore_snapshot(client: ElasticsearchClient, name: str, repository: str = DEFAULT_REPOSITORY) -> Dict:
+    """
+    Restores all indices, data streams and the cluster state of a snapshot.
+
+    Data streams in the snapshot that also exist in the cluster are deleted and
+    existing regular indices are closed, so the restore can replace them.
+    System indices are replaced by their feature states.
+    """
+    snapshot = get_snapshot(client, name, repository)
+
+    conflicting_streams = sorted(set(existing_data_streams(client)) & set(snapshot.get("data_streams", [])))
+    for names in batched(conflicting_streams):
+        client.request("DELETE", f"_data_stream/{names}", params={"expand_wildcards": "all"})
+
+    #after deleting the data streams their backing indices are gone too
+    conflicting_indices = sorted(
+        index for index in set(existing_indices(client)) & set(snapshot.get("indices", []))
+        if not index.startswith(".") or index.startswith(".ds-")
+    )
+    for names in batched(conflicting_indices):
+        client.request("POST", f"{names}/_close", params={"expand_wildcards": "all"})
+
+    response = client.request("POST", f"_snapshot/{repository}/{urllib.parse.quote(name)}/_restore", {
+        "indices": "*",
+        "include_global_state": True,
+        "include_aliases": True,
+    }, params={"wait_for_completion": "true"})
+    return response.get("snapshot", {})
+
+def snapshot_summary(snapshot: Dict, repository: str = DEFAULT_REPOSITORY) -> Dict:
+    return {
+        "repository": repository,
+        "snapshot": snapshot.get("snapshot"),
+        "state": snapshot.get("state"),
+        "indices": len(snapshot.get("indices", [])),
+        "data_streams": len(snapshot.get("data_streams", [])),
+        "start_time": snapshot.get("start_time"),
+        "end_time": snapshot.get("end_time"),
+        "shards": snapshot.get("shards"),
+    }
@@ -0,0 +1,141 @@
+import os
+import json
+import mmap
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from chunkstore import ChunkStore
+from manifest import RESTORABLE_STATUSES, Manifest, FILE
+
+#kept in the chunk store: digest -> [stored size, mtime_ns, content size] of
+#every chunk that hashed correctly. Chunks are never rewritten in place, so a
+#chunk file with the same size and mtime does not need to be read again
+VERIFIED_CACHE = "verified.json"
+
+OK = "ok"
+MISSING = "missing"
+CORRUPT = "corrupt"
+
+class VerifiedCache():
+    def __init__(self, store: ChunkStore):
+        self.path = store.root / VERIFIED_CACHE
+        self.chunks: Dict[str, List[int]] = {}
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as fp:
+                self.chunks = json.load(fp)
+        except (FileNotFoundError, ValueError):
+            self.chunks = {}
+
+    def save(self):
+        #verifies run concurrently under the shared lock, each writes its own temporary file
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=".tmp-verified-")
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(self.chunks, fp)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+def hash_chunk(store: ChunkStore, path: Path, size: int) -> Tuple[str, int]:
+    """sha256 and content size of a chunk file, read through mmap."""
+    with open(path, 'rb') as fp:
+        if size == 0:
+            data = store.decode(path, b"")
+            return hashlib.sha256(data).hexdigest(), len(data)
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = store.decode(path, mapped)
+            digest = hashlib.sha256(data).hexdigest()
+            size = len(data)
+            #raw chunks hash the mapping itself, drop the view before closing it
+            del data
+            return digest, size
+
+def verify_chunk(store: ChunkStore, digest: str, cached: Optional[List[int]]) -> Tuple[str, str, Optional[List[int]], bool]:
+    """
+    Returns:
+        (digest, OK/MISSING/CORRUPT, [stored size, mtime_ns, content size] when OK, whether it was read)
+    """
+    path = store.find(digest)
+    if path is None:
+        return digest, MISSING, None, False
+    st = path.stat()
+    if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return digest, OK, cached, False
+    try:
+        actual, content_size = hash_chunk(store, path, st.st_size)
+    except RuntimeError:
+        raise
+    except Exception:
+        #truncated or garbled compressed data
+        return digest, CORRUPT, None, True
+    if actual != digest:
+        return digest, CORRUPT, None, True
+    return digest, OK, [st.st_size, st.st_mtime_ns, content_size], True
+
+def verify_backup(backup_dir: Path, store: ChunkStore, workers: int, use_cache: bool = True,
+                  required_sources: Iterable[str] = ()) -> Dict:
+    """
+    Checks that every source was backed up (and that required_sources are in
+    the backup), that every chunk a backup references is present and hashes
+    to its digest, and that the chunks of every file add up to its recorded size.
+
+    Returns:
+        A report with counters and the missing or corrupt chunks and files.
+    """
+    manifest = Manifest.load(backup_dir)
+    cache = VerifiedCache(store)
+    if use_cache:
+        cache.load()
+
+    digests = set(manifest.chunks)
+    for source in manifest.sources:
+        for entry in manifest.entries(source):
+            if entry["type"] == FILE:
+                digests.update(entry["chunks"])
+
+    results = {}
+    read = 0
+    with ThreadPoolExecutor(workers) as pool:
+        for digest, status, info, was_read in pool.map(lambda d: verify_chunk(store, d, cache.chunks.get(d)), sorted(digests)):
+            results[digest] = (status, info)
+            read += was_read
+            if status == OK:
+                cache.chunks[digest] = info
+            else:
+                cache.chunks.pop(digest, None)
+
+    bad_files = []
+    files = 0
+    for source in manifest.sources:
+        for entry in manifest.entries(source):
+            if entry["type"] != FILE:
+                continue
+            files += 1
+            statuses = [results[d][0] for d in entry["chunks"]]
+            if any(s != OK for s in statuses):
+                bad_files.append(f"{source}/{entry['path']}")
+            elif sum(results[d][1][2] for d in entry["chunks"]) != entry["size"]:
+                bad_files.append(f"{source}/{entry['path']}")
+
+    cache.save()
+
+    failed_sources = [f"{source}: {data['status']}" for source, data in manifest.sources.items()
+                      if data["status"] not in RESTORABLE_STATUSES]
+    failed_sources += [f"{source}: MISSING" for source in required_sources if source not in manifest.sources]
+
+    return {
+        "backup": manifest.name,
+        "failed_sources": failed_sources,
+        "files": files,
+        "chunks": len(digests),
+        "read_chunks": read,
+        "missing_chunks": sorted(d for d, (s, _) in results.items() if s == MISSING),
+        "corrupt_chunks": sorted(d for d, (s, _) in results.items() if s == CORRUPT),
+        "bad_files": bad_files,
+    }
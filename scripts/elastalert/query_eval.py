@@ -0,0 +1,259 @@
+"""
+In-memory evaluation of the Elasticsearch query DSL that ElastAlert rule
+filters use, so rules can be replayed without a cluster. Covers bool, term,
+terms, match, match_phrase, wildcard, prefix, exists, range (with now date
+math) and query_string with field:value terms, wildcards, AND/OR/NOT and
+parentheses. Anything else raises UnsupportedQuery; replay those rules
+against Elasticsearch instead.
+
+Matching follows keyword fields, which is how the alert indices map
+strings: values compare exactly, query_string wildcards are case sensitive.
+"""
+import datetime
+import fnmatch
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+MISSING = object()
+
+
+class UnsupportedQuery(Exception):
+    pass
+
+
+def parse_time(value: str) -> datetime.datetime:
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def resolve_date(value: Any, now: datetime.datetime) -> datetime.datetime:
+    """now, now-5m, now-1h+30m or an ISO timestamp."""
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value / 1000, datetime.timezone.utc)
+    if not value.startswith("now"):
+        return parse_time(value)
+    result = now
+    for sign, amount, unit in re.findall(r"([+-])(\d+)([smhdw])", value[3:]):
+        delta = datetime.timedelta(**{UNITS[unit]: int(amount)})
+        result = result + delta if sign == "+" else result - delta
+    if "/" in value:
+        raise UnsupportedQuery(f"date rounding in {value}")
+    return result
+
+
+def get_field(doc: Dict, field: str) -> Any:
+    """
+    Value of a dotted field, for sources with nested objects, flat dotted
+    keys (as Kibana writes alerts) or a mix of both.
+    """
+    if field in doc:
+        return doc[field]
+    parts = field.split(".")
+    for i in range(len(parts) - 1, 0, -1):
+        head = ".".join(parts[:i])
+        if isinstance(doc.get(head), dict):
+            value = get_field(doc[head], ".".join(parts[i:]))
+            if value is not MISSING:
+                return value
+    return MISSING
+
+
+def values(doc: Dict, field: str) -> List[Any]:
+    value = get_field(doc, field)
+    if value is MISSING or value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def term_value(spec: Any) -> Any:
+    return spec.get("value", spec.get("query")) if isinstance(spec, dict) else spec
+
+
+def equals(actual: Any, expected: Any) -> bool:
+    return actual == expected or str(actual) == str(expected)
+
+
+def compile_range(field: str, spec: Dict, now: datetime.datetime) -> Callable[[Dict], bool]:
+    bounds = []
+    for op in ("gt", "gte", "lt", "lte"):
+        if op in spec:
+            bound = spec[op]
+            if isinstance(bound, str) and not re.fullmatch(r"-?\d+(\.\d+)?", bound):
+                bound = resolve_date(bound, now)
+            bounds.append((op, bound))
+
+    def compare(value: Any, op: str, bound: Any) -> bool:
+        if isinstance(bound, datetime.datetime):
+            value = resolve_date(value, now)
+        else:
+            value, bound = float(value), float(bound)
+        return {"gt": value > bound, "gte": value >= bound, "lt": value < bound, "lte": value <= bound}[op]
+
+    return lambda doc: any(all(compare(v, op, b) for op, b in bounds) for v in values(doc, field))
+
+
+def single(clause: Dict) -> tuple:
+    """The field and spec of a {"term": {"field": spec}} style clause."""
+    fields = [(k, v) for k, v in clause.items() if k not in ("boost", "_name")]
+    if len(fields) != 1:
+        raise UnsupportedQuery(f"expected one field in {clause}")
+    return fields[0]
+
+
+def compile_query(query: Dict, now: datetime.datetime) -> Callable[[Dict], bool]:
+    """Compiles a query DSL clause to a predicate over document sources."""
+    if len(query) != 1:
+        raise UnsupportedQuery(f"expected one clause in {query}")
+    kind, body = next(iter(query.items()))
+
+    if kind == "match_all":
+        return lambda doc: True
+    if kind == "bool":
+        return compile_bool(body, now)
+    if kind == "query":
+        # ElastAlert accepts filters wrapped in {"query": {...}}
+        return compile_query(body, now)
+    if kind == "constant_score":
+        return compile_query(body["filter"], now)
+    if kind in ("term", "match", "match_phrase"):
+        field, spec = single(body)
+        expected = term_value(spec)
+        return lambda doc: any(equals(v, expected) for v in values(doc, field))
+    if kind == "terms":
+        field, spec = single(body)
+        return lambda doc: any(equals(v, e) for v in values(doc, field) for e in spec)
+    if kind in ("wildcard", "prefix"):
+        field, spec = single(body)
+        pattern = term_value(spec) + ("*" if kind == "prefix" else "")
+        return lambda doc: any(fnmatch.fnmatchcase(str(v), pattern) for v in values(doc, field))
+    if kind == "exists":
+        return lambda doc: bool(values(doc, body["field"]))
+    if kind == "range":
+        field, spec = single(body)
+        return compile_range(field, spec, now)
+    if kind == "query_string":
+        return QueryStringParser(body["query"], body.get("default_field"), body.get("default_operator", "OR")).parse()
+    raise UnsupportedQuery(f"{kind} queries")
+
+
+def compile_clauses(clauses: Any, now: datetime.datetime) -> List[Callable[[Dict], bool]]:
+    if isinstance(clauses, dict):
+        clauses = [clauses]
+    return [compile_query(clause, now) for clause in clauses or []]
+
+
+def compile_bool(body: Dict, now: datetime.datetime) -> Callable[[Dict], bool]:
+    must = compile_clauses(body.get("must"), now) + compile_clauses(body.get("filter"), now)
+    must_not = compile_clauses(body.get("must_not"), now)
+    should = compile_clauses(body.get("should"), now)
+    minimum = int(body.get("minimum_should_match", 0 if must else 1)) if should else 0
+
+    def predicate(doc: Dict) -> bool:
+        return (all(p(doc) for p in must)
+                and not any(p(doc) for p in must_not)
+                and sum(1 for p in should if p(doc)) >= minimum)
+    return predicate
+
+
+class QueryStringParser:
+    """Recursive descent parser for the Lucene syntax used in rule filters."""
+    TOKEN = re.compile(r'\s*(\(|\)|"(?:[^"\\]|\\.)*"|(?:[^\s()"\\]|\\.)+)')
+
+    def __init__(self, query: str, default_field: Optional[str] = None, default_operator: str = "OR"):
+        self.query = query
+        self.default_field = default_field
+        # Terms without an operator between them are ORed unless default_operator is AND
+        self.default_and = default_operator.upper() == "AND"
+        self.tokens = self.TOKEN.findall(query)
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def next(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise UnsupportedQuery(f"unexpected end of query_string {self.query!r}")
+        self.position += 1
+        return token
+
+    def parse(self) -> Callable[[Dict], bool]:
+        predicate = self.parse_or()
+        if self.peek() is not None:
+            raise UnsupportedQuery(f"unexpected {self.peek()!r} in query_string {self.query!r}")
+        return predicate
+
+    def implicit(self) -> bool:
+        """Whether the next token is a term following another without an operator."""
+        return self.peek() not in (None, ")", "OR", "||", "AND", "&&")
+
+    def parse_or(self) -> Callable[[Dict], bool]:
+        terms = [self.parse_and()]
+        while self.peek() in ("OR", "||") or (self.implicit() and not self.default_and):
+            if self.peek() in ("OR", "||"):
+                self.next()
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else (lambda doc: any(t(doc) for t in terms))
+
+    def parse_and(self) -> Callable[[Dict], bool]:
+        terms = [self.parse_not()]
+        while self.peek() in ("AND", "&&") or (self.implicit() and self.default_and):
+            if self.peek() in ("AND", "&&"):
+                self.next()
+            terms.append(self.parse_not())
+        return terms[0] if len(terms) == 1 else (lambda doc: all(t(doc) for t in terms))
+
+    def parse_not(self) -> Callable[[Dict], bool]:
+        if self.peek() in ("NOT", "!"):
+            self.next()
+            inner = self.parse_not()
+            return lambda doc: not inner(doc)
+        return self.parse_term()
+
+    def parse_term(self) -> Callable[[Dict], bool]:
+        token = self.next()
+        if token == "(":
+            inner = self.parse_or()
+            if self.next() != ")":
+                raise UnsupportedQuery(f"unbalanced parentheses in query_string {self.query!r}")
+            return inner
+        match = re.match(r"((?:[^:\\]|\\.)+):(.*)$", token)
+        field, value = (match.group(1), match.group(2)) if match else (None, token)
+        if field is not None and not value and self.peek() is not None:
+            # field:"quoted value" and field:(a OR b) arrive as separate tokens
+            if self.peek() == "(":
+                self.next()
+                return QueryStringParser(self.group_text(), field, "AND" if self.default_and else "OR").parse()
+            value = self.next()
+        field = (field or self.default_field or "").replace("\\", "")
+        if not field:
+            raise UnsupportedQuery(f"query_string terms without a field in {self.query!r}")
+        return self.field_predicate(field, value)
+
+    def group_text(self) -> str:
+        depth, parts = 1, []
+        while True:
+            token = self.next()
+            depth += {"(": 1, ")": -1}.get(token, 0)
+            if depth == 0:
+                return " ".join(parts)
+            parts.append(token)
+
+    def field_predicate(self, field: str, value: str) -> Callable[[Dict], bool]:
+        if field == "_exists_":
+            return lambda doc: bool(values(doc, value))
+        if value == "*":
+            return lambda doc: bool(values(doc, field))
+        if value.startswith('"'):
+            expected = re.sub(r"\\(.)", r"\1", value[1:-1])
+            return lambda doc: any(str(v) == expected for v in values(doc, field))
+        if value.startswith(("[", "{")):
+            raise UnsupportedQuery(f"ranges in query_string {self.query!r}")
+        if "*" in value or "?" in value:
+            # Escaped wildcards are literals
+            pattern = re.sub(r"\\([*?])", r"[\1]", value)
+            pattern = re.sub(r"\\(.)", r"\1", pattern)
+            return lambda doc: any(fnmatch.fnmatchcase(str(v), pattern) for v in values(doc, field))
+        expected = re.sub(r"\\(.)", r"\1", value)
+        return lambda doc: any(equals(v, expected) for v in values(doc, field))
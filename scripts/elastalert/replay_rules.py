@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+Replays a stored corpus of alerts through the ElastAlert rule set on a
+simulated clock, so rule windows, realert and aggregation settings can be
+measured instead of guessed.
+
+The clock starts at the first document and advances by run_every; each step
+runs every rule the way ElastAlert does: the query window reaches back
+buffer_time (or to the previous run), "now" in rule filters is the simulated
+time, hits seen in earlier runs are not matched again, realert silences the
+rule and aggregation holds matches back before they are alerted. No time is
+waited for, so days of alerts replay in seconds.
+
+Queries run in memory (query_eval.py) or, with --backend elasticsearch,
+against a local Elasticsearch the corpus is loaded into. For each rule the
+report has the query count and latency, hits, matches, silenced matches,
+alerts sent and how long matched documents waited for their alert.
+
+A corpus can be captured from the alert indices with the capture command.
+"""
+import argparse
+import bisect
+import copy
+import datetime
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+import yaml
+from urllib3.exceptions import InsecureRequestWarning
+
+from query_eval import UnsupportedQuery, compile_query, get_field, parse_time
+
+# Suppress the InsecureRequestWarning (We are using a self-signed cert)
+requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config", "elastalert2")
+ALERTS_INDEX = ".alerts-security.alerts-*"
+REPLAY_INDEX = "elastalert-replay"
+RETRY_STATUS = (429, 502, 503, 504)
+# ElastAlert defaults for settings rules may leave out
+DEFAULT_REALERT = {"minutes": 1}
+DEFAULT_MAX_QUERY_SIZE = 10000
+
+
+class Elasticsearch:
+    def __init__(self, host: str, port: int, user: str, password: str, protocol: str = "https"):
+        self.root_url = f"{protocol}://{host}:{port}"
+        self.session = requests.Session()
+        self.session.auth = (user, password)
+        self.session.headers["Content-Type"] = "application/json"
+
+    def json(self, method: str, path: str, retries: int = 5, **kwargs) -> Dict:
+        """Sends a request, retrying 429, 5xx gateway and connection errors with backoff."""
+        # Passed per request, a session level verify=False loses to REQUESTS_CA_BUNDLE
+        kwargs.setdefault("verify", False)
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.request(method, f"{self.root_url}/{path}", timeout=300, **kwargs)
+                if response.status_code not in RETRY_STATUS or attempt == retries:
+                    break
+            except requests.exceptions.SSLError:
+                raise
+            except requests.ConnectionError:
+                if attempt == retries:
+                    raise
+            time.sleep(min(30, 2 ** attempt) * random.uniform(0.5, 1.0))
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} failed with status {response.status_code}: {response.text[:500]}")
+        return response.json()
+
+
+def duration(value: Any) -> datetime.timedelta:
+    """ElastAlert durations are timedelta arguments, e.g. {"minutes": 5}."""
+    return datetime.timedelta(**value) if value else datetime.timedelta(0)
+
+
+def format_time(value: datetime.datetime) -> str:
+    return value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def set_path(data: Dict, path: str, value: Any):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        data = data.setdefault(key, {})
+    data[keys[-1]] = value
+
+
+def load_rules(rules_dir: str, config: Dict, names: List[str], overrides: List[str]) -> List[Dict]:
+    """
+    Rule files as ElastAlert loads them: *.yml and *.yaml under the rules
+    folder, with their import file merged underneath and the global
+    settings as defaults. Overrides are dotted KEY=YAML pairs.
+    """
+    rules = []
+    for root, _, files in os.walk(rules_dir):
+        for name in sorted(files):
+            if not name.endswith((".yml", ".yaml")):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'r') as fp:
+                rule = yaml.safe_load(fp) or {}
+            if "import" in rule:
+                with open(os.path.join(os.path.dirname(path), rule["import"]), 'r') as fp:
+                    rule = dict(yaml.safe_load(fp) or {}, **rule)
+            if not rule.get("is_enabled", True) or (names and rule.get("name") not in names):
+                continue
+            for key in ("run_every", "buffer_time", "max_query_size", "timestamp_field"):
+                if key in config:
+                    rule.setdefault(key, config[key])
+            for override in overrides:
+                key, _, value = override.partition("=")
+                set_path(rule, key, yaml.safe_load(value))
+            rule["file"] = os.path.relpath(path, rules_dir)
+            rules.append(rule)
+    return rules
+
+
+def iter_corpus(paths: List[str]) -> Iterator[Dict]:
+    """Search hits ({"_id", "_source"}) or plain documents, in NDJSON files that may be gzipped."""
+    count = 0
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, 'rt') as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                doc = json.loads(line)
+                count += 1
+                if "_source" in doc:
+                    yield {"_id": doc.get("_id", str(count)), "_source": doc["_source"]}
+                else:
+                    yield {"_id": str(count), "_source": doc}
+
+
+def replace_now(query: Any, now: str) -> Any:
+    """Anchors date math in range clauses to the simulated time (now-5m -> <now>||-5m)."""
+    if isinstance(query, dict):
+        return {
+            key: ({field: {op: f"{now}||{b[3:]}" if isinstance(b, str) and b.startswith("now") else b
+                           for op, b in spec.items()} if isinstance(spec, dict) else spec
+                   for field, spec in value.items()} if key == "range" else replace_now(value, now))
+            for key, value in query.items()
+        }
+    if isinstance(query, list):
+        return [replace_now(item, now) for item in query]
+    return query
+
+
+class MemoryBackend:
+    """Evaluates rule filters against the corpus in memory, docs sorted by timestamp."""
+    name = "memory"
+
+    def __init__(self, docs: List[Dict], timestamp_field: str):
+        self.timestamp_field = timestamp_field
+        self.docs = sorted(
+            ((parse_time(get_field(d["_source"], timestamp_field)), d) for d in docs),
+            key=lambda item: item[0],
+        )
+        self.times = [t for t, _ in self.docs]
+
+    def span(self) -> Tuple[datetime.datetime, datetime.datetime]:
+        return self.times[0], self.times[-1]
+
+    def search(self, rule: Dict, start: datetime.datetime, end: datetime.datetime,
+               now: datetime.datetime) -> Tuple[List[Dict], int, float]:
+        started = time.perf_counter()
+        predicates = [compile_query(f, now) for f in rule.get("filter") or []]
+        timestamp_field = rule.get("timestamp_field", self.timestamp_field)
+        lo = bisect.bisect_right(self.times, start)
+        hi = bisect.bisect_right(self.times, end)
+        hits = []
+        for doc_time, doc in self.docs[lo:hi]:
+            if timestamp_field != self.timestamp_field:
+                value = get_field(doc["_source"], timestamp_field)
+                if not isinstance(value, str) or not start < parse_time(value) <= end:
+                    continue
+            if all(p(doc["_source"]) for p in predicates):
+                hits.append(doc)
+        total = len(hits)
+        return hits[:rule.get("max_query_size", DEFAULT_MAX_QUERY_SIZE)], total, (time.perf_counter() - started) * 1000
+
+
+class ElasticsearchBackend:
+    """Loads the corpus into a replay index and runs each rule's query there."""
+    name = "elasticsearch"
+
+    def __init__(self, es: Elasticsearch, index: str, timestamp_field: str):
+        self.es = es
+        self.index = index
+        self.timestamp_field = timestamp_field
+
+    def load(self, docs: Iterator[Dict], batch: int = 2000) -> int:
+        self.es.session.delete(f"{self.es.root_url}/{self.index}", verify=False)
+        # Alert indices map strings as keywords, term and wildcard filters behave the same here
+        self.es.json("PUT", self.index, data=json.dumps({
+            "settings": {"number_of_shards": 1, "number_of_replicas": 0, "refresh_interval": -1},
+            "mappings": {
+                "dynamic_templates": [{"strings": {"match_mapping_type": "string",
+                                                   "mapping": {"type": "keyword", "ignore_above": 1024}}}],
+                "properties": {self.timestamp_field: {"type": "date"}},
+            },
+        }))
+        count = 0
+        lines: List[str] = []
+        for doc in docs:
+            lines.append(json.dumps({"index": {"_index": self.index, "_id": doc["_id"]}}))
+            lines.append(json.dumps(doc["_source"]))
+            count += 1
+            if len(lines) >= 2 * batch:
+                self.bulk(lines)
+                lines = []
+        if lines:
+            self.bulk(lines)
+        self.es.json("POST", f"{self.index}/_refresh")
+        return count
+
+    def bulk(self, lines: List[str]):
+        result = self.es.json("POST", "_bulk", params={"filter_path": "errors,items.*.error"},
+                              data="\n".join(lines) + "\n", headers={"Content-Type": "application/x-ndjson"})
+        if result.get("errors"):
+            raise RuntimeError(f"Loading the corpus failed: {json.dumps(result['items'][0])[:500]}")
+
+    def span(self) -> Tuple[datetime.datetime, datetime.datetime]:
+        result = self.es.json("POST", f"{self.index}/_search", data=json.dumps({
+            "size": 0,
+            "aggs": {"first": {"min": {"field": self.timestamp_field}},
+                     "last": {"max": {"field": self.timestamp_field}}},
+        }))
+        return tuple(parse_time(result["aggregations"][a]["value_as_string"]) for a in ("first", "last"))
+
+    def search(self, rule: Dict, start: datetime.datetime, end: datetime.datetime,
+               now: datetime.datetime) -> Tuple[List[Dict], int, float]:
+        timestamp_field = rule.get("timestamp_field", self.timestamp_field)
+        # The query ElastAlert sends: the rule filters and the run's time range, oldest first
+        body = {
+            "query": {"bool": {"filter": [
+                {"bool": {"must": replace_now(rule.get("filter") or [], format_time(now))}},
+                {"range": {timestamp_field: {"gt": format_time(start), "lte": format_time(end)}}},
+            ]}},
+            "sort": [{timestamp_field: {"order": "asc"}}],
+            "size": rule.get("max_query_size", DEFAULT_MAX_QUERY_SIZE),
+            "track_total_hits": True,
+        }
+        started = time.perf_counter()
+        result = self.es.json("POST", f"{self.index}/_search", params={"request_cache": "false"},
+                              data=json.dumps(body))
+        latency = (time.perf_counter() - started) * 1000
+        hits = [{"_id": h["_id"], "_source": h["_source"]} for h in result["hits"]["hits"]]
+        return hits, result["hits"]["total"]["value"], latency
+
+
+class RuleRunner:
+    """
+    One rule's ElastAlert state on the simulated clock: its previous end
+    time, the hits it has seen, realert silences, pending aggregations and
+    the statistics of the replay.
+    """
+    def __init__(self, rule: Dict, run_every: datetime.timedelta, buffer_time: datetime.timedelta):
+        self.rule = rule
+        self.name = rule.get("name", rule["file"])
+        self.type = rule.get("type", "any")
+        self.timestamp_field = rule.get("timestamp_field", "@timestamp")
+        self.run_every = duration(rule["run_every"]) if "run_every" in rule else run_every
+        self.buffer_time = duration(rule["buffer_time"]) if "buffer_time" in rule else buffer_time
+        self.realert = duration(rule.get("realert", DEFAULT_REALERT))
+        self.aggregation = duration(rule.get("aggregation"))
+        self.query_key = rule.get("query_key")
+        self.previous_endtime: Optional[datetime.datetime] = None
+        self.next_run: Optional[datetime.datetime] = None
+        self.seen: Dict[str, datetime.datetime] = {}
+        self.silenced: Dict[str, datetime.datetime] = {}
+        self.pending: Optional[Dict] = None
+        self.events: Dict[str, List[datetime.datetime]] = {}
+        self.latencies: List[float] = []
+        self.delays: List[float] = []
+        self.stats = {"queries": 0, "hits": 0, "truncated": 0, "new_hits": 0, "matches": 0,
+                      "silenced": 0, "alerts": 0, "alerted_matches": 0}
+        self.error: Optional[str] = None
+
+    def window(self, now: datetime.datetime) -> Tuple[datetime.datetime, datetime.datetime]:
+        # ElastAlert reaches back buffer_time, or further to the previous run if one was missed
+        start = now - self.buffer_time
+        if self.previous_endtime is not None and self.previous_endtime < start:
+            start = self.previous_endtime
+        return start, now
+
+    def key(self, doc: Dict) -> str:
+        if not self.query_key:
+            return ""
+        keys = self.query_key if isinstance(self.query_key, list) else [self.query_key]
+        return ", ".join(str(get_field(doc, k)) for k in keys)
+
+    def matches(self, hits: List[Dict]) -> List[Dict]:
+        """New hits that are matches for the rule type."""
+        if self.type == "any":
+            return hits
+        if self.type == "frequency":
+            timeframe = duration(self.rule["timeframe"])
+            matched = []
+            for hit in hits:
+                key = self.key(hit["_source"])
+                hit_time = parse_time(get_field(hit["_source"], self.timestamp_field))
+                events = [t for t in self.events.get(key, []) if t > hit_time - timeframe] + [hit_time]
+                if len(events) >= self.rule["num_events"]:
+                    matched.append(hit)
+                    events = []
+                self.events[key] = events
+            return matched
+        raise UnsupportedQuery(f"{self.type} rules")
+
+    def run(self, backend, now: datetime.datetime):
+        start, end = self.window(now)
+        hits, total, latency = backend.search(self.rule, start, end, now)
+        self.previous_endtime = end
+        self.stats["queries"] += 1
+        self.stats["hits"] += len(hits)
+        self.stats["truncated"] += total - len(hits)
+        self.latencies.append(latency)
+
+        # Windows overlap, hits already processed are dropped like ElastAlert's processed_hits
+        new = [h for h in hits if h["_id"] not in self.seen]
+        for hit in new:
+            self.seen[hit["_id"]] = end
+        self.seen = {i: t for i, t in self.seen.items() if t > end - self.buffer_time}
+        self.stats["new_hits"] += len(new)
+
+        for match in self.matches(new):
+            self.stats["matches"] += 1
+            silence = self.name + self.key(match["_source"])
+            if self.silenced.get(silence, now) > now:
+                self.stats["silenced"] += 1
+                continue
+            if self.realert:
+                self.silenced[silence] = now + self.realert
+            if not self.aggregation:
+                self.alert([match], now)
+            elif self.pending is not None and self.pending["alert_time"] > now:
+                self.pending["matches"].append(match)
+            else:
+                self.pending = {"alert_time": now + self.aggregation, "matches": [match]}
+
+    def send_pending(self, now: datetime.datetime):
+        if self.pending is not None and self.pending["alert_time"] <= now:
+            self.alert(self.pending["matches"], now)
+            self.pending = None
+
+    def alert(self, matches: List[Dict], now: datetime.datetime):
+        self.stats["alerts"] += 1
+        self.stats["alerted_matches"] += len(matches)
+        for match in matches:
+            self.delays.append((now - parse_time(get_field(match["_source"], self.timestamp_field))).total_seconds())
+
+    def report(self) -> Dict:
+        report = dict(self.rule_settings(), **self.stats)
+        if self.error:
+            report["error"] = self.error
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            report["latency_ms"] = {
+                "total": round(sum(ordered), 1),
+                "mean": round(statistics.mean(ordered), 2),
+                "p95": round(ordered[int(0.95 * (len(ordered) - 1))], 2),
+                "max": round(ordered[-1], 2),
+            }
+        if self.delays:
+            ordered = sorted(self.delays)
+            report["alert_delay_seconds"] = {
+                "mean": round(statistics.mean(ordered)),
+                "p95": round(ordered[int(0.95 * (len(ordered) - 1))]),
+                "max": round(ordered[-1]),
+            }
+        return report
+
+    def rule_settings(self) -> Dict:
+        return {
+            "name": self.name,
+            "file": self.rule["file"],
+            "type": self.type,
+            "run_every_seconds": self.run_every.total_seconds(),
+            "buffer_time_seconds": self.buffer_time.total_seconds(),
+            "realert_seconds": self.realert.total_seconds(),
+            "aggregation_seconds": self.aggregation.total_seconds(),
+        }
+
+
+def replay(backend, runners: List[RuleRunner], first: datetime.datetime, last: datetime.datetime) -> Dict:
+    """
+    Steps the clock from the first document until every rule has looked past
+    the last one and sent its pending aggregations.
+    """
+    step = min(r.run_every for r in runners)
+    clock = first
+    for runner in runners:
+        runner.next_run = first
+    horizon = last + max(r.buffer_time + r.run_every for r in runners)
+    started = time.monotonic()
+    steps = 0
+    while clock <= horizon or any(r.pending for r in runners if not r.error):
+        for runner in runners:
+            if runner.error:
+                continue
+            # ElastAlert sends due aggregations before it runs the rules
+            runner.send_pending(clock)
+            if clock >= runner.next_run and clock <= horizon:
+                try:
+                    runner.run(backend, clock)
+                except (UnsupportedQuery, RuntimeError) as e:
+                    runner.error = str(e)
+                runner.next_run = clock + runner.run_every
+        clock += step
+        steps += 1
+    wall = time.monotonic() - started
+    simulated = (clock - first).total_seconds()
+    return {
+        "backend": backend.name,
+        "first_document": format_time(first),
+        "last_document": format_time(last),
+        "simulated_seconds": simulated,
+        "wall_seconds": round(wall, 3),
+        "speedup": round(simulated / wall) if wall else None,
+        "steps": steps,
+        "rules": [r.report() for r in runners],
+    }
+
+
+def print_report(report: Dict, corpus_docs: int):
+    print(f"Replayed {corpus_docs} documents from {report['first_document']} to {report['last_document']} "
+          f"on the {report['backend']} backend: {report['simulated_seconds'] / 3600:.1f}h simulated "
+          f"in {report['wall_seconds']:.1f}s ({report['speedup']}x)")
+    header = f"  {'queries':>7} {'mean ms':>8} {'p95 ms':>8} {'hits':>7} {'new':>6} {'matches':>7} {'silenced':>8} {'alerts':>6} {'delay p95':>9}  rule"
+    print(header)
+    for rule in report["rules"]:
+        if "error" in rule:
+            print(f"  {'':>7} {'':>8} {'':>8} {'':>7} {'':>6} {'':>7} {'':>8} {'':>6} {'':>9}  {rule['name']}: {rule['error']}")
+            continue
+        latency = rule.get("latency_ms", {})
+        delay = rule.get("alert_delay_seconds", {})
+        print(f"  {rule['queries']:>7} {latency.get('mean', 0):>8.1f} {latency.get('p95', 0):>8.1f} {rule['hits']:>7} "
+              f"{rule['new_hits']:>6} {rule['matches']:>7} {rule['silenced']:>8} {rule['alerts']:>6} "
+              f"{str(delay.get('p95', '-')) + 's':>9}  {rule['name']}")
+        if rule["truncated"]:
+            print(f"    {rule['truncated']} hits were beyond max_query_size")
+
+
+def capture(es: Elasticsearch, index: str, since: str, output: str, page_size: int = 5000) -> int:
+    """Saves the alerts of the last `since` (e.g. 7d) as gzipped NDJSON search hits."""
+    pit_id = es.json("POST", f"{index}/_pit", params={"keep_alive": "5m"})["id"]
+    search_after = None
+    count = 0
+    tmp_path = f"{output}.tmp"
+    try:
+        with gzip.open(tmp_path, 'wt') as fp:
+            while True:
+                body = {
+                    "size": page_size,
+                    "pit": {"id": pit_id, "keep_alive": "5m"},
+                    "query": {"range": {"@timestamp": {"gte": f"now-{since}"}}},
+                    "sort": ["_shard_doc"],
+                    "track_total_hits": False,
+                }
+                if search_after is not None:
+                    body["search_after"] = search_after
+                result = es.json("POST", "_search", data=json.dumps(body))
+                pit_id = result.get("pit_id", pit_id)
+                hits = result["hits"]["hits"]
+                if not hits:
+                    break
+                for hit in hits:
+                    fp.write(json.dumps({"_index": hit["_index"], "_id": hit["_id"], "_source": hit["_source"]}) + "\n")
+                count += len(hits)
+                search_after = hits[-1]["sort"]
+    finally:
+        es.json("DELETE", "_pit", data=json.dumps({"id": pit_id}))
+    os.replace(tmp_path, output)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay stored alerts through the ElastAlert rules on a simulated clock')
+    parser.add_argument('--host', default='localhost', help='Elasticsearch host (default: localhost)')
+    parser.add_argument('--port', type=int, default=9200, help='Elasticsearch port (default: 9200)')
+    parser.add_argument('-u', '--user', default='elastic', help='Elasticsearch user (default: elastic)')
+    parser.add_argument('--password-env', default='ES_PASSWORD', help='Environment variable holding the password (default: ES_PASSWORD)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    capture_parser = commands.add_parser('capture', help='Save recent alerts as a replay corpus')
+    capture_parser.add_argument('-o', '--output', default='alerts_corpus.ndjson.gz', help='Corpus file (default: alerts_corpus.ndjson.gz)')
+    capture_parser.add_argument('--index', default=ALERTS_INDEX, help=f'Indices to capture (default: {ALERTS_INDEX})')
+    capture_parser.add_argument('--since', default='7d', help='How far back to capture (default: 7d)')
+
+    replay_parser = commands.add_parser('replay', help='Replay a corpus through the rules')
+    replay_parser.add_argument('corpus', nargs='+', help='NDJSON corpus files, optionally gzipped')
+    replay_parser.add_argument('--config', default=os.path.join(CONFIG_DIR, 'config.yaml'), help='ElastAlert config.yaml')
+    replay_parser.add_argument('--rules', default=os.path.join(CONFIG_DIR, 'rules'), help='Rules folder')
+    replay_parser.add_argument('--rule', action='append', default=[], help='Only replay the rule with this name (repeatable)')
+    replay_parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                               help='Override a rule setting for the replay, e.g. realert.minutes=5 (repeatable)')
+    replay_parser.add_argument('--backend', choices=['memory', 'elasticsearch'], default='memory',
+                               help='Evaluate queries in memory or in Elasticsearch (default: memory)')
+    replay_parser.add_argument('--index', default=REPLAY_INDEX, help=f'Index the corpus is loaded into for the elasticsearch backend (default: {REPLAY_INDEX})')
+    replay_parser.add_argument('-o', '--output', default='replay_report.json', help='Report file (default: replay_report.json)')
+    args = parser.parse_args()
+
+    es = None
+    if args.command == 'capture' or args.backend == 'elasticsearch':
+        password = os.environ.get(args.password_env)
+        if not password:
+            print(f"Set the Elasticsearch password in ${args.password_env}")
+            return 1
+        es = Elasticsearch(args.host, args.port, args.user, password)
+
+    if args.command == 'capture':
+        print(f"Captured {capture(es, args.index, args.since, args.output)} alerts to {args.output}")
+        return 0
+
+    with open(args.config, 'r') as fp:
+        config = yaml.safe_load(fp)
+    rules = load_rules(args.rules, config, args.rule, args.set)
+    if not rules:
+        print(f"No rules to replay in {args.rules}")
+        return 1
+    timestamp_field = config.get("timestamp_field", "@timestamp")
+
+    docs = list(iter_corpus(args.corpus))
+    if not docs:
+        print("The corpus is empty")
+        return 1
+    if es is not None:
+        backend = ElasticsearchBackend(es, args.index, timestamp_field)
+        print(f"Loaded {backend.load(iter(docs))} documents into {args.index}")
+    else:
+        backend = MemoryBackend(docs, timestamp_field)
+
+    runners = [RuleRunner(copy.deepcopy(rule), duration(config["run_every"]), duration(config["buffer_time"]))
+               for rule in rules]
+    first, last = backend.span()
+    report = replay(backend, runners, first, last)
+    report["corpus_documents"] = len(docs)
+    report["overrides"] = args.set
+    with open(args.output, 'w') as fp:
+        json.dump(report, fp, indent=2)
+    print_report(report, len(docs))
+    print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Concurrent TCP, UDP and TLS reachability probes for the LME services.
+
+Every probe runs in one asyncio event loop with its own timeout, so checking
+all of the LME ports takes about as long as the slowest single probe instead
+of the sum of all of them. Only the standard library is used so operators can
+run it on an LME host without the test requirements installed:
+
+    ./scripts/lme-probe --host localhost
+"""
+import argparse
+import asyncio
+import json
+import socket
+import ssl
+import sys
+import time
+from dataclasses import dataclass, field
+
+
+DEFAULT_TIMEOUT = 10.0
+
+TCP = "tcp"
+UDP = "udp"
+TLS = "tls"
+
+
+@dataclass(frozen=True)
+class Probe:
+    name: str
+    host: str
+    port: int
+    kind: str = TCP
+    payload: bytes = field(default=b"", compare=False)
+
+
+@dataclass
+class ProbeResult:
+    probe: Probe
+    ok: bool
+    elapsed: float
+    detail: str = ""
+
+    def as_dict(self):
+        return {
+            "name": self.probe.name,
+            "host": self.probe.host,
+            "port": self.probe.port,
+            "kind": self.probe.kind,
+            "ok": self.ok,
+            "elapsed": round(self.elapsed, 3),
+            "detail": self.detail,
+        }
+
+
+def lme_probes(host, es_port=9200):
+    """Default probe set covering every port LME exposes."""
+    syslog = b"<14>Jan  1 00:00:00 test-host test: connectivity test"
+    return [
+        Probe("elasticsearch", host, int(es_port), TCP),
+        Probe("elasticsearch", host, int(es_port), TLS),
+        Probe("kibana", host, 5601, TCP),
+        Probe("kibana", host, 5601, TLS),
+        Probe("kibana", host, 443, TCP),
+        Probe("kibana", host, 443, TLS),
+        Probe("fleet_server", host, 8220, TCP),
+        Probe("fleet_server", host, 8220, TLS),
+        Probe("wazuh_agent", host, 1514, TCP),
+        Probe("wazuh_enrollment", host, 1515, TCP),
+        Probe("wazuh_api", host, 55000, TCP),
+        Probe("wazuh_api", host, 55000, TLS),
+        Probe("wazuh_syslog", host, 514, UDP, syslog),
+    ]
+
+
+def _insecure_context():
+    # LME uses self-signed certificates, we only care that the handshake completes
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+async def _probe_tcp(probe):
+    _, writer = await asyncio.open_connection(probe.host, probe.port)
+    writer.close()
+    await writer.wait_closed()
+    return "connected"
+
+
+async def _probe_tls(probe):
+    _, writer = await asyncio.open_connection(
+        probe.host, probe.port, ssl=_insecure_context(), server_hostname=probe.host
+    )
+    version = writer.get_extra_info("ssl_object").version()
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except (ssl.SSLError, ConnectionError):
+        # Some servers drop the connection without a close_notify
+        pass
+    if version is None:
+        raise ssl.SSLError("SSL handshake failed")
+    return version
+
+
+async def _probe_udp(probe):
+    # UDP is connectionless, so a successful send is all that can be verified
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        asyncio.DatagramProtocol, remote_addr=(probe.host, probe.port), family=socket.AF_INET
+    )
+    try:
+        transport.sendto(probe.payload or b"test")
+    finally:
+        transport.close()
+    return "datagram sent"
+
+
+_HANDLERS = {
+    TCP: _probe_tcp,
+    UDP: _probe_udp,
+    TLS: _probe_tls,
+}
+
+
+async def run_probe(probe, timeout=DEFAULT_TIMEOUT):
+    start = time.monotonic()
+    try:
+        detail = await asyncio.wait_for(_HANDLERS[probe.kind](probe), timeout)
+        ok = True
+    except asyncio.TimeoutError:
+        ok, detail = False, f"timed out after {timeout}s"
+    except (OSError, ssl.SSLError) as e:
+        ok, detail = False, str(e) or e.__class__.__name__
+    return ProbeResult(probe, ok, time.monotonic() - start, detail)
+
+
+async def run_probes_async(probes, timeout=DEFAULT_TIMEOUT):
+    return await asyncio.gather(*(run_probe(probe, timeout) for probe in probes))
+
+
+def run_probes(probes, timeout=DEFAULT_TIMEOUT):
+    """
+    Runs all probes concurrently and returns their results in the same order.
+
+    Args:
+        probes: Iterable of Probe.
+        timeout: Per probe timeout in seconds.
+    """
+    return list(asyncio.run(run_probes_async(list(probes), timeout)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="lme-probe", description="Check that every LME service port is reachable."
+    )
+    parser.add_argument("--host", default="localhost", help="LME host to probe (default: localhost)")
+    parser.add_argument("--es-port", type=int, default=9200, help="Elasticsearch port (default: 9200)")
+    parser.add_argument(
+        "--timeout", type=float, default=DEFAULT_TIMEOUT, help="Per probe timeout in seconds (default: 10)"
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run_probes(lme_probes(args.host, args.es_port), args.timeout)
+
+    if args.json:
+        print(json.dumps([result.as_dict() for result in results], indent=2))
+    else:
+        for result in results:
+            status = "OK  " if result.ok else "FAIL"
+            print(
+                f"{status} {result.probe.name:<18} {result.probe.kind}/{result.probe.port:<6} "
+                f"{result.elapsed * 1000:7.1f} ms  {result.detail}"
+            )
+
+    return 0 if all(result.ok for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
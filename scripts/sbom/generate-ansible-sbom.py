@@ -1,14 +1,22 @@
 import os
 import re
+import argparse
 import yaml
-import uuid
 import json
-import hashlib
-import datetime
 import subprocess
-from typing import List, Dict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Dict, Tuple, Set, Optional
 from pathlib import Path
 
+from spdx import Package, SbomPart, Sbom, file_checksums
+
+try:
+    #the libyaml based loader is several times faster than the pure python one
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
 def get_os_version() -> Dict[str, str]:
     #default to "" if we cannot get os info. Would rather
     #have everything in sbom than nothing
@@ -66,313 +74,504 @@ def get_package_version(package: str, os_info: Dict[str, str]) -> str:
 
     return version
 
-class Package():
-    def __init__(self, name: str, version: str, file: Path, pkg_type: str, os_info: Dict[str, str] = None):
-        self.name = name
-        self.version = version
-        self.file = file
-        self.package_type = pkg_type
-        self.os_info = os_info or {}
-
-        self.hash_string = self.make_hash_string()
-        self.reference_locator = self.get_reference_locator()
-        self.spdx_id = self.get_spdx_id()
+def is_redhat_family(os_info: Dict[str, str]) -> bool:
+    os_name = os_info.get("name", "").lower()
+    return 'red hat' in os_name or 'rhel' in os_name or 'centos' in os_name or 'fedora' in os_name
+
+def _run_batch_query(cmd: List[str]) -> Dict[str, str]:
+    #every query below prints "name<TAB>version" per line. Packages that
+    #are unknown make the command exit non-zero, but the known ones are
+    #still printed, so the exit code is ignored
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+    versions = {}
+    for line in result.stdout.splitlines():
+        if "\t" not in line:
+            continue
+        name, version = line.split("\t", 1)
+        name, version = name.strip(), version.strip()
+        if name and version and name not in versions:
+            versions[name] = version
+    return versions
+
+def resolve_package_versions(packages: List[str], os_info: Dict[str, str]) -> Dict[str, str]:
+    """
+    Resolves the versions of all packages with as few package manager calls as possible.
+
+    Installed versions come from one dpkg-query or rpm query over the whole list.
+    Packages that are not installed are looked up in the repositories with one
+    apt-cache or dnf/yum call. If none of the batch tools are available, falls
+    back to get_package_version for each package.
+    """
+    packages = sorted(set(packages))
+    versions: Dict[str, str] = {}
+    if not packages:
+        return versions
+
+    if is_redhat_family(os_info):
+        queries = [
+            ['rpm', '-q', '--qf', '%{NAME}\t%{VERSION}\n'],
+            ['dnf', 'repoquery', '--latest-limit=1', '--qf', '%{name}\t%{version}\n'],
+            ['yum', 'repoquery', '--latest-limit=1', '--qf', '%{name}\t%{version}\n'],
+        ]
+    else:
+        queries = [
+            ['dpkg-query', '-W', '-f', '${Package}\t${Version}\n'],
+            #apt-cache show prints a stanza per package, the first one is the candidate
+            ['sh', '-c', 'apt-cache show "$@" | awk -F": " \'/^Package:/{p=$2} /^Version:/{print p "\t" $2}\'', 'apt-cache'],
+        ]
+
+    ran_any = False
+    for query in queries:
+        missing = [pkg for pkg in packages if pkg not in versions]
+        if not missing:
+            break
+        try:
+            found = _run_batch_query(query + missing)
+            ran_any = True
+        except (FileNotFoundError, subprocess.TimeoutExpired, subprocess.SubprocessError):
+            continue
+        for pkg in missing:
+            if pkg in found:
+                versions[pkg] = found[pkg]
+
+    if not ran_any:
+        for pkg in packages:
+            versions[pkg] = get_package_version(pkg, os_info)
+
+    return {pkg: versions.get(pkg, 'unknown') for pkg in packages}
+
+NIX_PATTERNS = [
+    r'nixpkgs\.([a-zA-Z0-9_-]+)',
+    r'nix-env\s+-i\s+([^\s]+)',
+]
+
+#ansible modules that install OS packages, mapped to the package type they
+#install. None means the host's native package manager
+PACKAGE_MODULES = {
+    "apt": "deb",
+    "dnf": "rpm",
+    "yum": "rpm",
+    "package": None,
+}
+
+#keys whose values are themselves lists of tasks
+TASK_LIST_KEYS = ("block", "rescue", "always", "tasks", "pre_tasks", "post_tasks", "handlers")
+
+JINJA_VARIABLE = re.compile(r'^\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*(\|[^}]*)?\}\}$')
+
+#a when: condition that only checks the distribution, e.g. ansible_os_family == 'RedHat'
+#or ansible_distribution in ['Ubuntu', 'Debian']
+DISTRO_CONDITION = re.compile(r'^ansible_(?:os_family|distribution)\s*(?:==|in)\s*(.+)$')
+
+#distribution and family names, lower case, mapped to their package type
+DISTRO_PACKAGE_TYPES = {
+    "debian": "deb",
+    "ubuntu": "deb",
+    "redhat": "rpm",
+    "centos": "rpm",
+    "fedora": "rpm",
+    "rocky": "rpm",
+    "almalinux": "rpm",
+}
+
+def find_nix_packages(task: dict) -> Set[str]:
+    packages = set()
+    for _, value in task.items():
+        if not (isinstance(value, str) and 'nix' in value.lower()):
+            continue
+
+        for pattern in NIX_PATTERNS:
+            packages.update(re.findall(pattern, value))
+    return packages
+
+def is_valid_release_type(release: str, os_info: Dict[str, str]) -> bool:
+    os_name = os_info.get("name", "").lower()
+    os_release = os_info.get("version", "").lower()
+    os_release = os_release.replace(".", "_")
 
-    def get_reference_locator(self) -> str:
-        reference_locator = "NOASSERTION"
+    # Always include common packages
+    if 'common' in release.lower():
+        return True
         
-        if self.package_type == "rpm":
-            # For Red Hat-based systems
-            os_name = self.os_info.get("name", "").lower()
-            if 'red hat' in os_name or 'rhel' in os_name:
-                reference_locator = f"pkg:rpm/redhat/{self.name}"
-            elif 'centos' in os_name:
-                reference_locator = f"pkg:rpm/centos/{self.name}"
-            elif 'fedora' in os_name:
-                reference_locator = f"pkg:rpm/fedora/{self.name}"
-            else:
-                reference_locator = f"pkg:rpm/{self.name}"
-        elif self.package_type == "deb":
-            # For Debian-based systems
-            os_name = self.os_info.get("name", "").lower()
-            if 'ubuntu' in os_name:
-                reference_locator = f"pkg:deb/ubuntu/{self.name}"
-            elif 'debian' in os_name:
-                reference_locator = f"pkg:deb/debian/{self.name}"
-            else:
-                reference_locator = f"pkg:deb/{self.name}"
-        elif self.package_type == "nix":
-            reference_locator = f"pkg:nix/{self.name}"
-
-        #if version specified, add to reference locator
-        if self.version not in ["", "unknown", "NOASSERTION"]:
-            reference_locator += f"@{self.version}"
-        return reference_locator
-
-    def make_hash_string(self) -> str:
-        hash_string = f"{self.name}{self.version}{str(self.file)}"
-        hash_obj = hashlib.sha1()
-        hash_obj.update(hash_string.encode('utf-8'))
-        hash = hash_obj.hexdigest()
-        return hash
-
-    def get_spdx_id(self) -> str:
-        name = f"{self.name}-{self.hash_string[:10]}"
-        spdx_id = f"SPDXRef-Package-{name.replace('-','').replace('_','')}"
-
-        return spdx_id
-
-class SbomPart():
-    def __init__(self, root_package_id: str):
-        self.root_package_id = root_package_id
-
-        self.files = list()
-        self.packages = list()
-        self.relationships = list()
-
-    def add_file(self, file_path: Path, base_dir: Path) -> str:
-        with open(file_path, 'rb') as fp:
-            filedata = fp.read()
-            sha_1_hash = hashlib.sha1(filedata).hexdigest()
-            sha_256_hash = hashlib.sha256(filedata).hexdigest()
-
-        relative_path = file_path.relative_to(base_dir)
-        file_id = '-'.join(relative_path.parts[:-1]) + '-' + relative_path.name.split('.')[0]
-        spdx_file_id = f"SPDXRef-File-{file_id}-{sha_1_hash[:10]}"
-
-        self.files.append( {
-            "SPDXID": spdx_file_id,
-            "fileName": str(file_path),
-            "checksums": [
-                {"algorithm": "SHA256", "checksumValue": sha_256_hash},
-                {"algorithm": "SHA1", "checksumValue": sha_1_hash},
-            ],
-            "fileTypes": ["SOURCE"],
-            "copyrightText": "NOASSERTION"
-        })
-
-        self.relationships.append({
-            "spdxElementId": self.root_package_id,
-            "relatedSpdxElement": spdx_file_id,
-            "relationshipType": "DESCRIBES"
-        })
-
-        return spdx_file_id
-
-    def add_package(self, package: Package, spdx_file_id: str):
-        package_spdx = {
-            "SPDXID": package.spdx_id,
-            "name": package.name,
-            "downloadLocation":"NOASSERTION",
-            "filesAnalyzed": False,
-            "supplier": "NOASSERTION",
-            "versionInfo": package.version,
-            "externalRefs": [{
-                "referenceCategory": "PACKAGE_MANAGER",
-                "referenceType" :"purl",
-                "referenceLocator": package.reference_locator
-            }]
-        }
-        self.packages.append(package_spdx)
-
-        self.relationships.append({
-            "spdxElementId": package.spdx_id,
-            "relatedSpdxElement": spdx_file_id,
-            "relationshipType": "GENERATED_FROM"
-        })
-
-class Sbom():
-    def __init__(self):
-        self.root_package_id = "SPDXRef-Package-Document"
-        self.data = {
-            "spdxVersion": "SPDX-2.3",
-            "dataLicense": "CC0-1.0",
-            "SPDXID": "SPDXRef-DOCUMENT",
-            "name": "Ansible Install Playbook SBOM",
-            #TODO: change document namespace? 
-            "documentNamespace": f"https://spdx.org/spdxdocs/spdx-tools-v1.2-{uuid.uuid4()}",
-            "creationInfo": {
-                "created": datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                "creators": ["Tool: ansible-sbom-generator"]
-            },
-            "files": [],
-            "packages": [],
-            "relationships": [],
-        }
-        self.data["packages"].append({
-            "SPDXID": self.root_package_id,
-            "name": "Ansible-Deployment-Root",
-            "downloadLocation": "NOASSERTION",
-            "filesAnalyzed": False,
-        })
-        self.data["relationships"].append({
-            "spdxElementId": "SPDXRef-DOCUMENT",
-            "relatedSpdxElement": self.root_package_id,
-            "relationshipType": "DESCRIBES",
-        })
-
-    def add_part(self, part: SbomPart):
-        self.data["files"].extend(part.files)
-        self.data["packages"].extend(part.packages)
-        self.data["relationships"].extend(part.relationships)
-
-    def save(self, output_file: Path):
-        with open(output_file, 'w') as fp:
-            json.dump(self.data, fp)
-        print(f"Sbom saved to {output_file}")
-
-
-class NixPackageParser():
-    def __init__(self, path: Path, baseDir: Path):
-        self.file_path = path
-        self.baseDir = baseDir
-        self.nix_packages = set()
-
-        self.package_details: List[Package] = []
-
-        self.parse_ansible_playbook()
-
-    def parse_ansible_playbook(self):
-        with open(self.file_path, 'r') as fp:
-            playbook = yaml.safe_load(fp)
-
-        if playbook is None:
-            return 0
-
-        if type(playbook) == dict:
-            playbook = [playbook]
-
-        for task in playbook:
-            self.parse_task(task)
-
-    def parse_task(self, task: dict):
-        if not ('nix' in task or any('nix' in str(v).lower() for v in task.values() if isinstance(v, str))):
-            return
-
-        for _, value in task.items():
-            if not ( isinstance(value, str) and 'nix' in value.lower()):
-                continue 
-
-            nix_patterns = [
-                r'nixpkgs\.([a-zA-Z0-9_-]+)',
-                r'nix-env\s+-i\s+([^\s]+)',
-            ]
-
-            for pattern in nix_patterns:
-                matches = re.findall(pattern, value)
-                self.nix_packages.update(matches)
-
-    def make_sbom_data(self, root_package_id: str) -> SbomPart:
-        sbom_part = SbomPart(root_package_id)
-        spdx_file_id = sbom_part.add_file(self.file_path, self.baseDir)
-        for pkg in self.nix_packages:
-            p = Package(pkg, "unknown", self.file_path, "nix", {})
-            sbom_part.add_package(p, spdx_file_id)
-        return sbom_part
-
-class AptPackageSBOMGenerator():
-    def __init__(self, filepath: Path, LME_BASE_PATH: Path, os_info = get_os_version()):
-        self.filepath = filepath
-        self.LME_BASE_PATH = LME_BASE_PATH
-
-        self.package_details: List[Package] = []
-        self.os_info = os_info
-
-    def is_valid_release_type(self, release: str) -> bool:
-        os_name = self.os_info.get("name", "").lower()
-        os_release = self.os_info.get("version", "").lower()
-        os_release = os_release.replace(".", "_")
-
-        # print(f"Checking release '{release}' against OS '{os_name}' version '{os_release}'")
-
-        # Always include common packages
-        if 'common' in release.lower():
-            return True
-            
-        # Handle Red Hat Enterprise Linux
-        if 'red hat' in os_name or 'rhel' in os_name:
-            if 'redhat' in release.lower():
-                # If there are no numbers in the release name, assume it applies to all versions
-                if not re.search(r'\d', release):
-                    return True
-                # Check for version match (e.g., redhat_9 matches version 9.x)
-                major_version = os_release.split('_')[0] if '_' in os_release else os_release.split('.')[0]
-                if major_version in release.lower():
-                    return True
-            return False
-            
-        # Handle other distributions
-        if " " in os_name:
-            os_name = os_name.split(" ")[0]  # Take first word (e.g., "red" from "red hat")
-            
-        if os_name in release.lower():
-            # If there are no numbers, assume no version name
+    # Handle Red Hat Enterprise Linux
+    if 'red hat' in os_name or 'rhel' in os_name:
+        if 'redhat' in release.lower():
+            # If there are no numbers in the release name, assume it applies to all versions
             if not re.search(r'\d', release):
                 return True
-            if os_release in release.lower():
+            # Check for version match (e.g., redhat_9 matches version 9.x)
+            major_version = os_release.split('_')[0] if '_' in os_release else os_release.split('.')[0]
+            if major_version in release.lower():
                 return True
-                
-        return False 
-
-    def get_apt_packages_list(self):
-        with open(self.filepath, 'r') as fp:
-            yaml_data = yaml.safe_load(fp)
-
-        packages = set() 
-
-        for release_type, package_list in yaml_data.items():
-            if self.is_valid_release_type(release_type):
-                packages.update(package_list)
-
-        # Determine package type based on OS
-        os_name = self.os_info.get("name", "").lower()
-        if 'red hat' in os_name or 'rhel' in os_name or 'centos' in os_name or 'fedora' in os_name:
-            pkg_type = "rpm"
-        else:
-            pkg_type = "deb"
+        return False
+        
+    # Handle other distributions
+    if " " in os_name:
+        os_name = os_name.split(" ")[0]  # Take first word (e.g., "red" from "red hat")
+        
+    if os_name in release.lower():
+        # If there are no numbers, assume no version name
+        if not re.search(r'\d', release):
+            return True
+        if os_release in release.lower():
+            return True
             
-        for package in packages:
-            pkg = Package(package, get_package_version(package, self.os_info), self.filepath, pkg_type, self.os_info)
-            self.package_details.append(pkg)
+    return False 
+
+def applies_to_os(tag: str, os_info: Dict[str, str]) -> bool:
+    #file stems and variable names that don't name a distribution apply everywhere
+    tag = tag.lower().replace('-', '_').replace('.', '_')
+    if not any(distro in tag for distro in ('debian', 'ubuntu', 'redhat', 'rhel')):
+        return True
+    return is_valid_release_type(tag, os_info)
+
+def iter_tasks(data, conditions: Tuple = ()):
+    """Yields (task, when: conditions of the task and the blocks around it)."""
+    if isinstance(data, list):
+        for item in data:
+            yield from iter_tasks(item, conditions)
+    elif isinstance(data, dict):
+        when = data.get('when')
+        if when is not None:
+            conditions = conditions + tuple(str(c).strip() for c in (when if isinstance(when, list) else [when]))
+        yield data, conditions
+        for key in TASK_LIST_KEYS:
+            if key in data:
+                yield from iter_tasks(data[key], conditions)
+
+def condition_package_types(conditions: Tuple) -> Tuple[List[str], bool]:
+    """
+    Splits when: conditions into the package types of the distributions they
+    require and whether any other condition, which cannot be evaluated here, remains.
+    """
+    types = set()
+    other = False
+    for condition in conditions:
+        match = DISTRO_CONDITION.match(condition)
+        names = re.findall(r'[\'"]([^\'"]+)[\'"]', match.group(1)) if match else []
+        found = {DISTRO_PACKAGE_TYPES.get(name.lower()) for name in names}
+        if not names or None in found:
+            other = True
+        else:
+            types.update(found)
+    return sorted(types), other
+
+def package_module(task: dict) -> Tuple[Optional[str], object]:
+    for key, value in task.items():
+        module = key.split('.')[-1] if key.startswith('ansible.') else key
+        if module in PACKAGE_MODULES:
+            return module, value
+    return None, None
+
+def package_names_from_url(name: str) -> str:
+    #e.g. https://.../epel-release-latest-9.noarch.rpm -> epel-release
+    basename = name.rstrip('/').split('/')[-1]
+    match = re.match(r'[A-Za-z0-9_+]+(?:-[A-Za-z][A-Za-z0-9_+]*)*', basename)
+    return match.group(0) if match else basename
+
+def extract_file_record(path: Path, data) -> Dict:
+    """
+    Reduces a parsed YAML file to what the SBOM needs, before any variable is resolved:
+    the variables it defines and the raw package specs of its install tasks.
+    """
+    record = {"variables": {}, "specs": [], "nix": []}
+
+    if isinstance(data, dict):
+        #role defaults/vars files
+        if path.parent.name in ('defaults', 'vars') or path.parent.parent.name == 'group_vars':
+            record["variables"] = data
+        return record
+
+    if not isinstance(data, list):
+        return record
+
+    #playbook level vars
+    for play in data:
+        if isinstance(play, dict) and isinstance(play.get('vars'), dict):
+            record["variables"].update(play['vars'])
+
+    nix = set()
+    for task, conditions in iter_tasks(data):
+        module, args = package_module(task)
+        if module is not None:
+            if isinstance(args, str):
+                #free form, e.g. "apt: name=foo state=present"
+                args = dict(part.split('=', 1) for part in args.split() if '=' in part)
+            if isinstance(args, dict) and args.get('state', 'present') != 'absent':
+                name = args.get('name', args.get('pkg'))
+                if name is not None:
+                    distro_types, conditional = condition_package_types(conditions)
+                    record["specs"].append([PACKAGE_MODULES[module], name, distro_types, conditional])
+
+        nix.update(find_nix_packages(task))
+    record["nix"] = sorted(nix)
+    return record
+
+def load_yaml_file(path: Path) -> Tuple[Path, Dict]:
+    #runs in a worker process: read once, hash, parse and extract
+    with open(path, 'rb') as fp:
+        filedata = fp.read()
 
-    def make_sbom_data(self, root_package_id: str) -> SbomPart:
-        #get the file hashes for the sbom
-        sbom_part = SbomPart(root_package_id)
-        spdx_file_id = sbom_part.add_file(self.filepath, self.LME_BASE_PATH)
-        for packageData in self.package_details:
-            sbom_part.add_package(packageData, spdx_file_id)
+    try:
+        data = yaml.load(filedata, Loader=YamlLoader)
+    except yaml.YAMLError as e:
+        print(f"Skipping {path}: {e}")
+        data = None
+
+    record = extract_file_record(path, data)
+    record["sha1"], record["sha256"] = file_checksums(filedata)
+    return path, record
+
+def package_db_stamp() -> str:
+    #changes whenever packages are installed, upgraded or removed
+    for db in ("/var/lib/dpkg/status", "/var/lib/rpm/rpmdb.sqlite", "/var/lib/rpm/Packages"):
+        try:
+            st = os.stat(db)
+        except OSError:
+            continue
+        return f"{db}:{st.st_mtime_ns}:{st.st_size}"
+    return ""
+
+class SbomCache():
+    """
+    Persistent cache of per-file SBOM records and resolved package versions.
+
+    File records are keyed by path relative to the scanned tree and are reused
+    when mtime and size match, or when the content hash still matches after a
+    touch. Versions are only reused while the OS and the package database are
+    unchanged.
+    """
+    FORMAT_VERSION = 2
+
+    def __init__(self, cache_file: Path, os_info: Dict[str, str]):
+        self.cache_file = cache_file
+        self.stamp = {"os": os_info, "package_db": package_db_stamp()}
+        self.files: Dict[str, Dict] = {}
+        self.versions: Dict[str, str] = {}
+
+    def load(self):
+        try:
+            with open(self.cache_file, 'r') as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return
 
-        return sbom_part 
+        if data.get("format") != self.FORMAT_VERSION:
+            return
+        self.files = data.get("files", {})
+        if data.get("stamp") == self.stamp:
+            self.versions = data.get("versions", {})
+
+    def save(self):
+        os.makedirs(self.cache_file.parent, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix(".tmp")
+        with open(tmp_file, 'w') as fp:
+            json.dump({
+                "format": self.FORMAT_VERSION,
+                "stamp": self.stamp,
+                "files": self.files,
+                "versions": self.versions,
+            }, fp, default=str)
+        os.replace(tmp_file, self.cache_file)
+
+    def lookup(self, key: str, path: Path) -> Optional[Dict]:
+        record = self.files.get(key)
+        if record is None:
+            return None
+
+        st = path.stat()
+        if record.get("mtime_ns") == st.st_mtime_ns and record.get("size") == st.st_size:
+            return record
+
+        #touched but maybe not changed, the hash decides
+        with open(path, 'rb') as fp:
+            sha1, sha256 = file_checksums(fp.read())
+        if record.get("sha256") == sha256:
+            record["mtime_ns"], record["size"] = st.st_mtime_ns, st.st_size
+            return record
+        return None
+
+    def store(self, key: str, path: Path, record: Dict):
+        st = path.stat()
+        record["mtime_ns"], record["size"] = st.st_mtime_ns, st.st_size
+        self.files[key] = record
+
+    def prune(self, keys: Set[str]):
+        for key in list(self.files):
+            if key not in keys:
+                del self.files[key]
+
+class AnsibleTreeScanner():
+    def __init__(self, base_dir: Path, os_info: Dict[str, str], all_os: bool = False, workers: int = None, cache: SbomCache = None):
+        self.base_dir = base_dir
+        self.os_info = os_info
+        self.all_os = all_os
+        self.workers = workers or multiprocessing.cpu_count()
+        self.cache = cache
+
+        self.records: Dict[Path, Dict] = {}
+        self.variables: Dict[str, object] = {}
+        #file -> set of (package name, package type)
+        self.packages: Dict[Path, Set[Tuple[str, str]]] = {}
+        self.reparsed: List[Path] = []
+
+        self.host_pkg_type = "rpm" if is_redhat_family(os_info) else "deb"
+
+    def find_yaml_files(self) -> List[Path]:
+        return sorted(p for p in self.base_dir.rglob('*') if p.suffix in ('.yml', '.yaml') and p.is_file())
+
+    def load(self):
+        paths = self.find_yaml_files()
+        keys = {path: str(path.relative_to(self.base_dir)) for path in paths}
+
+        stale = []
+        for path in paths:
+            record = self.cache.lookup(keys[path], path) if self.cache else None
+            if record is None:
+                stale.append(path)
+            else:
+                self.records[path] = record
+
+        #only changed files are parsed, and the pool is skipped when there are none
+        if stale:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(stale))) as executor:
+                for path, record in executor.map(load_yaml_file, stale, chunksize=8):
+                    self.records[path] = record
+                    if self.cache:
+                        self.cache.store(keys[path], path, record)
+        self.reparsed = stale
+
+        if self.cache:
+            self.cache.prune(set(keys.values()))
+
+    def applies(self, tag: str) -> bool:
+        return self.all_os or applies_to_os(tag, self.os_info)
+
+    def collect_variables(self):
+        for path in sorted(self.records):
+            self.variables.update(self.records[path]["variables"])
+
+    def resolve_names(self, value) -> List[str]:
+        if value is None:
+            return []
+        if isinstance(value, list):
+            names = []
+            for item in value:
+                names.extend(self.resolve_names(item))
+            return names
+        if not isinstance(value, str):
+            return []
+
+        match = JINJA_VARIABLE.match(value.strip())
+        if match:
+            variable = match.group(1)
+            if variable not in self.variables:
+                #"{{ foo | default([]) }}" is expected to be undefined on some distributions
+                if 'default' not in (match.group(2) or ''):
+                    print(f"Could not resolve package variable '{variable}'")
+                return []
+            if not self.applies(variable):
+                return []
+            return self.resolve_names(self.variables[variable])
+        if '{{' in value:
+            return []
+        if '://' in value or value.endswith('.rpm') or value.endswith('.deb'):
+            return [package_names_from_url(value)]
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def spec_package_type(self, pkg_type: Optional[str], distro_types: List[str], conditional: bool) -> Optional[str]:
+        """
+        The package type a task installs, or None if its when: restricts it to
+        another distribution. package: tasks install the native type of the
+        distribution their when: names; behind a condition that cannot be
+        evaluated, the type is unknown and NOASSERTION.
+        """
+        if distro_types and self.host_pkg_type not in distro_types and not self.all_os:
+            return None
+        if pkg_type is not None:
+            return pkg_type
+        if distro_types:
+            return self.host_pkg_type if self.host_pkg_type in distro_types else distro_types[0]
+        return "NOASSERTION" if conditional else self.host_pkg_type
+
+    def extract_packages(self, record: Dict) -> Set[Tuple[str, str]]:
+        found = set()
+        for pkg_type, value, distro_types, conditional in record["specs"]:
+            pkg_type = self.spec_package_type(pkg_type, distro_types, conditional)
+            if pkg_type is None:
+                continue
+            for name in self.resolve_names(value):
+                found.add((name, pkg_type))
+        for name in record["nix"]:
+            found.add((name, "nix"))
+        return found
+
+    def scan(self):
+        self.load()
+        self.collect_variables()
+
+        for path, record in self.records.items():
+            if not self.applies(path.stem):
+                continue
+            packages = self.extract_packages(record)
+            if packages:
+                self.packages[path] = packages
+
+    def resolve_versions(self, names: List[str]) -> Dict[str, str]:
+        cached = self.cache.versions if self.cache else {}
+        missing = sorted({name for name in names if name not in cached})
+        versions = dict(cached)
+        if missing:
+            versions.update(resolve_package_versions(missing, self.os_info))
+            if self.cache:
+                self.cache.versions = versions
+        return versions
+
+    def make_sbom_parts(self, root_package_id: str) -> Iterator[SbomPart]:
+        native = [name for packages in self.packages.values() for name, pkg_type in packages if pkg_type == self.host_pkg_type]
+        versions = self.resolve_versions(native)
+
+        #parts are yielded one file at a time so the SBOM can write them out as they come
+        for path in sorted(self.packages):
+            record = self.records[path]
+            sbom_part = SbomPart(root_package_id)
+            spdx_file_id = sbom_part.add_file(path, self.base_dir, (record["sha1"], record["sha256"]))
+            for name, pkg_type in sorted(self.packages[path]):
+                if pkg_type == self.host_pkg_type:
+                    version = versions.get(name, "unknown")
+                else:
+                    version = "NOASSERTION" if pkg_type == "NOASSERTION" else "unknown"
+                os_info = self.os_info if pkg_type != "nix" else {}
+                sbom_part.add_package(Package(name, version, path, pkg_type, os_info), spdx_file_id)
+            yield sbom_part
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate an SPDX SBOM for the packages installed by the LME ansible playbooks")
+    parser.add_argument("--all-os", action="store_true", help="Include packages for every distribution, not just this host's")
+    parser.add_argument("--workers", type=int, default=None, help="Number of YAML parser processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and do not update the cache in cache/")
+    args = parser.parse_args()
+
     script_path = Path(os.path.realpath(__file__))
     base_dir= script_path.parent.parent.parent / "ansible"
 
-    apt_package_list = base_dir/ "roles" / "base" / "defaults" / "main.yml"
-    aptPacakge = AptPackageSBOMGenerator(apt_package_list, base_dir)
-    aptPacakge.get_apt_packages_list()
-
     os_info = get_os_version()
 
-    nix_dir = base_dir / "roles" / "nix" / "tasks"
-    os_name = os_info.get("name", "").lower()
-    
-    # Select the appropriate nix file based on OS
-    if 'red hat' in os_name or 'rhel' in os_name:
-        nix_file_path = nix_dir / "redhat.yml"
-    elif 'ubuntu' in os_name:
-        nix_file_path = nix_dir / "ubuntu.yml"
-    elif 'debian' in os_name:
-        nix_file_path = nix_dir / "debian.yml"
-    else:
-        # Default to common if no specific match
-        nix_file_path = nix_dir / "common.yml"
+    cache = None
+    if not args.no_cache:
+        cache = SbomCache(script_path.parent / "cache" / "ansible-sbom-cache.json", os_info)
+        cache.load()
 
-    nixParser = NixPackageParser(nix_file_path, base_dir)
+    scanner = AnsibleTreeScanner(base_dir, os_info, all_os=args.all_os, workers=args.workers, cache=cache)
+    scanner.scan()
+    print(f"Parsed {len(scanner.reparsed)} of {len(scanner.records)} ansible files")
 
     full_sbom = Sbom()
-    full_sbom.add_part(aptPacakge.make_sbom_data(full_sbom.root_package_id))
-    full_sbom.add_part(nixParser.make_sbom_data(full_sbom.root_package_id))
+    for part in scanner.make_sbom_parts(full_sbom.root_package_id):
+        full_sbom.add_part(part)
+
+    if cache:
+        cache.save()
 
     output_dir = script_path.parent / "output"
     os.makedirs(output_dir, exist_ok=True)
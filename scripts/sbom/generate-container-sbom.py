@@ -0,0 +1,560 @@
+import io
+import os
+import re
+import sys
+import stat
+import json
+import time
+import shutil
+import sqlite3
+import struct
+import tarfile
+import zipfile
+import argparse
+import tempfile
+import posixpath
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from pathlib import Path, PurePosixPath
+
+from spdx import Package, SbomPart, Sbom, file_checksums
+
+DEFAULT_GRAPHROOT = "/var/lib/containers/storage"
+LME_IMAGE = re.compile(r'^localhost/[^:]+:LME_LATEST$')
+
+#layer entry kinds
+FILE = "file"
+WHITEOUT = "whiteout"
+OPAQUE = "opaque"
+
+#manifests worth opening, keyed by the parser that reads them. Paths are
+#relative to the image root, without a leading "/"
+OS_RELEASE_PATHS = ("etc/os-release", "usr/lib/os-release")
+DPKG_STATUS = re.compile(r'^var/lib/dpkg/status$|^var/lib/dpkg/status\.d/[^/.]+$')
+APK_INSTALLED = "lib/apk/db/installed"
+RPM_SQLITE_PATHS = ("var/lib/rpm/rpmdb.sqlite", "usr/lib/sysimage/rpm/rpmdb.sqlite")
+RPM_BDB_PATHS = ("var/lib/rpm/Packages", "usr/lib/sysimage/rpm/Packages")
+PYTHON_METADATA = re.compile(r'/(site|dist)-packages/[^/]+\.(dist-info/METADATA|egg-info/PKG-INFO|egg-info)$')
+PYTHON_REQUIREMENTS = re.compile(r'(^|/)requirements[^/]*\.txt$')
+NPM_PACKAGE = re.compile(r'(^|/)node_modules/(@[^/]+/)?[^/]+/package\.json$')
+JAVA_ARCHIVE = re.compile(r'\.(jar|war)$')
+GEM_SPEC = re.compile(r'/specifications/[^/]+\.gemspec$')
+
+#jar-name-1.2.3.jar, gem-name-1.2.3.gemspec
+NAME_VERSION = re.compile(r'^(?P<name>.+?)-(?P<version>\d[\w.\-+]*)$')
+
+#rpm header tags and types
+RPM_TAG_NAME = 1000
+RPM_TAG_VERSION = 1001
+RPM_TAG_RELEASE = 1002
+RPM_TAG_EPOCH = 1003
+RPM_INT32_TYPE = 4
+RPM_STRING_TYPE = 6
+RPM_I18NSTRING_TYPE = 9
+
+class LayerEntry(NamedTuple):
+    path: str
+    kind: str
+    open: Optional[Callable[[], BinaryIO]] = None
+
+#(name, version, package type, namespace)
+PackageInfo = Tuple[str, str, str, Optional[str]]
+
+def classify(path: str) -> Optional[str]:
+    if path in OS_RELEASE_PATHS:
+        return "os-release"
+    if path == APK_INSTALLED:
+        return "apk"
+    if path in RPM_SQLITE_PATHS:
+        return "rpm-sqlite"
+    if path in RPM_BDB_PATHS:
+        return "rpm-bdb"
+    if DPKG_STATUS.match(path):
+        return "dpkg"
+    if NPM_PACKAGE.search(path):
+        return "npm"
+    if PYTHON_METADATA.search(path):
+        return "python"
+    if PYTHON_REQUIREMENTS.search(path):
+        return "requirements"
+    if JAVA_ARCHIVE.search(path):
+        return "java"
+    if GEM_SPEC.search(path):
+        return "gem"
+    return None
+
+def parse_os_release(data: bytes) -> Dict[str, str]:
+    values = {}
+    for line in data.decode('utf-8', 'replace').splitlines():
+        if "=" in line:
+            key, value = line.strip().split("=", 1)
+            values[key] = value.strip("\"'")
+    return {"name": values.get("NAME", ""), "version": values.get("VERSION_ID", "")}
+
+def parse_stanzas(data: bytes, separator: str = ": ") -> Iterator[Dict[str, str]]:
+    #dpkg status and apk installed are both blank line separated key/value blocks
+    for stanza in data.decode('utf-8', 'replace').split("\n\n"):
+        fields = {}
+        for line in stanza.splitlines():
+            if line and not line[0].isspace() and separator in line:
+                key, value = line.split(separator, 1)
+                fields[key] = value.strip()
+        if fields:
+            yield fields
+
+def parse_dpkg_status(data: bytes) -> List[PackageInfo]:
+    packages = []
+    for fields in parse_stanzas(data):
+        #status.d files written for distroless images have no Status field
+        if "Package" in fields and fields.get("Status", "install ok installed").endswith(" installed"):
+            packages.append((fields["Package"], fields.get("Version", "unknown"), "deb", None))
+    return packages
+
+def parse_apk_installed(data: bytes) -> List[PackageInfo]:
+    return [(fields["P"], fields.get("V", "unknown"), "apk", None) for fields in parse_stanzas(data, ":") if "P" in fields]
+
+def parse_rpm_header(blob: bytes) -> Dict[int, object]:
+    #header blob as stored by rpm: index count, data length, index entries, data
+    index_count, data_length = struct.unpack_from(">II", blob, 0)
+    data_start = 8 + index_count * 16
+    values = {}
+    for i in range(index_count):
+        tag, tag_type, offset, count = struct.unpack_from(">IIII", blob, 8 + i * 16)
+        if tag not in (RPM_TAG_NAME, RPM_TAG_VERSION, RPM_TAG_RELEASE, RPM_TAG_EPOCH):
+            continue
+        start = data_start + offset
+        if tag_type in (RPM_STRING_TYPE, RPM_I18NSTRING_TYPE):
+            values[tag] = blob[start:blob.index(b"\0", start)].decode('utf-8', 'replace')
+        elif tag_type == RPM_INT32_TYPE:
+            values[tag] = struct.unpack_from(">I", blob, start)[0]
+    return values
+
+def rpm_version(epoch, version: str, release: str) -> str:
+    version = f"{version}-{release}" if release else version
+    return f"{epoch}:{version}" if epoch not in (None, "", "(none)", 0, "0") else version
+
+def parse_rpm_sqlite(data: bytes) -> List[PackageInfo]:
+    connection = sqlite3.connect(":memory:")
+    try:
+        connection.deserialize(data)
+        rows = connection.execute("SELECT blob FROM Packages").fetchall()
+    except AttributeError:
+        #python < 3.11 cannot open a database from memory
+        with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+            tmp.write(data)
+            tmp.flush()
+            rows = sqlite3.connect(tmp.name).execute("SELECT blob FROM Packages").fetchall()
+    finally:
+        connection.close()
+
+    packages = []
+    for (blob,) in rows:
+        try:
+            header = parse_rpm_header(blob)
+        except (struct.error, ValueError):
+            continue
+        if RPM_TAG_NAME in header:
+            version = rpm_version(header.get(RPM_TAG_EPOCH), header.get(RPM_TAG_VERSION, ""), header.get(RPM_TAG_RELEASE, ""))
+            packages.append((header[RPM_TAG_NAME], version or "unknown", "rpm", None))
+    return packages
+
+def parse_rpm_bdb(data: bytes) -> List[PackageInfo]:
+    #the Berkeley DB format is not worth reimplementing, let the host's rpm read it
+    if shutil.which("rpm") is None:
+        print("Skipping Berkeley DB rpm database: the rpm command is not installed", file=sys.stderr)
+        return []
+
+    with tempfile.TemporaryDirectory() as dbpath:
+        with open(os.path.join(dbpath, "Packages"), 'wb') as fp:
+            fp.write(data)
+        result = subprocess.run(
+            ["rpm", "--dbpath", dbpath, "-qa", "--qf", "%{NAME}\t%{EPOCH}\t%{VERSION}\t%{RELEASE}\n"],
+            capture_output=True, text=True, timeout=120,
+        )
+
+    packages = []
+    for line in result.stdout.splitlines():
+        parts = line.split("\t")
+        if len(parts) == 4:
+            packages.append((parts[0], rpm_version(parts[1], parts[2], parts[3]), "rpm", None))
+    return packages
+
+def parse_python_metadata(data: bytes) -> List[PackageInfo]:
+    fields = next(parse_stanzas(data), {})
+    if "Name" not in fields:
+        return []
+    return [(fields["Name"], fields.get("Version", "unknown"), "pypi", None)]
+
+def parse_requirements(data: bytes) -> List[PackageInfo]:
+    packages = []
+    for line in data.decode('utf-8', 'replace').splitlines():
+        line = line.split("#", 1)[0].strip()
+        match = re.match(r'^([A-Za-z0-9][A-Za-z0-9._\-]*)\s*(?:\[[^\]]*\])?\s*(?:==\s*([^\s;,]+))?', line)
+        if match and not line.startswith("-"):
+            packages.append((match.group(1), match.group(2) or "unknown", "pypi", None))
+    return packages
+
+def parse_package_json(data: bytes) -> List[PackageInfo]:
+    try:
+        manifest = json.loads(data)
+    except ValueError:
+        return []
+    name = manifest.get("name") if isinstance(manifest, dict) else None
+    if not isinstance(name, str) or not name:
+        return []
+    namespace = None
+    if name.startswith("@") and "/" in name:
+        namespace, name = name.split("/", 1)
+    return [(name, str(manifest.get("version", "unknown")), "npm", namespace)]
+
+def parse_java_archive(path: str, data: bytes) -> List[PackageInfo]:
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for member in archive.namelist():
+                if member.startswith("META-INF/maven/") and member.endswith("/pom.properties"):
+                    properties = dict(
+                        line.split("=", 1) for line in archive.read(member).decode('utf-8', 'replace').splitlines()
+                        if "=" in line and not line.startswith("#")
+                    )
+                    if "artifactId" in properties:
+                        return [(properties["artifactId"].strip(), properties.get("version", "unknown").strip(), "maven", properties.get("groupId", "").strip() or None)]
+    except Exception as e:
+        #a damaged or unusual archive (bad zip, truncated deflate stream, unsupported compression)
+        #must not fail the whole image
+        print(f"Failed to read {path} ({e}), using the file name", file=sys.stderr)
+
+    #no embedded pom, fall back to the file name
+    match = NAME_VERSION.match(posixpath.basename(path).rsplit(".", 1)[0])
+    if match:
+        return [(match.group("name"), match.group("version"), "maven", None)]
+    return [(posixpath.basename(path).rsplit(".", 1)[0], "unknown", "maven", None)]
+
+def parse_gem_spec(path: str) -> List[PackageInfo]:
+    match = NAME_VERSION.match(posixpath.basename(path)[:-len(".gemspec")])
+    return [(match.group("name"), match.group("version"), "gem", None)] if match else []
+
+def parse_manifest(kind: str, path: str, data: bytes) -> List[PackageInfo]:
+    if kind == "dpkg":
+        return parse_dpkg_status(data)
+    if kind == "apk":
+        return parse_apk_installed(data)
+    if kind == "rpm-sqlite":
+        return parse_rpm_sqlite(data)
+    if kind == "rpm-bdb":
+        return parse_rpm_bdb(data)
+    if kind == "python":
+        return parse_python_metadata(data)
+    if kind == "requirements":
+        return parse_requirements(data)
+    if kind == "npm":
+        return parse_package_json(data)
+    if kind == "java":
+        return parse_java_archive(path, data)
+    if kind == "gem":
+        return parse_gem_spec(path)
+    return []
+
+def normalize_path(name: str) -> str:
+    return posixpath.normpath("/" + name).lstrip("/")
+
+def iter_tar_layer(fileobj: BinaryIO) -> Iterator[LayerEntry]:
+    #stream mode reads the layer front to back, so nothing is extracted to disk.
+    #Entries must be consumed before advancing to the next one
+    with tarfile.open(fileobj=fileobj, mode="r|*") as layer:
+        for member in layer:
+            path = normalize_path(member.name)
+            parent, base = posixpath.split(path)
+            if base == ".wh..wh..opq":
+                yield LayerEntry(parent, OPAQUE)
+            elif base.startswith(".wh."):
+                yield LayerEntry(posixpath.join(parent, base[len(".wh."):]), WHITEOUT)
+            elif member.isfile():
+                yield LayerEntry(path, FILE, lambda member=member: layer.extractfile(member))
+
+def is_opaque_dir(path: str) -> bool:
+    for attribute in ("trusted.overlay.opaque", "user.overlay.opaque"):
+        try:
+            if os.getxattr(path, attribute, follow_symlinks=False) == b"y":
+                return True
+        except OSError:
+            continue
+    return False
+
+def iter_dir_layer(root: str, skip_dirs: Tuple[str, ...] = ()) -> Iterator[LayerEntry]:
+    #overlay diff directories mark deleted files with a 0/0 character device
+    #and replaced directories with an opaque xattr
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            relative = os.path.relpath(entry.path, root).replace(os.sep, "/")
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in skip_dirs:
+                    continue
+                if is_opaque_dir(entry.path):
+                    yield LayerEntry(relative, OPAQUE)
+                stack.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield LayerEntry(relative, FILE, lambda path=entry.path: open(path, 'rb'))
+            else:
+                st = entry.stat(follow_symlinks=False)
+                if stat.S_ISCHR(st.st_mode) and st.st_rdev == 0:
+                    yield LayerEntry(relative, WHITEOUT)
+
+class ImageSource():
+    name = ""
+
+    def layers(self) -> Iterator[Iterator[LayerEntry]]:
+        raise NotImplementedError
+
+class ArchiveImage(ImageSource):
+    """
+    An image saved with `podman save`, in either docker-archive or oci-archive format.
+    """
+    def __init__(self, archive: Path, name: str = None):
+        self.archive = archive
+        self.name = name or archive.stem
+
+    def read_json(self, outer: tarfile.TarFile, member: str):
+        with outer.extractfile(member) as fp:
+            return json.load(fp)
+
+    def layer_members(self, outer: tarfile.TarFile) -> List[str]:
+        names = outer.getnames()
+        if "manifest.json" in names:
+            manifest = self.read_json(outer, "manifest.json")[0]
+            if manifest.get("RepoTags"):
+                self.name = manifest["RepoTags"][0]
+            return manifest["Layers"]
+
+        #oci-archive: index -> (nested index ->) manifest -> layer blobs
+        descriptor = self.read_json(outer, "index.json")["manifests"][0]
+        self.name = descriptor.get("annotations", {}).get("org.opencontainers.image.ref.name", self.name)
+        manifest = self.read_json(outer, "blobs/" + descriptor["digest"].replace(":", "/"))
+        while "manifests" in manifest:
+            manifest = self.read_json(outer, "blobs/" + manifest["manifests"][0]["digest"].replace(":", "/"))
+        return ["blobs/" + layer["digest"].replace(":", "/") for layer in manifest["layers"]]
+
+    def layers(self) -> Iterator[Iterator[LayerEntry]]:
+        #the outer archive is uncompressed, so members are read in place
+        with tarfile.open(self.archive, mode="r:") as outer:
+            for member in self.layer_members(outer):
+                with outer.extractfile(member) as fileobj:
+                    yield iter_tar_layer(fileobj)
+
+class StorageImage(ImageSource):
+    """
+    An image in podman's local storage, read straight from the graphroot.
+    """
+    def __init__(self, graphroot: Path, driver: str, name: str, layer_chain: List[str]):
+        self.graphroot = graphroot
+        self.driver = driver
+        self.name = name
+        #bottom layer first
+        self.layer_chain = layer_chain
+
+    def layers(self) -> Iterator[Iterator[LayerEntry]]:
+        if self.driver == "vfs":
+            #every vfs layer is a full copy of the filesystem, so only the top one matters
+            yield iter_dir_layer(str(self.graphroot / "vfs" / "dir" / self.layer_chain[-1]))
+            return
+        for layer_id in self.layer_chain:
+            yield iter_dir_layer(str(self.graphroot / self.driver / layer_id / "diff"))
+
+class DirectorySource(ImageSource):
+    def __init__(self, path: Path, name: str = "directory"):
+        self.path = path
+        self.name = name
+
+    def layers(self) -> Iterator[Iterator[LayerEntry]]:
+        yield iter_dir_layer(str(self.path), skip_dirs=(".git",))
+
+def get_graphroot() -> Path:
+    try:
+        with open("/etc/containers/storage.conf", 'r') as fp:
+            match = re.search(r'^\s*graphroot\s*=\s*"([^"]+)"', fp.read(), re.MULTILINE)
+            if match:
+                return Path(match.group(1))
+    except OSError:
+        pass
+    return Path(DEFAULT_GRAPHROOT)
+
+def storage_images(graphroot: Path, all_images: bool = False) -> List[StorageImage]:
+    for driver in ("overlay", "vfs"):
+        images_file = graphroot / f"{driver}-images" / "images.json"
+        if images_file.exists():
+            break
+    else:
+        return []
+
+    with open(images_file, 'r') as fp:
+        images = json.load(fp)
+
+    parents = {}
+    for layers_name in ("layers.json", "volatile-layers.json"):
+        layers_file = graphroot / f"{driver}-layers" / layers_name
+        if layers_file.exists():
+            with open(layers_file, 'r') as fp:
+                parents.update({layer["id"]: layer.get("parent") for layer in json.load(fp)})
+
+    sources = []
+    for image in images:
+        names = image.get("names") or []
+        name = next((n for n in names if LME_IMAGE.match(n)), None)
+        if name is None:
+            if not all_images or not names:
+                continue
+            name = names[0]
+
+        chain = []
+        layer_id = image.get("layer")
+        while layer_id:
+            chain.append(layer_id)
+            layer_id = parents.get(layer_id)
+        sources.append(StorageImage(graphroot, driver, name, chain[::-1]))
+    return sources
+
+def archive_images(paths: List[Path]) -> List[ArchiveImage]:
+    sources = []
+    for path in paths:
+        if path.is_dir():
+            sources.extend(ArchiveImage(p) for p in sorted(path.glob("*.tar")))
+        else:
+            sources.append(ArchiveImage(path))
+    return sources
+
+class ImageContents():
+    """
+    Parsed manifests of an image, with the whiteouts of later layers applied.
+    """
+    def __init__(self):
+        #path -> (layer index, kind, checksums, parsed)
+        self.manifests: Dict[str, Tuple[int, str, Tuple[str, str], object]] = {}
+        self.whiteouts: Dict[str, int] = {}
+        self.opaque_dirs: Dict[str, int] = {}
+
+    def add_layer(self, index: int, entries: Iterator[LayerEntry]):
+        for entry in entries:
+            if entry.kind == WHITEOUT:
+                self.whiteouts[entry.path] = index
+            elif entry.kind == OPAQUE:
+                self.opaque_dirs[entry.path] = index
+            else:
+                kind = classify(entry.path)
+                if kind is None:
+                    continue
+                with entry.open() as fp:
+                    data = fp.read()
+                parsed = parse_os_release(data) if kind == "os-release" else parse_manifest(kind, entry.path, data)
+                self.manifests[entry.path] = (index, kind, file_checksums(data), parsed)
+
+    def is_deleted(self, path: str, layer: int) -> bool:
+        #a whiteout of the path or any parent, or an opaque parent, in a later layer hides it
+        if self.whiteouts.get(path, -1) > layer:
+            return True
+        parent = posixpath.dirname(path)
+        while parent:
+            if self.whiteouts.get(parent, -1) > layer or self.opaque_dirs.get(parent, -1) > layer:
+                return True
+            parent = posixpath.dirname(parent)
+        return False
+
+    def visible(self) -> Iterator[Tuple[str, str, Tuple[str, str], object]]:
+        for path in sorted(self.manifests):
+            layer, kind, checksums, parsed = self.manifests[path]
+            if not self.is_deleted(path, layer):
+                yield path, kind, checksums, parsed
+
+def output_name(image_name: str) -> str:
+    #localhost/kibana:LME_LATEST -> localhost-kibana, as the syft based script named them
+    repository, _, tag = image_name.rpartition(":") if ":" in image_name.split("/")[-1] else (image_name, "", "")
+    if tag and tag != "LME_LATEST":
+        repository = f"{repository}-{tag}"
+    return repository.replace("/", "-")
+
+def scan_image(source: ImageSource, output_dir: Path) -> Tuple[str, Path, int, float]:
+    #runs in a worker process, one image per worker
+    start = time.monotonic()
+    contents = ImageContents()
+    for index, entries in enumerate(source.layers()):
+        contents.add_layer(index, entries)
+
+    visible = list(contents.visible())
+    os_info = next((parsed for _, kind, _, parsed in visible if kind == "os-release"), {})
+
+    sbom = Sbom(name=f"{source.name} Container SBOM", root_name=source.name, creator="container-sbom-generator")
+    root = PurePosixPath("/")
+    package_count = 0
+    for path, kind, checksums, parsed in visible:
+        if kind == "os-release" or not parsed:
+            continue
+        file_path = root / path
+        part = SbomPart(sbom.root_package_id)
+        spdx_file_id = part.add_file(file_path, root, checksums)
+        for name, version, pkg_type, namespace in parsed:
+            part.add_package(Package(name, version, file_path, pkg_type, os_info, namespace), spdx_file_id)
+            package_count += 1
+        sbom.add_part(part)
+
+    output_file = output_dir / f"{output_name(source.name)}.json"
+    sbom.save(output_file)
+    return source.name, output_file, package_count, time.monotonic() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate SPDX SBOMs for the LME container images without a container daemon")
+    parser.add_argument("--archive", action="append", type=Path, default=[],
+                        help="Image archive saved with `podman save`, or a directory of them such as offline_resources/container_images. "
+                             "Can be repeated. When given, podman storage is not read")
+    parser.add_argument("--graphroot", type=Path, default=None, help="Podman storage root (default: graphroot from /etc/containers/storage.conf)")
+    parser.add_argument("--all-images", action="store_true", help="Include every image in podman storage, not just localhost/*:LME_LATEST")
+    parser.add_argument("--dir", action="append", type=Path, default=[], help="Also scan a directory tree, e.g. the LME checkout. Can be repeated")
+    parser.add_argument("--workers", type=int, default=None, help="Number of images scanned at once (default: CPU count)")
+    parser.add_argument("--output-dir", type=Path, default=Path(os.path.realpath(__file__)).parent / "output")
+    args = parser.parse_args()
+
+    if args.archive:
+        sources = archive_images(args.archive)
+    else:
+        graphroot = args.graphroot or get_graphroot()
+        try:
+            sources = storage_images(graphroot, args.all_images)
+        except PermissionError:
+            print(f"Cannot read {graphroot}, run as root to read podman storage", file=sys.stderr)
+            return 1
+        if not sources:
+            print(f"No images found in {graphroot}", file=sys.stderr)
+
+    for i, directory in enumerate(args.dir):
+        sources.append(DirectorySource(directory, "directory" if i == 0 else f"directory-{i}"))
+
+    if not sources:
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.monotonic()
+    failed = 0
+    workers = min(args.workers or multiprocessing.cpu_count(), len(sources))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(scan_image, source, args.output_dir): source for source in sources}
+        for future in as_completed(futures):
+            try:
+                name, output_file, package_count, elapsed = future.result()
+            except Exception as e:
+                #any error is confined to its image, the others are still written
+                print(f"Failed to scan {futures[future].name}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            print(f"{name}: {package_count} packages in {elapsed:.1f}s")
+
+    print(f"SBOM generation completed in {time.monotonic() - start:.1f}s. View generated SBOMs in {args.output_dir}.")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
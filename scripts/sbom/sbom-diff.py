@@ -0,0 +1,89 @@
+import sys
+import json
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+#package identity used to match packages between two documents. Generated SPDX ids
+#hash in the version, so spdxid matches exact versions and never reports a change
+KEYS = ("purl", "spdxid", "name")
+
+def package_purl(package: Dict) -> str:
+    for ref in package.get("externalRefs", []):
+        if ref.get("referenceType") == "purl" and ref.get("referenceLocator", "NOASSERTION") != "NOASSERTION":
+            return ref["referenceLocator"]
+    return ""
+
+def purl_without_version(purl: str) -> str:
+    #pkg:type/namespace/name@version?qualifiers#subpath -> pkg:type/namespace/name
+    purl = purl.split("#", 1)[0].split("?", 1)[0]
+    #"@" in a namespace is always encoded, so only the version separator is left
+    return purl.rsplit("@", 1)[0] if "@" in purl else purl
+
+def package_key(package: Dict, key: str) -> str:
+    if key == "spdxid":
+        return package.get("SPDXID", "")
+    if key == "purl":
+        purl = package_purl(package)
+        if purl:
+            return purl_without_version(purl)
+    #packages without a purl are matched by name
+    return package.get("name", "")
+
+def index_packages(document: Dict, key: str) -> Dict[str, Set[str]]:
+    """
+    Maps each package key to the set of versions it appears with. Packages
+    without external references (the document root) are not indexed.
+    """
+    index = defaultdict(set)
+    for package in document.get("packages", []):
+        if "externalRefs" not in package:
+            continue
+        index[package_key(package, key)].add(package.get("versionInfo", "NOASSERTION"))
+    return index
+
+def diff_packages(old: Dict[str, Set[str]], new: Dict[str, Set[str]]) -> Tuple[List, List, List]:
+    added = [(k, sorted(new[k])) for k in sorted(new.keys() - old.keys())]
+    removed = [(k, sorted(old[k])) for k in sorted(old.keys() - new.keys())]
+    changed = [(k, sorted(old[k]), sorted(new[k])) for k in sorted(old.keys() & new.keys()) if old[k] != new[k]]
+    return added, removed, changed
+
+def load_document(path: str) -> Dict:
+    with open(path, 'r') as fp:
+        return json.load(fp)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the packages of two SPDX json SBOMs")
+    parser.add_argument("old", help="SBOM of the previous release")
+    parser.add_argument("new", help="SBOM of the new release")
+    parser.add_argument("--key", choices=KEYS, default="purl",
+                        help="How packages are matched: purl without version (default), SPDX id, or name. "
+                             "SPDX ids are derived from the version, so a new version is a removal and an addition")
+    parser.add_argument("--json", action="store_true", help="Print the differences as JSON")
+    args = parser.parse_args()
+
+    old = index_packages(load_document(args.old), args.key)
+    new = index_packages(load_document(args.new), args.key)
+    added, removed, changed = diff_packages(old, new)
+
+    if args.json:
+        print(json.dumps({
+            "added": [{"package": k, "versions": v} for k, v in added],
+            "removed": [{"package": k, "versions": v} for k, v in removed],
+            "changed": [{"package": k, "old_versions": o, "new_versions": n} for k, o, n in changed],
+        }, indent=2))
+    else:
+        for k, versions in added:
+            print(f"+ {k} {', '.join(versions)}")
+        for k, versions in removed:
+            print(f"- {k} {', '.join(versions)}")
+        for k, old_versions, new_versions in changed:
+            print(f"~ {k} {', '.join(old_versions)} -> {', '.join(new_versions)}")
+        print(f"{len(added)} added, {len(removed)} removed, {len(changed)} changed "
+              f"({len(old)} packages before, {len(new)} after)")
+
+    #exit like diff: 1 when the documents differ
+    return 1 if added or removed or changed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
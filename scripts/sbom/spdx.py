@@ -0,0 +1,221 @@
+import re
+import json
+import uuid
+import shutil
+import hashlib
+import tempfile
+import datetime
+from typing import Dict, TextIO, Tuple
+from pathlib import PurePath
+
+#characters allowed in an SPDX id, "_" is kept so ids of existing SBOMs do not change
+SPDX_ID_INVALID = re.compile(r'[^A-Za-z0-9.\-_]')
+
+def file_checksums(filedata: bytes) -> Tuple[str, str]:
+    return hashlib.sha1(filedata).hexdigest(), hashlib.sha256(filedata).hexdigest()
+
+class Package():
+    def __init__(self, name: str, version: str, file: PurePath, pkg_type: str, os_info: Dict[str, str] = None, namespace: str = None):
+        self.name = name
+        self.version = version
+        self.file = file
+        self.package_type = pkg_type
+        self.os_info = os_info or {}
+        #maven group id or npm scope, only part of the purl
+        self.namespace = namespace
+
+        self.hash_string = self.make_hash_string()
+        self.reference_locator = self.get_reference_locator()
+        self.spdx_id = self.get_spdx_id()
+
+    def get_reference_locator(self) -> str:
+        reference_locator = "NOASSERTION"
+
+        if self.package_type == "rpm":
+            # For Red Hat-based systems
+            os_name = self.os_info.get("name", "").lower()
+            if 'red hat' in os_name or 'rhel' in os_name:
+                reference_locator = f"pkg:rpm/redhat/{self.name}"
+            elif 'centos' in os_name:
+                reference_locator = f"pkg:rpm/centos/{self.name}"
+            elif 'fedora' in os_name:
+                reference_locator = f"pkg:rpm/fedora/{self.name}"
+            elif 'amazon' in os_name:
+                reference_locator = f"pkg:rpm/amzn/{self.name}"
+            else:
+                reference_locator = f"pkg:rpm/{self.name}"
+        elif self.package_type == "deb":
+            # For Debian-based systems
+            os_name = self.os_info.get("name", "").lower()
+            if 'ubuntu' in os_name:
+                reference_locator = f"pkg:deb/ubuntu/{self.name}"
+            elif 'debian' in os_name:
+                reference_locator = f"pkg:deb/debian/{self.name}"
+            else:
+                reference_locator = f"pkg:deb/{self.name}"
+        elif self.package_type == "apk":
+            reference_locator = f"pkg:apk/alpine/{self.name}"
+        elif self.package_type == "nix":
+            reference_locator = f"pkg:nix/{self.name}"
+        elif self.package_type in ("pypi", "npm", "maven", "gem"):
+            #npm scopes start with "@", which purl requires to be encoded
+            namespace = self.namespace.replace("@", "%40") + "/" if self.namespace else ""
+            reference_locator = f"pkg:{self.package_type}/{namespace}{self.name}"
+
+        #if version specified, add to reference locator
+        if self.version not in ["", "unknown", "NOASSERTION"]:
+            reference_locator += f"@{self.version}"
+        return reference_locator
+
+    def make_hash_string(self) -> str:
+        hash_string = f"{self.name}{self.version}{str(self.file)}"
+        if self.namespace:
+            hash_string = f"{self.namespace}/{hash_string}"
+        hash_obj = hashlib.sha1()
+        hash_obj.update(hash_string.encode('utf-8'))
+        hash = hash_obj.hexdigest()
+        return hash
+
+    def get_spdx_id(self) -> str:
+        name = f"{self.name}-{self.hash_string[:10]}"
+        spdx_id = f"SPDXRef-Package-{name.replace('-','').replace('_','')}"
+
+        return SPDX_ID_INVALID.sub('', spdx_id)
+
+class SbomPart():
+    def __init__(self, root_package_id: str):
+        self.root_package_id = root_package_id
+
+        self.files = list()
+        self.packages = list()
+        self.relationships = list()
+
+    def add_file(self, file_path: PurePath, base_dir: PurePath, checksums: Tuple[str, str] = None) -> str:
+        #checksums is (sha1, sha256) when the caller has already read the file
+        if checksums is None:
+            with open(file_path, 'rb') as fp:
+                filedata = fp.read()
+                checksums = file_checksums(filedata)
+        sha_1_hash, sha_256_hash = checksums
+
+        relative_path = file_path.relative_to(base_dir)
+        file_id = '-'.join(relative_path.parts[:-1]) + '-' + relative_path.name.split('.')[0]
+        spdx_file_id = SPDX_ID_INVALID.sub('', f"SPDXRef-File-{file_id}-{sha_1_hash[:10]}")
+
+        self.files.append( {
+            "SPDXID": spdx_file_id,
+            "fileName": str(file_path),
+            "checksums": [
+                {"algorithm": "SHA256", "checksumValue": sha_256_hash},
+                {"algorithm": "SHA1", "checksumValue": sha_1_hash},
+            ],
+            "fileTypes": ["SOURCE"],
+            "copyrightText": "NOASSERTION"
+        })
+
+        self.relationships.append({
+            "spdxElementId": self.root_package_id,
+            "relatedSpdxElement": spdx_file_id,
+            "relationshipType": "DESCRIBES"
+        })
+
+        return spdx_file_id
+
+    def add_package(self, package: Package, spdx_file_id: str):
+        package_spdx = {
+            "SPDXID": package.spdx_id,
+            "name": package.name,
+            "downloadLocation":"NOASSERTION",
+            "filesAnalyzed": False,
+            "supplier": "NOASSERTION",
+            "versionInfo": package.version,
+            "externalRefs": [{
+                "referenceCategory": "PACKAGE_MANAGER",
+                "referenceType" :"purl",
+                "referenceLocator": package.reference_locator
+            }]
+        }
+        self.packages.append(package_spdx)
+
+        self.relationships.append({
+            "spdxElementId": package.spdx_id,
+            "relatedSpdxElement": spdx_file_id,
+            "relationshipType": "GENERATED_FROM"
+        })
+
+class SpdxSection():
+    """
+    One top level array of the document, spooled as JSON as entries arrive.
+    Small documents stay in memory, large ones spill to a temporary file.
+    """
+    SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+    def __init__(self):
+        self.spool = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_SIZE, mode='w+')
+        self.count = 0
+
+    def write(self, entry: Dict):
+        if self.count:
+            self.spool.write(",")
+        json.dump(entry, self.spool)
+        self.count += 1
+
+    def copy_to(self, fp: TextIO):
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, fp)
+
+    def close(self):
+        self.spool.close()
+
+class Sbom():
+    SECTIONS = ("files", "packages", "relationships")
+
+    def __init__(self, name: str = "Ansible Install Playbook SBOM", root_name: str = "Ansible-Deployment-Root", creator: str = "ansible-sbom-generator"):
+        self.root_package_id = "SPDXRef-Package-Document"
+        self.data = {
+            "spdxVersion": "SPDX-2.3",
+            "dataLicense": "CC0-1.0",
+            "SPDXID": "SPDXRef-DOCUMENT",
+            "name": name,
+            #TODO: change document namespace?
+            "documentNamespace": f"https://spdx.org/spdxdocs/spdx-tools-v1.2-{uuid.uuid4()}",
+            "creationInfo": {
+                "created": datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "creators": [f"Tool: {creator}"]
+            },
+        }
+        #files, packages and relationships are written out as parts are added
+        #instead of being held in self.data
+        self.sections = {section: SpdxSection() for section in self.SECTIONS}
+
+        self.sections["packages"].write({
+            "SPDXID": self.root_package_id,
+            "name": root_name,
+            "downloadLocation": "NOASSERTION",
+            "filesAnalyzed": False,
+        })
+        self.sections["relationships"].write({
+            "spdxElementId": "SPDXRef-DOCUMENT",
+            "relatedSpdxElement": self.root_package_id,
+            "relationshipType": "DESCRIBES",
+        })
+
+    def add_part(self, part: SbomPart):
+        for section, entries in (("files", part.files), ("packages", part.packages), ("relationships", part.relationships)):
+            for entry in entries:
+                self.sections[section].write(entry)
+
+    def save(self, output_file: PurePath):
+        header = json.dumps(self.data)
+        with open(output_file, 'w') as fp:
+            #the header object without its closing brace, then each spooled array
+            fp.write(header[:-1])
+            for section in self.SECTIONS:
+                fp.write(f', "{section}": [')
+                self.sections[section].copy_to(fp)
+                fp.write("]")
+            fp.write("}")
+
+        for section in self.sections.values():
+            section.close()
+        print(f"Sbom saved to {output_file}")
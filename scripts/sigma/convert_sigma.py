@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Converts Sigma rules to Kibana detection rules (siem_rule_ndjson), one
+output file per OS, with the transforms of postprocess_rules.py applied. Each rule file is converted on its own, in a process
+pool, and the result is cached under its sha256, so a rerun against a new
+Sigma release only converts the rules that changed.
+
+Needs pySigma and the elasticsearch backend, run it with the python of the
+sigma-cli pipx environment.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from postprocess_rules import transform_line, transforms_for
+
+TARGET = "lucene"
+OUTPUT_FORMAT = "siem_rule_ndjson"
+CACHE_DIR = ".cache"
+
+# OS -> rules directory and processing pipelines, as the sigma convert calls used them
+PROFILES = {
+    "windows": {"directory": "windows", "pipelines": ["ecs_windows"]},
+    "macos": {"directory": "macos", "pipelines": []},
+    "linux": {"directory": "linux", "pipelines": []},
+}
+
+_backend = None
+
+
+def tool_versions() -> Dict[str, str]:
+    versions = {}
+    for package in ("pySigma", "pySigma-backend-elasticsearch"):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = "unknown"
+    return versions
+
+
+def init_worker(pipelines: List[str]):
+    """Builds the backend once per worker process, plugin discovery is slow."""
+    global _backend
+    from sigma.plugins import InstalledSigmaPlugins
+
+    plugins = InstalledSigmaPlugins.autodiscover()
+    pipeline = plugins.get_pipeline_resolver().resolve(pipelines) if pipelines else None
+    backend_class = plugins.backends[TARGET]
+    _backend = backend_class(processing_pipeline=pipeline) if pipeline else backend_class()
+
+
+def convert_rule(path: str) -> Tuple[str, List[str], Optional[str], bool]:
+    """
+    Returns:
+        (path, NDJSON lines, error, cacheable). Rules pySigma rejects give no
+        lines and an error, like --skip-unsupported. Other failures (e.g. the
+        MITRE ATT&CK data cannot be downloaded) are not cached.
+    """
+    from sigma.collection import SigmaCollection
+    from sigma.exceptions import SigmaError
+
+    try:
+        collection = SigmaCollection.from_yaml(Path(path).read_text())
+        output = _backend.convert(collection, OUTPUT_FORMAT)
+    except SigmaError as e:
+        return path, [], str(e), True
+    except Exception as e:
+        return path, [], f"{type(e).__name__}: {e}", False
+
+    if isinstance(output, dict):
+        output = [output]
+    if isinstance(output, str):
+        return path, [line for line in output.splitlines() if line.strip()], None, True
+    return path, [json.dumps(rule) for rule in output], None, True
+
+
+def file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def find_rules(rules_dir: Path, directory: str) -> List[Path]:
+    if (rules_dir / directory).is_dir():
+        return sorted((rules_dir / directory).rglob("*.yml"))
+    # Older archives do not split the rules by OS
+    return sorted(p for p in rules_dir.rglob("*.yml") if directory in str(p.relative_to(rules_dir)).lower())
+
+
+class Cache:
+    """
+    Converted NDJSON per rule file, keyed by path and checked against the
+    file's sha256. It is dropped when pySigma, the backend or the profile changes.
+    """
+    def __init__(self, path: Path, key: Dict):
+        self.path = path
+        self.key = key
+        self.entries: Dict[str, Dict] = {}
+        if path.exists():
+            with open(path, 'r') as fp:
+                data = json.load(fp)
+            if data.get("key") == key:
+                self.entries = data["rules"]
+
+    def get(self, relative: str, sha256: str) -> Optional[Dict]:
+        entry = self.entries.get(relative)
+        return entry if entry is not None and entry["sha256"] == sha256 else None
+
+    def put(self, relative: str, sha256: str, lines: List[str], error: Optional[str]):
+        self.entries[relative] = {"sha256": sha256, "lines": lines, "error": error}
+
+    def save(self, keep: List[str]):
+        # Rules removed from the release are dropped from the cache too
+        rules = {relative: self.entries[relative] for relative in keep if relative in self.entries}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as fp:
+            json.dump({"key": self.key, "rules": rules}, fp)
+        os.replace(tmp_path, self.path)
+
+
+def convert_os(os_name: str, rules_dir: Path, output_dir: Path, workers: int) -> Dict:
+    profile = PROFILES[os_name]
+    rules = find_rules(rules_dir, profile["directory"])
+    stats = {"rules": len(rules), "cached": 0, "converted": 0, "unsupported": 0, "failed": 0, "output": 0}
+    if not rules:
+        print(f"No {os_name} rules found")
+        return stats
+
+    key = {"target": TARGET, "format": OUTPUT_FORMAT, "pipelines": profile["pipelines"], **tool_versions()}
+    cache = Cache(output_dir / CACHE_DIR / f"{os_name}.json", key)
+
+    relatives = [str(p.relative_to(rules_dir)) for p in rules]
+    hashes = {relative: file_sha256(rules_dir / relative) for relative in relatives}
+    changed = [relative for relative in relatives if cache.get(relative, hashes[relative]) is None]
+    stats["cached"] = len(relatives) - len(changed)
+    print(f"Found {len(rules)} {os_name} rules, {len(changed)} new or changed")
+
+    if changed:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(profile["pipelines"],)) as pool:
+            paths = [str(rules_dir / relative) for relative in changed]
+            for path, lines, error, cacheable in pool.map(convert_rule, paths, chunksize=16):
+                relative = str(Path(path).relative_to(rules_dir))
+                if not cacheable:
+                    if stats["failed"] < 5:
+                        print(f"  {relative}: {error}")
+                    stats["failed"] += 1
+                    continue
+                cache.put(relative, hashes[relative], lines, error)
+                stats["converted"] += 1
+        cache.save(relatives)
+
+    # The cache keeps the converter's output, the Kibana transforms are applied on the way out
+    transforms = transforms_for(os_name)
+    output_path = output_dir / f"sigma_{os_name}_rules.ndjson"
+    with open(output_path, 'w') as fp:
+        for relative in relatives:
+            entry = cache.get(relative, hashes[relative])
+            if entry is None:
+                continue
+            if entry["error"] is not None or not entry["lines"]:
+                stats["unsupported"] += 1
+            for line in entry["lines"]:
+                fp.write(transform_line(line, transforms) + "\n")
+                stats["output"] += 1
+
+    if stats["output"] == 0:
+        output_path.unlink()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert Sigma rules to Kibana detection rules with a per-rule cache')
+    parser.add_argument('-r', '--rules', default='sigma/rules', help='Sigma rules directory (default: sigma/rules)')
+    parser.add_argument('-o', '--output', default='output', help='Output directory (default: output)')
+    parser.add_argument('--os', nargs='+', choices=list(PROFILES), default=list(PROFILES), help='OSes to convert (default: all)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 4, help='Worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    rules_dir = Path(args.rules)
+    if not rules_dir.is_dir():
+        print(f"Error: Could not find Sigma rules directory {rules_dir}")
+        return 1
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    failed = False
+    for os_name in args.os:
+        stats = convert_os(os_name, rules_dir, output_dir, args.workers)
+        if stats["rules"] and stats["output"]:
+            print(f"SUCCESS: {stats['output']} {os_name} rules converted "
+                  f"({stats['cached']} from cache, {stats['converted']} converted, {stats['unsupported']} unsupported, "
+                  f"{stats['failed']} failed)")
+        elif stats["rules"]:
+            print(f"ERROR: 0 {os_name} rules converted")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
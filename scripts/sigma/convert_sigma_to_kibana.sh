@@ -3,10 +3,12 @@
 # Convert Sigma Rules to Kibana - Standalone Script
 # This script downloads the latest Sigma rules, converts them to Kibana-compatible NDJSON format,
 # and optionally uploads them to a running Kibana instance
-# If ran again will only upload NEW rules.
+# If ran again will only convert changed rules and upload NEW rules.
 
 set -e
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
 echo "Starting Sigma to Kibana conversion..."
 
 if ! command -v python3 &> /dev/null; then
@@ -153,104 +155,18 @@ echo "CONVERTING SIGMA RULES TO KIBANA FORMAT"
 echo "=========================================="
 echo ""
 
-echo "Converting Sigma Windows rules to Kibana format..."
-
-if [ -d "sigma/rules/windows" ]; then
-    find ./sigma/rules/windows -type f -name "*.yml" > windows_rules.txt
-elif [ -d "sigma/rules" ]; then
-    find ./sigma/rules -type f -name "*.yml" | grep -i windows > windows_rules.txt
-else
-    echo "Error: Could not find Sigma rules directory"
-    exit 1
-fi
-
-if [ ! -s windows_rules.txt ]; then
-    echo "Error: No Windows rules found"
-    echo "Available rule files:"
-    find sigma -name "*.yml" -type f | head -10
-    exit 1
-fi
-
-echo "Found $(wc -l < windows_rules.txt) Windows rules"
-
-echo "Converting Windows rules..."
-if sigma convert -t lucene -p ecs_windows -f siem_rule_ndjson --skip-unsupported $(cat windows_rules.txt) > output/sigma_windows_rules.ndjson 2>/dev/null; then
-    if [ -f "output/sigma_windows_rules.ndjson" ] && [ -s "output/sigma_windows_rules.ndjson" ]; then
-        echo "SUCCESS: $(wc -l < output/sigma_windows_rules.ndjson) Windows rules converted"
-    else
-        echo "ERROR: 0 Windows rules converted"
-        rm -f output/sigma_windows_rules.ndjson
-    fi
-else
-    echo "ERROR: Windows conversion failed"
+# sigma-cli runs from its own pipx environment, which is where pySigma and the plugin are installed
+SIGMA_PYTHON=$(head -n 1 "$(command -v sigma)" | sed 's/^#!//')
+if [ ! -x "$SIGMA_PYTHON" ]; then
+    SIGMA_PYTHON=python3
 fi
 
-echo ""
-echo "=========================================="
-echo ""
-
-echo "Converting Sigma macOS rules to Kibana format..."
-
-find ./sigma/rules/macos -type f -name "*.yml" > macos_rules.txt
-
-if [ -s macos_rules.txt ]; then
-    echo "Found $(wc -l < macos_rules.txt) macOS rules"
-    echo "Converting macOS rules..."
-    if sigma convert -t lucene -f siem_rule_ndjson --without-pipeline --skip-unsupported $(cat macos_rules.txt) > output/sigma_macos_rules.ndjson 2>/dev/null; then
-        if [ -f "output/sigma_macos_rules.ndjson" ] && [ -s "output/sigma_macos_rules.ndjson" ]; then
-            echo "SUCCESS: $(wc -l < output/sigma_macos_rules.ndjson) macOS rules converted"
-        else
-            echo "ERROR: 0 macOS rules converted"
-            rm -f output/sigma_macos_rules.ndjson
-        fi
-    else
-        echo "ERROR: macOS conversion failed"
-    fi
-else
-    echo "No macOS rules found"
+# Unchanged rules are reused from output/.cache, only new and changed rules are converted.
+# Tags, severity and enabled are rewritten for Kibana as the output is written, see postprocess_rules.py
+if ! "$SIGMA_PYTHON" "$SCRIPT_DIR/convert_sigma.py" --rules sigma/rules --output output; then
+    echo "ERROR: Some rules could not be converted"
 fi
 
-echo ""
-echo "=========================================="
-echo ""
-
-echo "Converting Sigma Linux rules to Kibana format..."
-
-find ./sigma/rules/linux -type f -name "*.yml" > linux_rules.txt
-
-if [ -s linux_rules.txt ]; then
-    echo "Found $(wc -l < linux_rules.txt) Linux rules"
-    echo "Converting Linux rules..."
-    if sigma convert -t lucene -f siem_rule_ndjson --without-pipeline --skip-unsupported $(cat linux_rules.txt) > output/sigma_linux_rules.ndjson 2>/dev/null; then
-        if [ -f "output/sigma_linux_rules.ndjson" ] && [ -s "output/sigma_linux_rules.ndjson" ]; then
-            echo "SUCCESS: $(wc -l < output/sigma_linux_rules.ndjson) Linux rules converted"
-        else
-            echo "ERROR: 0 Linux rules converted"
-            rm -f output/sigma_linux_rules.ndjson
-        fi
-    else
-        echo "ERROR: Linux conversion failed"
-    fi
-else
-    echo "No Linux rules found"
-fi
-
-echo "Modifying rules for Kibana compatibility..."
-
-if [ -f "output/sigma_windows_rules.ndjson" ]; then
-    sed -i 's/"tags": \[[^]]*\]/"tags": ["Sigma Windows"]/g; s/"severity": "informational"/"severity": "low"/g; s/"enabled": true/"enabled": false/g' output/sigma_windows_rules.ndjson
-fi
-
-if [ -f "output/sigma_macos_rules.ndjson" ]; then
-    sed -i 's/"tags": \[[^]]*\]/"tags": ["Sigma macOS"]/g; s/"severity": "informational"/"severity": "low"/g; s/"enabled": true/"enabled": false/g' output/sigma_macos_rules.ndjson
-fi
-
-if [ -f "output/sigma_linux_rules.ndjson" ]; then
-    sed -i 's/"tags": \[[^]]*\]/"tags": ["Sigma Linux"]/g; s/"severity": "informational"/"severity": "low"/g; s/"enabled": true/"enabled": false/g' output/sigma_linux_rules.ndjson
-fi
-
-rm -f windows_rules.txt macos_rules.txt linux_rules.txt
-
 echo ""
 echo "=========================================="
 echo "CONVERSION COMPLETE"
@@ -288,43 +204,13 @@ if [[ $upload_choice =~ ^[Yy]$ ]]; then
         echo "Found Elasticsearch credentials"
         echo ""
 
-        for rule_file in output/sigma_*_rules.ndjson; do
-            if [ -f "$rule_file" ]; then
-                os_type=$(basename "$rule_file" | sed 's/sigma_\(.*\)_rules\.ndjson/\1/')
-
-                echo "Uploading $os_type rules this will take a few moments do not stop the process..."
-
-                UPLOAD_RESULT=$(curl -s -k -X POST \
-                    -u "${ELASTIC_USERNAME}:${ELASTIC_PASSWORD}" \
-                    "https://localhost:5601/api/detection_engine/rules/_import" \
-                    -H "kbn-xsrf: true" \
-                    -H "Content-Type: multipart/form-data" \
-                    --form file=@"$rule_file")
-
-                if echo "$UPLOAD_RESULT" | grep -q "rules_count\|success_count\|created_count\|updated_count\|rules_installed"; then
-                    echo "SUCCESS: $os_type rules uploaded"
-                else
-                    echo "WARNING: Upload may have failed, trying alternative method..."
-
-                    UPLOAD_RESULT2=$(sudo -i podman exec lme-elasticsearch bash -c "
-                        curl -s -X POST 'kibana:5601/api/detection_engine/rules/_import' \
-                        -H 'kbn-xsrf: true' \
-                        -H 'Content-Type: multipart/form-data' \
-                        -u \"\${ELASTIC_USERNAME}:\${ELASTIC_PASSWORD}\" \
-                        --form file=@<(cat > /tmp/upload.ndjson <<'EOF'
-$(cat "$rule_file")
-EOF
-cat /tmp/upload.ndjson && rm -f /tmp/upload.ndjson)
-                    ")
-
-                    if echo "$UPLOAD_RESULT2" | grep -q "rules_count\|success_count\|created_count\|updated_count\|rules_installed"; then
-                        echo "SUCCESS: $os_type rules uploaded via container network"
-                    else
-                        echo "ERROR: Both upload methods failed for $os_type"
-                    fi
-                fi
-            fi
-        done
+        # Only new and changed rules are uploaded, in batches, see upload_rules.py
+        if ELASTIC_USERNAME="$ELASTIC_USERNAME" ELASTIC_PASSWORD="$ELASTIC_PASSWORD" \
+            python3 "$SCRIPT_DIR/upload_rules.py" output/sigma_*_rules.ndjson; then
+            echo "SUCCESS: rules uploaded"
+        else
+            echo "ERROR: Some rules could not be uploaded, run the script again to retry them"
+        fi
 
     else
         echo "ERROR: Could not get Elasticsearch credentials"
@@ -350,5 +236,7 @@ fi
 echo ""
 echo "IMPORTANT: All rules are disabled by default for security"
 echo "Review and enable rules individually in Kibana"
+echo "To see what the rules would cost the cluster and enable the ones that fit a budget:"
+echo "   python3 $SCRIPT_DIR/estimate_rule_cost.py output/sigma_*_rules.ndjson --budget 1000 [--apply]"
 echo ""
 echo "Script completed successfully!"
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Estimates what converted Sigma rules would cost the cluster before they are
+enabled. Each rule's query runs once against a recent window of logs-* with
+profile: true and a bounded timeout. Rules are ranked by query time and hit
+rate, and an enable plan is written that fits a search time budget.
+
+The plan can be applied with --apply, which enables the selected rules in
+Kibana in bulk.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from upload_rules import ApiClient, ApiError
+
+SEVERITY_ORDER = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+ENABLE = "enable"
+OVER_BUDGET = "over_budget"
+NOISY = "noisy"
+TIMED_OUT = "timed_out"
+ERROR = "error"
+UNSUPPORTED = "unsupported"
+
+
+def parse_duration(value: str, default: int) -> int:
+    """Seconds in 5m, now-5m or 1h style durations."""
+    match = re.search(r"(\d+)([smhd])$", value or "")
+    return int(match.group(1)) * UNITS[match.group(2)] if match else default
+
+
+def profile_nanos(profile: Dict) -> Dict[str, int]:
+    """Query, rewrite and collector time summed over shards, and the slowest shard."""
+    total = slowest = 0
+    for shard in profile.get("shards", []):
+        shard_nanos = 0
+        for search in shard.get("searches", []):
+            shard_nanos += sum(q.get("time_in_nanos", 0) for q in search.get("query", []))
+            shard_nanos += search.get("rewrite_time", 0)
+            shard_nanos += sum(c.get("time_in_nanos", 0) for c in search.get("collector", []))
+        total += shard_nanos
+        slowest = max(slowest, shard_nanos)
+    return {"total": total, "slowest_shard": slowest}
+
+
+def measure_rule(client: ApiClient, rule: Dict, index: str, window: str, timeout: str) -> Dict:
+    interval = parse_duration(rule.get("interval"), 300)
+    # Kibana looks back from "from" plus the extra meta.from to cover gaps between runs
+    lookback = parse_duration(rule.get("from"), 360) + parse_duration((rule.get("meta") or {}).get("from"), 0)
+    result = {
+        "rule_id": rule["rule_id"],
+        "name": rule.get("name"),
+        "severity": rule.get("severity", "low"),
+        "interval_seconds": interval,
+        "lookback_seconds": lookback,
+    }
+    if rule.get("type") != "query" or rule.get("language") != "lucene":
+        return dict(result, decision=UNSUPPORTED, reason=f"{rule.get('type')}/{rule.get('language')} rules are not measured")
+
+    body = {
+        "size": 0,
+        "timeout": timeout,
+        "track_total_hits": True,
+        "profile": True,
+        "query": {"bool": {"filter": [
+            {"query_string": {"query": rule["query"], "analyze_wildcard": True}},
+            {"range": {"@timestamp": {"gte": f"now-{window}"}}},
+        ]}},
+    }
+    try:
+        response = client.request("POST", f"{index}/_search", params=[("request_cache", "false")],
+                                  data=json.dumps(body).encode())
+    except ApiError as e:
+        return dict(result, decision=ERROR, reason=str(e)[:300])
+
+    nanos = profile_nanos(response.get("profile", {}))
+    result.update(
+        took_ms=response.get("took", 0),
+        query_ms=round(nanos["total"] / 1e6, 3),
+        slowest_shard_ms=round(nanos["slowest_shard"] / 1e6, 3),
+        hits=response["hits"]["total"]["value"],
+        timed_out=response.get("timed_out", False),
+    )
+    if result["timed_out"]:
+        result.update(decision=TIMED_OUT, reason=f"query did not finish within {timeout}")
+    return result
+
+
+def make_plan(results: List[Dict], window_seconds: int, budget_ms: float, max_hits_per_hour: float) -> Dict:
+    """
+    Scales each measured query to the rule's own lookback and schedule, as
+    search time per minute, then enables rules by severity and, within a
+    severity, cheapest first until the budget is used.
+    """
+    for result in results:
+        if "decision" in result:
+            continue
+        # Query time grows roughly with the documents in range
+        per_run_ms = result["query_ms"] * result["lookback_seconds"] / window_seconds
+        result["ms_per_minute"] = round(per_run_ms * 60 / result["interval_seconds"], 3)
+        result["hits_per_hour"] = round(result["hits"] * 3600 / window_seconds, 1)
+        if max_hits_per_hour and result["hits_per_hour"] > max_hits_per_hour:
+            result.update(decision=NOISY, reason=f"{result['hits_per_hour']} matches per hour")
+
+    candidates = sorted(
+        (r for r in results if "decision" not in r),
+        key=lambda r: (SEVERITY_ORDER.get(r["severity"], len(SEVERITY_ORDER)), r["ms_per_minute"]),
+    )
+    used = 0.0
+    for result in candidates:
+        if used + result["ms_per_minute"] <= budget_ms:
+            used += result["ms_per_minute"]
+            result["decision"] = ENABLE
+        else:
+            result.update(decision=OVER_BUDGET, reason="does not fit the remaining budget")
+
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result["decision"]] = counts.get(result["decision"], 0) + 1
+    return {
+        "budget_ms_per_minute": budget_ms,
+        "used_ms_per_minute": round(used, 3),
+        "sample_window_seconds": window_seconds,
+        "counts": counts,
+        "enable": [r["rule_id"] for r in results if r["decision"] == ENABLE],
+        "rules": sorted(results, key=lambda r: -r.get("ms_per_minute", r.get("query_ms", 0))),
+    }
+
+
+def load_rules(paths: List[str]) -> List[Dict]:
+    rules = {}
+    for path in paths:
+        with open(path, 'r') as fp:
+            for line in fp:
+                if line.strip():
+                    rule = json.loads(line)
+                    rules.setdefault(rule["rule_id"], rule)
+    return list(rules.values())
+
+
+def enable_rules(kibana: ApiClient, rule_ids: List[str], batch: int = 100) -> int:
+    enabled = 0
+    for i in range(0, len(rule_ids), batch):
+        ids = " OR ".join(json.dumps(rule_id) for rule_id in rule_ids[i:i + batch])
+        result = kibana.request("POST", "api/detection_engine/rules/_bulk_action", data=json.dumps({
+            "action": "enable",
+            "query": f"alert.attributes.params.ruleId: ({ids})",
+        }).encode())
+        enabled += result.get("attributes", {}).get("summary", {}).get("succeeded", 0)
+    return enabled
+
+
+def print_summary(plan: Dict, top: int):
+    print(f"Budget: {plan['used_ms_per_minute']:.1f} of {plan['budget_ms_per_minute']:.1f} ms search time per minute")
+    for decision, count in sorted(plan["counts"].items()):
+        print(f"  {decision}: {count}")
+    measured = [r for r in plan["rules"] if "ms_per_minute" in r]
+    if measured:
+        print("Most expensive rules:")
+        for r in measured[:top]:
+            print(f"  {r['ms_per_minute']:>10.1f} ms/min {r['hits_per_hour']:>9.1f} hits/h  {r['decision']:<12} {r['name']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimate the cluster cost of Sigma rules and plan which to enable')
+    parser.add_argument('files', nargs='+', help='NDJSON rule files')
+    parser.add_argument('--es-url', default='https://localhost:9200', help='Elasticsearch URL (default: https://localhost:9200)')
+    parser.add_argument('--kibana-url', default='https://localhost:5601', help='Kibana URL for --apply (default: https://localhost:5601)')
+    parser.add_argument('--username', default=os.environ.get('ELASTIC_USERNAME', 'elastic'),
+                        help='Username (default: $ELASTIC_USERNAME or elastic)')
+    parser.add_argument('--password-env', default='ELASTIC_PASSWORD', help='Environment variable holding the password (default: ELASTIC_PASSWORD)')
+    parser.add_argument('--index', default='logs-*', help='Indices to sample (default: logs-*)')
+    parser.add_argument('--window', default='1h', help='Sample window, e.g. 30m or 24h (default: 1h)')
+    parser.add_argument('--timeout', default='10s', help='Search timeout per rule (default: 10s)')
+    parser.add_argument('--concurrency', type=int, default=2, help='Rules measured at a time (default: 2)')
+    parser.add_argument('--budget', type=float, default=1000,
+                        help='Search time per minute the enabled rules may use, in ms (default: 1000)')
+    parser.add_argument('--max-hits-per-hour', type=float, default=100,
+                        help='Leave rules matching more often than this disabled, 0 for no limit (default: 100)')
+    parser.add_argument('-o', '--output', default='output/enable_plan.json', help='Plan file (default: output/enable_plan.json)')
+    parser.add_argument('--top', type=int, default=10, help='Most expensive rules to print (default: 10)')
+    parser.add_argument('--apply', action='store_true', help='Enable the planned rules in Kibana')
+    args = parser.parse_args()
+
+    password = os.environ.get(args.password_env)
+    if not password:
+        print(f"Set the Elasticsearch password in ${args.password_env}")
+        return 1
+    window_seconds = parse_duration(args.window, 0)
+    if not window_seconds:
+        print(f"Invalid window {args.window}")
+        return 1
+
+    rules = load_rules(args.files)
+    # Fail fast on unreachable clusters, searches are retried once at most
+    es = ApiClient(args.es_url, args.username, password, timeout=max(60, 3 * parse_duration(args.timeout, 10)), retries=1)
+    print(f"Measuring {len(rules)} rules against {args.index} over the last {args.window}...")
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(lambda rule: measure_rule(es, rule, args.index, args.window, args.timeout), rules))
+
+    plan = make_plan(results, window_seconds, args.budget, args.max_hits_per_hour)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as fp:
+        json.dump(plan, fp, indent=2)
+    print_summary(plan, args.top)
+    print(f"Plan written to {args.output}")
+
+    if args.apply and plan["enable"]:
+        kibana = ApiClient(args.kibana_url, args.username, password)
+        print(f"Enabled {enable_rules(kibana, plan['enable'])} rules in Kibana")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Rewrites converted Sigma rules for Kibana. Each rule is parsed once, the
+transforms for its OS are applied to the parsed rule, and it is written
+back in a single streaming pass.
+
+convert_sigma.py applies the transforms as it writes its output; this
+script does the same for NDJSON files converted elsewhere.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, Iterable, List
+
+OS_TAGS = {
+    "windows": "Sigma Windows",
+    "macos": "Sigma macOS",
+    "linux": "Sigma Linux",
+}
+
+
+class SetField:
+    """Sets a field, replacing whatever the converter put there."""
+    def __init__(self, field: str, value: Any):
+        self.field = field
+        self.value = value
+
+    def __call__(self, rule: Dict):
+        rule[self.field] = self.value
+
+
+class MapValue:
+    """Replaces a field's value when it is one of the keys of mapping."""
+    def __init__(self, field: str, mapping: Dict[Any, Any]):
+        self.field = field
+        self.mapping = mapping
+
+    def __call__(self, rule: Dict):
+        value = rule.get(self.field)
+        if value in self.mapping:
+            rule[self.field] = self.mapping[value]
+
+
+def transforms_for(os_name: str) -> List:
+    return [
+        SetField("tags", [OS_TAGS[os_name]]),
+        # Kibana has no informational severity
+        MapValue("severity", {"informational": "low"}),
+        # Rules are imported disabled, they are reviewed and enabled in Kibana
+        SetField("enabled", False),
+    ]
+
+
+def transform_line(line: str, transforms: List) -> str:
+    rule = json.loads(line)
+    for transform in transforms:
+        transform(rule)
+    return json.dumps(rule)
+
+
+def transform_lines(lines: Iterable[str], transforms: List) -> Iterable[str]:
+    for line in lines:
+        if line.strip():
+            yield transform_line(line, transforms) + "\n"
+
+
+def process_file(path: str, os_name: str, output: str = None):
+    output = output or path
+    tmp_path = f"{output}.tmp"
+    transforms = transforms_for(os_name)
+    with open(path, 'r') as src, open(tmp_path, 'w') as dst:
+        dst.writelines(transform_lines(src, transforms))
+    os.replace(tmp_path, output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply the Kibana transforms to converted Sigma rules')
+    parser.add_argument('file', help='NDJSON rules file')
+    parser.add_argument('--os', required=True, choices=list(OS_TAGS), help='OS the rules are for')
+    parser.add_argument('-o', '--output', help='Output file (default: rewrite the input)')
+    args = parser.parse_args()
+
+    process_file(args.file, args.os, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Uploads converted Sigma rules to the Kibana detection engine. Rules already
+in Kibana with the same content hash are skipped; new and changed rules are
+imported in size-capped batches, a few at a time, with retries.
+
+The content hash is stored in the rule's meta.sigma_sha256. A changed rule
+keeps the enabled state it has in Kibana.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import ssl
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+HASH_FIELD = "sigma_sha256"
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Kibana rejects request bodies over server.maxPayload (1MB by default)
+DEFAULT_BATCH_BYTES = 900 * 1024
+DEFAULT_BATCH_RULES = 500
+
+
+class ApiError(Exception):
+    pass
+
+
+class ApiClient():
+    """JSON client for the Kibana and Elasticsearch APIs, retrying 429, 5xx and connection errors."""
+    def __init__(self, url: str, username: str, password: str, timeout: int = 300, retries: int = 5):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        token = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.headers = {"Authorization": f"Basic {token}", "kbn-xsrf": "true"}
+        #LME uses self-signed certificates
+        self.context = ssl.create_default_context()
+        self.context.check_hostname = False
+        self.context.verify_mode = ssl.CERT_NONE
+
+    def request(self, method: str, path: str, params: List[Tuple[str, str]] = None, data: bytes = None,
+                content_type: str = "application/json") -> Dict:
+        url = f"{self.url}/{path}"
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        headers = dict(self.headers, **{"Content-Type": content_type})
+        for attempt in range(self.retries + 1):
+            request = urllib.request.Request(url, data=data, headers=headers, method=method)
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout, context=self.context) as response:
+                    return json.load(response)
+            except urllib.error.HTTPError as e:
+                detail = e.read().decode(errors="replace")
+                if e.code not in RETRY_STATUS or attempt == self.retries:
+                    raise ApiError(f"{method} {path} failed with status {e.code}: {detail[:500]}") from e
+            except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+                if attempt == self.retries:
+                    raise ApiError(f"{method} {path} failed: {e}") from e
+            time.sleep(min(60, 2 ** attempt) * random.uniform(0.5, 1.0))
+        raise ApiError("unreachable")
+
+
+def rule_hash(rule: Dict) -> str:
+    """sha256 of the rule content, without the fields Kibana users change."""
+    content = {k: v for k, v in rule.items() if k not in ("enabled", "meta")}
+    content["meta"] = {k: v for k, v in rule.get("meta", {}).items() if k != HASH_FIELD}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def existing_rules(client: ApiClient, per_page: int = 1000) -> Dict[str, Dict]:
+    """rule_id -> {"hash", "enabled"} of every rule in Kibana, paging through _find."""
+    rules = {}
+    page = 1
+    while True:
+        result = client.request("GET", "api/detection_engine/rules/_find", params=[
+            ("page", str(page)), ("per_page", str(per_page)),
+            ("fields", "rule_id"), ("fields", "meta"), ("fields", "enabled"),
+        ])
+        for rule in result.get("data", []):
+            rules[rule["rule_id"]] = {
+                "hash": (rule.get("meta") or {}).get(HASH_FIELD),
+                "enabled": rule.get("enabled", False),
+            }
+        if page * per_page >= result.get("total", 0) or not result.get("data"):
+            return rules
+        page += 1
+
+
+def plan_upload(paths: List[str], existing: Dict[str, Dict]) -> Tuple[List[Dict], Dict[str, int]]:
+    """Rules to upload, with their hash in meta, and counts of new, changed and unchanged rules."""
+    upload = []
+    counts = {"new": 0, "changed": 0, "unchanged": 0}
+    seen = set()
+    for path in paths:
+        with open(path, 'r') as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                rule = json.loads(line)
+                # The same rule_id in two files would make one import overwrite the other
+                if rule["rule_id"] in seen:
+                    continue
+                seen.add(rule["rule_id"])
+
+                digest = rule_hash(rule)
+                current = existing.get(rule["rule_id"])
+                if current is not None and current["hash"] == digest:
+                    counts["unchanged"] += 1
+                    continue
+                if current is not None:
+                    counts["changed"] += 1
+                    rule["enabled"] = current["enabled"]
+                else:
+                    counts["new"] += 1
+                rule.setdefault("meta", {})[HASH_FIELD] = digest
+                upload.append(rule)
+    return upload, counts
+
+
+def make_batches(rules: List[Dict], max_bytes: int, max_rules: int) -> List[bytes]:
+    batches = []
+    batch: List[bytes] = []
+    size = 0
+    for rule in rules:
+        line = (json.dumps(rule) + "\n").encode()
+        if batch and (size + len(line) > max_bytes or len(batch) >= max_rules):
+            batches.append(b"".join(batch))
+            batch, size = [], 0
+        batch.append(line)
+        size += len(line)
+    if batch:
+        batches.append(b"".join(batch))
+    return batches
+
+
+def import_batch(client: ApiClient, number: int, ndjson: bytes) -> Dict:
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="sigma_rules_{number}.ndjson"\r\n'
+        "Content-Type: application/ndjson\r\n\r\n"
+    ).encode() + ndjson + f"\r\n--{boundary}--\r\n".encode()
+    started = time.monotonic()
+    try:
+        result = client.request("POST", "api/detection_engine/rules/_import", params=[("overwrite", "true")],
+                                data=body, content_type=f"multipart/form-data; boundary={boundary}")
+    except ApiError as e:
+        return {"batch": number, "rules": ndjson.count(b"\n"), "success_count": 0, "errors": [str(e)],
+                "seconds": time.monotonic() - started}
+    return {
+        "batch": number,
+        "rules": ndjson.count(b"\n"),
+        "success_count": result.get("success_count", 0),
+        "errors": [f"{e.get('rule_id')}: {e.get('error', {}).get('message')}" for e in result.get("errors", [])],
+        "seconds": time.monotonic() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Upload new and changed Sigma rules to the Kibana detection engine')
+    parser.add_argument('files', nargs='+', help='NDJSON rule files')
+    parser.add_argument('--kibana-url', default='https://localhost:5601', help='Kibana URL (default: https://localhost:5601)')
+    parser.add_argument('--username', default=os.environ.get('ELASTIC_USERNAME', 'elastic'),
+                        help='Username (default: $ELASTIC_USERNAME or elastic)')
+    parser.add_argument('--password-env', default='ELASTIC_PASSWORD', help='Environment variable holding the password (default: ELASTIC_PASSWORD)')
+    parser.add_argument('--batch-kb', type=int, default=DEFAULT_BATCH_BYTES // 1024, help='Maximum size of an import request in KB (default: 900)')
+    parser.add_argument('--batch-rules', type=int, default=DEFAULT_BATCH_RULES, help='Maximum rules per import request (default: 500)')
+    parser.add_argument('--concurrency', type=int, default=2, help='Import requests in flight (default: 2)')
+    parser.add_argument('--dry-run', action='store_true', help='Only show what would be uploaded')
+    args = parser.parse_args()
+
+    password = os.environ.get(args.password_env)
+    if not password:
+        print(f"Set the Kibana password in ${args.password_env}")
+        return 1
+
+    client = ApiClient(args.kibana_url, args.username, password)
+    try:
+        existing = existing_rules(client)
+    except ApiError as e:
+        print(f"ERROR: Could not list the existing rules: {e}")
+        return 1
+
+    rules, counts = plan_upload(args.files, existing)
+    print(f"{counts['new']} new, {counts['changed']} changed, {counts['unchanged']} unchanged rules")
+    batches = make_batches(rules, args.batch_kb * 1024, args.batch_rules)
+    if not batches or args.dry_run:
+        return 0
+
+    print(f"Uploading {len(rules)} rules in {len(batches)} batches...")
+    uploaded = failed = 0
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for result in pool.map(lambda b: import_batch(client, *b), enumerate(batches, 1)):
+            uploaded += result["success_count"]
+            failed += result["rules"] - result["success_count"]
+            status = "SUCCESS" if not result["errors"] else "ERROR"
+            print(f"  Batch {result['batch']}/{len(batches)}: {status} {result['success_count']}/{result['rules']} rules "
+                  f"in {result['seconds']:.1f}s")
+            for error in result["errors"][:5]:
+                print(f"    {error}")
+
+    print(f"Uploaded {uploaded} rules, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
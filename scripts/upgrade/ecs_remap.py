@@ -0,0 +1,78 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Data stream for migrated history. It matches the built-in logs-*-* index
+# template, so it gets the ECS mappings the 2.x dashboards query.
+DEFAULT_DATA_STREAM = "logs-winlogbeat.imported-default"
+
+# Legacy winlogbeat field -> ECS fields it is copied to, with an optional conversion
+LEGACY_FIELDS: Dict[str, List[Tuple[str, Optional[Callable]]]] = {
+    "event_id": [("event.code", str), ("winlog.event_id", str)],
+    "computer_name": [("host.name", None), ("winlog.computer_name", None)],
+    "log_name": [("winlog.channel", None)],
+    "source_name": [("winlog.provider_name", None), ("event.provider", None)],
+    "record_number": [("winlog.record_id", str)],
+    "level": [("log.level", str.lower)],
+    "task": [("winlog.task", None)],
+    "opcode": [("winlog.opcode", None)],
+    "keywords": [("winlog.keywords", None)],
+    "process_id": [("winlog.process.pid", None)],
+    "thread_id": [("winlog.process.thread.id", None)],
+    "provider_guid": [("winlog.provider_guid", None)],
+    "activity_id": [("winlog.activity_id", None)],
+    "related_activity_id": [("winlog.related_activity_id", None)],
+    "event_data": [("winlog.event_data", None)],
+    "user_data": [("winlog.user_data", None)],
+}
+
+# Top level fields of ECS 8.x, the base fields and every field set allowed at
+# the top level, kept as they are. winlog, powershell and sysmon are the
+# winlogbeat module fields, and fields holds the custom fields: settings of
+# the shippers. Everything else (beat.*, @version, type, input_type, ...) is
+# dropped.
+ECS_FIELDS = {
+    "@timestamp", "message", "tags", "labels",
+    "agent", "client", "cloud", "container", "data_stream", "destination", "device", "dll", "dns", "ecs",
+    "email", "error", "event", "faas", "file", "group", "host", "http", "log", "network", "observer",
+    "orchestrator", "organization", "package", "process", "registry", "related", "rule", "server",
+    "service", "source", "span", "threat", "tls", "trace", "transaction", "url", "user", "user_agent",
+    "vulnerability",
+    "winlog", "powershell", "sysmon", "fields",
+}
+
+
+def set_field(doc: Dict, path: str, value):
+    *parents, name = path.split(".")
+    for parent in parents:
+        doc = doc.setdefault(parent, {})
+    doc[name] = value
+
+
+def merge(target: Dict, source: Dict):
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def remap(source: Dict) -> Dict:
+    """
+    Maps a legacy winlogbeat document onto ECS. Fields that are already ECS are
+    kept, and values in them take precedence over the legacy copies.
+    """
+    doc: Dict = {}
+    ecs: Dict = {}
+    for key, value in source.items():
+        targets = LEGACY_FIELDS.get(key)
+        if targets is not None:
+            for path, convert in targets:
+                set_field(doc, path, convert(value) if convert and value is not None else value)
+        elif key == "user" and isinstance(value, dict) and "identifier" in value:
+            # Legacy user is the Windows account of the event (SID, name, domain, type)
+            set_field(doc, "winlog.user", value)
+        elif key in ECS_FIELDS:
+            ecs[key] = value
+
+    merge(doc, ecs)
+    doc.setdefault("event", {}).setdefault("kind", "event")
+    return doc
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import gzip
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+
+from migration import INDEX_FILE, MAPPINGS_FILE, Elasticsearch, SegmentWriter, save_json
+from progress import Progress
+
+KEEP_ALIVE = "10m"
+
+
+def export_slice(config: Dict, slice_id: int, progress) -> Dict:
+    """
+    Reads one slice of the point-in-time with search_after and writes it to
+    its own gzipped segment files, so every slice compresses on its own core.
+    """
+    es = Elasticsearch.from_config(config)
+    writer = SegmentWriter(config["output_dir"], f"winlogbeat_data.slice{slice_id:03d}", config["segment_docs"])
+    pit_id = config["pit_id"]
+    search_after = None
+    docs = 0
+
+    while True:
+        body = {
+            "size": config["page_size"],
+            "pit": {"id": pit_id, "keep_alive": KEEP_ALIVE},
+            # _shard_doc is the cheapest sort for a PIT
+            "sort": ["_shard_doc"],
+            "track_total_hits": False,
+        }
+        if config["slices"] > 1:
+            body["slice"] = {"id": slice_id, "max": config["slices"]}
+        if search_after is not None:
+            body["search_after"] = search_after
+
+        result = es.json("POST", "_search", data=json.dumps(body))
+        pit_id = result.get("pit_id", pit_id)
+        hits = result["hits"]["hits"]
+        if not hits:
+            break
+
+        raw_bytes = 0
+        for hit in hits:
+            raw_bytes += writer.write({"_index": hit["_index"], "_id": hit["_id"], "_source": hit["_source"]})
+        docs += len(hits)
+        search_after = hits[-1]["sort"]
+        progress.put({"worker": f"slice {slice_id:03d}", "docs": len(hits), "bytes": raw_bytes})
+
+    writer.close()
+    for segment in writer.segments:
+        segment["slice"] = slice_id
+    return {"slice": slice_id, "docs": docs, "segments": writer.segments}
+
+
+class Exporter:
+    def __init__(self, args, password: str):
+        self.args = args
+        self.es = Elasticsearch(args.host, args.port, args.user, password)
+        self.config = {
+            "host": args.host, "port": args.port, "user": args.user, "password": password,
+            "output_dir": args.output_dir, "slices": args.slices,
+            "page_size": args.page_size, "segment_docs": args.segment_docs,
+        }
+
+    def open_pit(self) -> str:
+        return self.es.json("POST", f"{self.args.index}/_pit?keep_alive={KEEP_ALIVE}")["id"]
+
+    def count(self, pit_id: str) -> int:
+        # Counted against the point-in-time, so it matches what the slices read
+        body = {"size": 0, "pit": {"id": pit_id}, "track_total_hits": True}
+        return self.es.json("POST", "_search", data=json.dumps(body))["hits"]["total"]["value"]
+
+    def export_mappings(self):
+        mappings = self.es.json("GET", f"{self.args.index}/_mapping")
+        with gzip.open(os.path.join(self.args.output_dir, MAPPINGS_FILE), 'wt') as fp:
+            json.dump(mappings, fp)
+
+    def export(self) -> int:
+        os.makedirs(self.args.output_dir, exist_ok=True)
+        self.export_mappings()
+
+        pit_id = self.open_pit()
+        try:
+            expected = self.count(pit_id)
+            print(f"Exporting {expected} documents from {self.args.index} in {self.args.slices} slices...")
+            progress = Progress("export", expected, self.args.status_file)
+            results = self.run_slices(pit_id, progress)
+        finally:
+            self.es.request("DELETE", "_pit", data=json.dumps({"id": pit_id}))
+        benchmark = progress.finish()
+
+        exported = sum(r["docs"] for r in results)
+        index = {
+            "created": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "source": f"{self.args.host}:{self.args.port}/{self.args.index}",
+            "slices": self.args.slices,
+            "expected_docs": expected,
+            "docs": exported,
+            "mappings": MAPPINGS_FILE,
+            "segments": [segment for r in sorted(results, key=lambda r: r["slice"]) for segment in r["segments"]],
+            "benchmark": {k: benchmark[k] for k in ("elapsed_seconds", "docs_per_second", "peak_docs_per_second", "bytes_per_second")},
+        }
+        save_json(os.path.join(self.args.output_dir, INDEX_FILE), index)
+
+        print(f"Exported {exported} documents in {len(index['segments'])} segments")
+        if exported != expected:
+            print(f"Error: expected {expected} documents but exported {exported}")
+            return 1
+        return 0
+
+    def run_slices(self, pit_id: str, progress: Progress):
+        config = dict(self.config, pit_id=pit_id)
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(self.args.workers) as pool:
+            messages = manager.Queue()
+            futures = {pool.submit(export_slice, config, i, messages): f"slice {i:03d}" for i in range(self.args.slices)}
+            progress.run(messages, futures)
+            for future, name in futures.items():
+                if future.exception() is not None:
+                    progress.worker_failed(name)
+            return [f.result() for f in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export winlogbeat indices from LME 1.x with parallel point-in-time slices')
+    parser.add_argument('-u', '--user', required=True, help='Elasticsearch username')
+    parser.add_argument('--password-env', default='ES_PASSWORD', help='Environment variable holding the password (default: ES_PASSWORD)')
+    parser.add_argument('--host', default='localhost', help='Elasticsearch host (default: localhost)')
+    parser.add_argument('--port', type=int, default=9200, help='Elasticsearch port (default: 9200)')
+    parser.add_argument('--index', default='winlogbeat-*', help='Indices to export (default: winlogbeat-*)')
+    parser.add_argument('-o', '--output-dir', required=True, help='Directory for the segment files and export index')
+    parser.add_argument('--slices', type=int, default=os.cpu_count() or 4, help='Parallel slices (default: number of CPUs)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per slice)')
+    parser.add_argument('--page-size', type=int, default=5000, help='Documents per search request (default: 5000)')
+    parser.add_argument('--segment-docs', type=int, default=1000000, help='Documents per segment file (default: 1000000)')
+    parser.add_argument('--status-file', help='JSON status file updated during the export (default: export_status.json in the output directory)')
+    args = parser.parse_args()
+    args.workers = args.workers or args.slices
+    args.status_file = args.status_file or os.path.join(args.output_dir, "export_status.json")
+
+    password = os.environ.get(args.password_env)
+    if not password:
+        print(f"Set the Elasticsearch password in ${args.password_env}")
+        return 1
+
+    return Exporter(args, password).export()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
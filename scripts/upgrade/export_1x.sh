@@ -5,6 +5,7 @@ set -e
 LME_PATH="/opt/lme"
 ES_PORT="9200"
 ES_PROTOCOL="https"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 # Function to get the host IP address
 get_host_ip() {
@@ -61,31 +62,16 @@ check_es_connection() {
     fi
 }
 
-# Function to export data and mappings using Docker and elasticdump
+# Function to export data and mappings with parallel point-in-time slices
 export_data_and_mappings() {
     local output_dir="$1"
 
-    echo "Exporting winlogbeat-* indices data..."
-    docker run --rm -v "${output_dir}:${output_dir}" \
-        --network host \
-        -e NODE_TLS_REJECT_UNAUTHORIZED=0 \
-        elasticdump/elasticsearch-dump \
-        --input=${ES_PROTOCOL}://${ES_USER}:${ES_PASS}@${ES_HOST}:${ES_PORT}/winlogbeat-* \
-        --output=$ \
-        --type=data \
-        --headers='{"Content-Type": "application/json"}' \
-        --sslVerification=false | gzip > "${output_dir}/winlogbeat_data.json.gz"
-
-    echo "Exporting winlogbeat-* indices mappings..."
-    docker run --rm -v "${output_dir}:${output_dir}" \
-        --network host \
-        -e NODE_TLS_REJECT_UNAUTHORIZED=0 \
-        elasticdump/elasticsearch-dump \
-        --input=${ES_PROTOCOL}://${ES_USER}:${ES_PASS}@${ES_HOST}:${ES_PORT}/winlogbeat-* \
-        --output=$ \
-        --type=mapping \
-        --headers='{"Content-Type": "application/json"}' \
-        --sslVerification=false | gzip > "${output_dir}/winlogbeat_mappings.json.gz"
+    echo "Exporting winlogbeat-* indices data and mappings..."
+    ES_PASSWORD="${ES_PASS}" python3 "${SCRIPT_DIR}/export_1x.py" \
+        --host "${ES_HOST}" \
+        --port "${ES_PORT}" \
+        --user "${ES_USER}" \
+        --output-dir "${output_dir}"
 }
 
 # Function to prompt for password securely
@@ -109,14 +95,9 @@ echo "============================================"
 
 echo "Using host IP: ${ES_HOST}"
 
-# Check if Docker is installed and running
-if ! command -v docker &> /dev/null; then
-    echo "Error: Docker is not installed. Please install Docker to proceed."
-    exit 1
-fi
-
-if ! docker info &> /dev/null; then
-    echo "Error: Docker daemon is not running. Please start Docker to proceed."
+# Check that the exporter can run
+if ! python3 -c "import requests" &> /dev/null; then
+    echo "Error: The Python requests module is not installed. Run: pip install -r ${SCRIPT_DIR}/requirements.txt"
     exit 1
 fi
 
@@ -175,5 +156,6 @@ export_data_and_mappings "${BACKUP_DIR}"
 
 echo "Data and mappings export completed. Backup stored in: ${BACKUP_DIR}"
 echo "Files created:"
-echo "  - ${BACKUP_DIR}/winlogbeat_data.json.gz"
-echo "  - ${BACKUP_DIR}/winlogbeat_mappings.json.gz"
\ No newline at end of file
+echo "  - ${BACKUP_DIR}/export_index.json"
+echo "  - ${BACKUP_DIR}/winlogbeat_mappings.json.gz"
+echo "  - ${BACKUP_DIR}/winlogbeat_data.slice*.ndjson.gz"
\ No newline at end of file
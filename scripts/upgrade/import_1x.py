@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from ecs_remap import DEFAULT_DATA_STREAM, remap
+from migration import INDEX_FILE, LEGACY_DATA_FILE, MAPPINGS_FILE, Elasticsearch, iter_segment, load_index, save_json
+from progress import Progress
+
+CHECKPOINT_FILE = "import_checkpoint.json"
+STATUS_FILE = "import_status.json"
+ITEM_RETRIES = 8
+
+
+def send_bulk(es: Elasticsearch, ops: List[bytes], exists_ok: bool = False) -> Tuple[int, List[int], List[str]]:
+    """
+    Sends action/source pairs to _bulk. Whole requests rejected with 429 are
+    retried by the client; items rejected inside a successful response
+    (es_rejected_execution_exception) are resent on their own with backoff.
+    With exists_ok, create operations that conflict (409) count as indexed,
+    the document is there from before a resume.
+
+    Returns:
+        (documents indexed, positions in ops of the failed documents, first error reasons)
+    """
+    indexed = 0
+    failed = []
+    reasons = []
+    pending = list(range(len(ops)))
+    for attempt in range(ITEM_RETRIES + 1):
+        result = es.json("POST", "_bulk", data=b"".join(ops[i] for i in pending),
+                         params={"filter_path": "errors,items.*.status,items.*.error"},
+                         headers={"Content-Type": "application/x-ndjson"})
+        if not result["errors"]:
+            return indexed + len(pending), failed, reasons
+
+        rejected = []
+        for position, item in zip(pending, result["items"]):
+            status = next(iter(item.values()))
+            if status["status"] < 300 or (exists_ok and status["status"] == 409):
+                indexed += 1
+            elif status["status"] == 429 and attempt < ITEM_RETRIES:
+                rejected.append(position)
+            else:
+                failed.append(position)
+                if len(reasons) < 5:
+                    reasons.append(json.dumps(status.get("error")))
+        if not rejected:
+            break
+        pending = rejected
+        time.sleep(min(60, 2 ** attempt) * random.uniform(0.5, 1.0))
+    return indexed, sorted(failed), reasons
+
+
+def import_segment(config: Dict, segment: str, start: int, retry: List[int], progress) -> Dict:
+    """
+    Imports one segment file from line start on in _bulk requests of about
+    bulk_bytes, reporting the line reached after every acknowledged request so
+    the checkpoint never runs ahead of what Elasticsearch has. The lines in
+    retry, documents that failed before start in an earlier run, are sent
+    again first. Lines of documents that fail are reported as failed_lines,
+    so the checkpoint keeps them for the next run.
+    """
+    es = Elasticsearch.from_config(config)
+    ops = []
+    lines = []
+    size = 0
+    totals = {"segment": segment, "docs": 0, "errors": 0, "reasons": []}
+    retry = set(retry)
+
+    def flush(next_line: int):
+        nonlocal ops, lines, size
+        indexed, failed, reasons = send_bulk(es, ops, exists_ok=config["op_type"] == "create")
+        totals["docs"] += indexed
+        totals["errors"] += len(failed)
+        totals["reasons"] = (totals["reasons"] + reasons)[:5]
+        progress.put({"worker": segment, "lines": next_line, "docs": indexed, "errors": len(failed), "bytes": size,
+                      "retried_lines": [n for n in lines if n in retry], "failed_lines": [lines[i] for i in failed]})
+        ops = []
+        lines = []
+        size = 0
+
+    next_line = start
+    for number, line in iter_segment(os.path.join(config["input_dir"], segment), min(retry | {start})):
+        if number < start and number not in retry:
+            continue
+        doc = json.loads(line)
+        action = {"_index": config["index"]}
+        # Keeping the exported _id makes documents sent again after a resume overwrite themselves
+        if doc.get("_id"):
+            action["_id"] = doc["_id"]
+        source = remap(doc["_source"]) if config["ecs"] else doc["_source"]
+        op = (json.dumps({config["op_type"]: action}) + "\n" + json.dumps(source, separators=(",", ":")) + "\n").encode()
+        ops.append(op)
+        lines.append(number)
+        size += len(op)
+        next_line = max(next_line, number + 1)
+        if size >= config["bulk_bytes"]:
+            flush(next_line)
+    if ops:
+        flush(next_line)
+    return totals
+
+
+def merge_mappings(exported: Dict) -> Dict:
+    """Merges the mappings of all exported indices into one mapping for the target."""
+    merged: Dict = {}
+
+    def merge(target: Dict, source: Dict):
+        for key, value in source.items():
+            if isinstance(value, dict) and isinstance(target.get(key), dict):
+                merge(target[key], value)
+            else:
+                target.setdefault(key, value)
+
+    for index in exported.values():
+        merge(merged, index.get("mappings", {}))
+    return merged
+
+
+class Importer:
+    def __init__(self, args, password: str):
+        self.args = args
+        self.es = Elasticsearch(args.host, args.port, args.user, password)
+        self.config = {
+            "host": args.host, "port": args.port, "user": args.user, "password": password,
+            "index": args.index, "bulk_bytes": args.bulk_bytes, "ecs": args.ecs,
+            # Data streams only take create
+            "op_type": "create" if args.data_stream else "index",
+        }
+
+        if os.path.isdir(args.input):
+            export = load_index(args.input)
+            self.config["input_dir"] = args.input
+            self.segments = [s["file"] for s in export["segments"]]
+            self.segment_docs = {s["file"]: s["docs"] for s in export["segments"]}
+            self.expected = export["docs"]
+            self.mappings_path = args.mappings or os.path.join(args.input, export["mappings"])
+            self.checkpoint_path = os.path.join(args.input, CHECKPOINT_FILE)
+            self.status_path = os.path.join(args.input, STATUS_FILE)
+        else:
+            # A winlogbeat_data.json.gz from elasticdump is one segment
+            self.config["input_dir"] = os.path.dirname(os.path.abspath(args.input))
+            self.segments = [os.path.basename(args.input)]
+            self.segment_docs = None
+            self.expected = None
+            self.mappings_path = args.mappings or os.path.join(self.config["input_dir"], MAPPINGS_FILE)
+            self.checkpoint_path = f"{args.input}.checkpoint.json"
+            self.status_path = f"{args.input}.status.json"
+        self.status_path = args.status_file or self.status_path
+
+        self.checkpoint = self.load_checkpoint()
+
+    def load_checkpoint(self) -> Dict:
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'r') as fp:
+                checkpoint = json.load(fp)
+            if checkpoint.get("index") == self.args.index:
+                return checkpoint
+            print(f"Ignoring {self.checkpoint_path}, it is for index {checkpoint.get('index')}")
+        return {"index": self.args.index, "segments": {}}
+
+    def save_checkpoint(self):
+        save_json(self.checkpoint_path, self.checkpoint)
+
+    def create_index(self):
+        if self.args.data_stream:
+            if self.es.request("GET", f"_data_stream/{self.args.index}").status_code == 404:
+                print(f"Creating data stream {self.args.index}...")
+                self.es.json("PUT", f"_data_stream/{self.args.index}")
+            return
+        if self.es.request("HEAD", self.args.index).status_code == 200:
+            return
+        if self.args.ecs:
+            # The exported mappings are for the legacy fields
+            print(f"Creating index {self.args.index}...")
+            self.es.json("PUT", self.args.index, data=json.dumps(
+                {"settings": {"index.mapping.total_fields.limit": self.args.field_limit}}))
+            return
+        with gzip.open(self.mappings_path, 'rt') as fp:
+            mappings = merge_mappings(json.load(fp))
+        print(f"Creating index {self.args.index}...")
+        self.es.json("PUT", self.args.index, data=json.dumps({
+            "settings": {"index.mapping.total_fields.limit": self.args.field_limit},
+            "mappings": mappings,
+        }))
+
+    def load_settings(self):
+        """Turns off refreshes and replicas for the load, remembering the originals once."""
+        if "settings" not in self.checkpoint:
+            current = self.es.json("GET", f"{self.args.index}/_settings",
+                                   params={"include_defaults": "true", "flat_settings": "true"})
+            index = next(iter(current.values()))
+            values = {**index.get("defaults", {}), **index["settings"]}
+            self.checkpoint["settings"] = {
+                "index.refresh_interval": values.get("index.refresh_interval", "1s"),
+                "index.number_of_replicas": values.get("index.number_of_replicas", "1"),
+            }
+            self.save_checkpoint()
+        self.es.json("PUT", f"{self.args.index}/_settings", data=json.dumps(
+            {"index.refresh_interval": "-1", "index.number_of_replicas": 0}))
+
+    def restore_settings(self):
+        self.es.json("PUT", f"{self.args.index}/_settings", data=json.dumps(self.checkpoint["settings"]))
+        self.es.json("POST", f"{self.args.index}/_refresh")
+
+    def import_data(self) -> int:
+        self.create_index()
+        self.load_settings()
+        try:
+            results = self.run_segments()
+        finally:
+            self.restore_settings()
+
+        failed = [r for r in results if isinstance(r, Exception)]
+        totals = [r for r in results if not isinstance(r, Exception)]
+        docs = sum(r["docs"] for r in totals)
+        errors = sum(r["errors"] for r in totals)
+        for reason in [reason for r in totals for reason in r["reasons"]][:5]:
+            print(f"  Failed document: {reason}")
+        for error in failed:
+            print(f"Error: {error}")
+
+        count = self.es.json("GET", f"{self.args.index}/_count")["count"]
+        print(f"Imported {docs} documents, {errors} failed. {self.args.index} has {count} documents")
+        if failed:
+            print(f"Rerun the import to resume from {self.checkpoint_path}")
+            return 1
+        if errors:
+            print(f"The lines of the failed documents are kept in {self.checkpoint_path}, "
+                  f"rerun the import after fixing the cause to retry them")
+        if self.expected is not None and count < self.expected:
+            print(f"Warning: the export has {self.expected} documents")
+        return 1 if errors else 0
+
+    def run_segments(self) -> List:
+        done = self.checkpoint["segments"]
+        # Segments with failed documents are run again to retry those
+        pending = [s for s in self.segments if not done.get(s, {}).get("done") or done[s].get("failed_lines")]
+        if len(pending) < len(self.segments):
+            print(f"Resuming, {len(self.segments) - len(pending)} of {len(self.segments)} segments already imported")
+        print(f"Importing {len(pending)} segments into {self.args.index} with {self.args.workers} workers...")
+
+        total = None
+        if self.segment_docs is not None:
+            total = sum(self.segment_docs[s] - done.get(s, {}).get("lines", 0) + len(done.get(s, {}).get("failed_lines", []))
+                        for s in pending)
+        progress = Progress("import", total, self.status_path)
+        last_save = time.monotonic()
+
+        def checkpoint(message: Dict):
+            nonlocal last_save
+            state = done.setdefault(message["worker"], {})
+            state["lines"] = message["lines"]
+            failed = (set(state.get("failed_lines", [])) - set(message["retried_lines"])) | set(message["failed_lines"])
+            if failed:
+                state["failed_lines"] = sorted(failed)
+            else:
+                state.pop("failed_lines", None)
+            if time.monotonic() - last_save >= 5:
+                self.save_checkpoint()
+                last_save = time.monotonic()
+
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(self.args.workers) as pool:
+            messages = manager.Queue()
+            futures = {
+                pool.submit(import_segment, self.config, s, done.get(s, {}).get("lines", 0),
+                            done.get(s, {}).get("failed_lines", []), messages): s
+                for s in pending
+            }
+            try:
+                progress.run(messages, futures, on_message=checkpoint)
+            finally:
+                # Also on Ctrl-C, so a rerun resumes from the last acknowledged request
+                self.save_checkpoint()
+
+            results = []
+            for future, segment in futures.items():
+                try:
+                    results.append(future.result())
+                    done.setdefault(segment, {})["done"] = True
+                except Exception as e:
+                    progress.worker_failed(segment)
+                    results.append(RuntimeError(f"{segment}: {e}"))
+            self.save_checkpoint()
+        progress.finish()
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Import winlogbeat data exported from LME 1.x with parallel bulk requests')
+    parser.add_argument('-u', '--user', required=True, help='Elasticsearch username')
+    parser.add_argument('--password-env', default='ES_PASSWORD', help='Environment variable holding the password (default: ES_PASSWORD)')
+    parser.add_argument('--host', default='localhost', help='Elasticsearch host (default: localhost)')
+    parser.add_argument('--port', type=int, default=9200, help='Elasticsearch port (default: 9200)')
+    parser.add_argument('-i', '--input', required=True,
+                        help=f'Export directory with {INDEX_FILE}, or a {LEGACY_DATA_FILE} from elasticdump')
+    parser.add_argument('-m', '--mappings', help=f'Mappings file (default: {MAPPINGS_FILE} next to the data)')
+    parser.add_argument('--index', default='winlogbeat-imported', help='Index to import into (default: winlogbeat-imported)')
+    parser.add_argument('--field-limit', type=int, default=3000, help='index.mapping.total_fields.limit (default: 3000)')
+    parser.add_argument('--ecs', action='store_true', help='Remap legacy winlogbeat fields to ECS and drop the unmapped ones')
+    parser.add_argument('--data-stream', nargs='?', const=DEFAULT_DATA_STREAM,
+                        help=f'Import into a logs-* data stream instead of an index, implies --ecs (default: {DEFAULT_DATA_STREAM})')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--bulk-mb', type=float, default=10, help='Size of each _bulk request in MB (default: 10)')
+    parser.add_argument('--status-file', help=f'JSON status file updated during the import (default: {STATUS_FILE} next to the data)')
+    args = parser.parse_args()
+    args.bulk_bytes = int(args.bulk_mb * 1024 * 1024)
+    if args.data_stream:
+        args.index = args.data_stream
+        args.ecs = True
+
+    password = os.environ.get(args.password_env)
+    if not password:
+        print(f"Set the Elasticsearch password in ${args.password_env}")
+        return 1
+
+    return Importer(args, password).import_data()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
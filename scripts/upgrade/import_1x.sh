@@ -5,6 +5,8 @@ set -e
 ES_PORT="9200"
 ES_PROTOCOL="https"
 ENV_FILE="/opt/lme/lme-environment"
+DATA_STREAM="logs-winlogbeat.imported-default"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 # Function to get the host IP address
 get_host_ip() {
@@ -52,55 +54,32 @@ check_es_connection() {
     fi
 }
 
-# Function to increase field limit
-increase_field_limit() {
-    local index_name="$1"
-    local new_limit="$2"
-
-    echo "Increasing field limit for index ${index_name} to ${new_limit}..."
-    curl -X PUT -kL -H 'Content-Type: application/json' \
-         -u "${ES_USER}:${ES_PASS}" \
-         "${ES_PROTOCOL}://${ES_HOST}:${ES_PORT}/${index_name}/_settings" \
-         -d "{\"index.mapping.total_fields.limit\": ${new_limit}}"
-    echo
-}
-
-# Function to import data and mappings using Podman and elasticdump
+# Function to import data and mappings with parallel bulk requests
 import_data_and_mappings() {
-    local data_file="$1"
+    local input="$1"
     local mappings_file="$2"
     local import_index="$3"
     local field_limit="$4"
 
-    # Create the index with increased field limit
-    echo "Creating index ${import_index} with increased field limit..."
-    curl -X PUT -kL -H 'Content-Type: application/json' \
-         -u "${ES_USER}:${ES_PASS}" \
-         "${ES_PROTOCOL}://${ES_HOST}:${ES_PORT}/${import_index}" \
-         -d "{\"settings\": {\"index.mapping.total_fields.limit\": ${field_limit}}}"
-    echo
-
-    echo "Importing mappings from ${mappings_file} into index ${import_index}..."
-    gzip -dc "${mappings_file}" | podman run --rm -i \
-        --network host \
-        -e NODE_TLS_REJECT_UNAUTHORIZED=0 \
-        docker.io/elasticdump/elasticsearch-dump:latest \
-        --input=$ \
-        --output=${ES_PROTOCOL}://${ES_USER}:${ES_PASS}@${ES_HOST}:${ES_PORT}/${import_index} \
-        --type=mapping \
-        --headers='{"Content-Type": "application/json"}' \
-        --sslVerification=false
-
-    echo "Importing data from ${data_file} into index ${import_index}..."
-    gzip -dc "${data_file}" | podman run --rm -i \
-        --network host \
-        -e NODE_TLS_REJECT_UNAUTHORIZED=0 \
-        docker.io/elasticdump/elasticsearch-dump:latest \
-        --input=$ \
-        --output=${ES_PROTOCOL}://${ES_USER}:${ES_PASS}@${ES_HOST}:${ES_PORT}/${import_index} \
-        --type=data \
-        --headers='{"Content-Type": "application/json"}' \
-        --sslVerification=false
+    local target_args=()
+    if [ -n "${mappings_file}" ]; then
+        target_args+=(--mappings "${mappings_file}")
+    fi
+    # Without an index the data is remapped to ECS into the imported data stream
+    if [ -n "${import_index}" ]; then
+        target_args+=(--index "${import_index}" --field-limit "${field_limit}")
+        echo "Importing data from ${input} into index ${import_index}..."
+    else
+        target_args+=(--data-stream)
+        echo "Importing data from ${input} into data stream ${DATA_STREAM} with ECS field names..."
+    fi
+
+    ES_PASSWORD="${ES_PASS}" python3 "${SCRIPT_DIR}/import_1x.py" \
+        --host "${ES_HOST}" \
+        --port "${ES_PORT}" \
+        --user "${ES_USER}" \
+        --input "${input}" \
+        "${target_args[@]}"
 }
 
 # Function to prompt for password securely
@@ -119,14 +98,14 @@ prompt_password() {
 }
 
 # Main script
-echo "LME Data Import Script for Elasticsearch 8.x (using Podman)"
-echo "=========================================================="
+echo "LME Data Import Script for Elasticsearch 8.x"
+echo "============================================"
 
 echo "Using host IP: ${ES_HOST}"
 
-# Check if Podman is installed
-if ! command -v podman &> /dev/null; then
-    echo "Error: Podman is not installed. Please install Podman to proceed."
+# Check that the importer can run
+if ! python3 -c "import requests" &> /dev/null; then
+    echo "Error: The Python requests module is not installed. Run: pip install -r ${SCRIPT_DIR}/requirements.txt"
     exit 1
 fi
 
@@ -174,24 +153,38 @@ else
 fi
 
 
-# Prompt for input files
-read -p "Enter the path to the compressed data file (winlogbeat_data.json.gz): " DATA_FILE
-read -p "Enter the path to the compressed mappings file (winlogbeat_mappings.json.gz): " MAPPINGS_FILE
+# Prompt for the export
+read -p "Enter the path to the export directory (with export_index.json) or to a winlogbeat_data.json.gz file: " DATA_INPUT
+MAPPINGS_FILE=""
 
-if [ ! -f "$DATA_FILE" ] || [ ! -f "$MAPPINGS_FILE" ]; then
-    echo "Error: One or both files not found."
+if [ -d "$DATA_INPUT" ]; then
+    if [ ! -f "$DATA_INPUT/export_index.json" ]; then
+        echo "Error: $DATA_INPUT/export_index.json not found."
+        exit 1
+    fi
+elif [ -f "$DATA_INPUT" ]; then
+    read -p "Enter the path to the compressed mappings file (winlogbeat_mappings.json.gz): " MAPPINGS_FILE
+    if [ ! -f "$MAPPINGS_FILE" ]; then
+        echo "Error: Mappings file not found."
+        exit 1
+    fi
+else
+    echo "Error: $DATA_INPUT not found."
     exit 1
 fi
 
-# Prompt for import index name
-read -p "Enter the name of the index to import into (default: winlogbeat-imported): " IMPORT_INDEX
-IMPORT_INDEX=${IMPORT_INDEX:-winlogbeat-imported}
+# Prompt for the import target
+IMPORT_INDEX=""
+FIELD_LIMIT=""
+read -p "Remap the data to ECS and import it into ${DATA_STREAM} for the 2.x dashboards? (y/n, default: y): " use_ecs
+if [[ $use_ecs =~ ^[Nn]$ ]]; then
+    read -p "Enter the name of the index to import into (default: winlogbeat-imported): " IMPORT_INDEX
+    IMPORT_INDEX=${IMPORT_INDEX:-winlogbeat-imported}
 
-# Prompt for field limit
-read -p "Enter the new field limit (default: 3000): " FIELD_LIMIT
-FIELD_LIMIT=${FIELD_LIMIT:-3000}
+    read -p "Enter the new field limit (default: 3000): " FIELD_LIMIT
+    FIELD_LIMIT=${FIELD_LIMIT:-3000}
+fi
 
-# Import data and mappings with increased field limit
-import_data_and_mappings "$DATA_FILE" "$MAPPINGS_FILE" "$IMPORT_INDEX" "$FIELD_LIMIT"
+import_data_and_mappings "$DATA_INPUT" "$MAPPINGS_FILE" "$IMPORT_INDEX" "$FIELD_LIMIT"
 
-echo "Data and mappings import completed into index: $IMPORT_INDEX"
\ No newline at end of file
+echo "Data and mappings import completed into: ${IMPORT_INDEX:-$DATA_STREAM}"
\ No newline at end of file
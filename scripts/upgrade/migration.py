@@ -0,0 +1,135 @@
+import os
+import gzip
+import json
+import time
+import random
+import hashlib
+import requests
+from typing import Dict, Iterator, List, Tuple
+from urllib3.exceptions import InsecureRequestWarning
+
+# Suppress the InsecureRequestWarning (We are using a self-signed cert)
+requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+
+# Files written by export_1x.py. Data lines use the elasticdump format
+# ({"_index", "_id", "_source"}), so older winlogbeat_data.json.gz dumps can be imported too
+INDEX_FILE = "export_index.json"
+MAPPINGS_FILE = "winlogbeat_mappings.json.gz"
+LEGACY_DATA_FILE = "winlogbeat_data.json.gz"
+
+RETRY_STATUS = (429, 502, 503, 504)
+
+
+class Elasticsearch:
+    def __init__(self, host: str, port: int, user: str, password: str, protocol: str = "https"):
+        self.root_url = f"{protocol}://{host}:{port}"
+        self.session = requests.Session()
+        self.session.auth = (user, password)
+        self.session.headers["Content-Type"] = "application/json"
+
+    def request(self, method: str, path: str, retries: int = 8, **kwargs) -> requests.Response:
+        """
+        Sends a request, retrying with exponential backoff and jitter on 429
+        (Elasticsearch is rejecting work), 5xx gateway errors and connection errors.
+        """
+        # Passed per request, a session level verify=False loses to REQUESTS_CA_BUNDLE
+        kwargs.setdefault("verify", False)
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.request(method, f"{self.root_url}/{path}", timeout=300, **kwargs)
+                if response.status_code not in RETRY_STATUS or attempt == retries:
+                    return response
+            except requests.exceptions.SSLError:
+                raise
+            except requests.ConnectionError:
+                if attempt == retries:
+                    raise
+            time.sleep(min(60, 2 ** attempt) * random.uniform(0.5, 1.0))
+        raise RuntimeError("unreachable")
+
+    def json(self, method: str, path: str, **kwargs) -> Dict:
+        response = self.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} failed with status {response.status_code}: {response.text[:500]}")
+        return response.json()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "Elasticsearch":
+        # Worker processes get the connection settings, not the session
+        return cls(config["host"], config["port"], config["user"], config["password"])
+
+
+class HashingWriter:
+    """File wrapper that hashes what is written, so segments are not read again."""
+    def __init__(self, fp):
+        self.fp = fp
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fp.write(data)
+
+    def flush(self):
+        self.fp.flush()
+
+
+class SegmentWriter:
+    """
+    Writes documents as gzipped NDJSON segment files of at most segment_docs
+    documents each, named <prefix>.<number>.ndjson.gz.
+    """
+    def __init__(self, output_dir: str, prefix: str, segment_docs: int, compresslevel: int = 6):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.segment_docs = segment_docs
+        self.compresslevel = compresslevel
+        self.segments: List[Dict] = []
+        self.fp = self.raw = self.hasher = None
+        self.docs = 0
+
+    def open(self):
+        name = f"{self.prefix}.{len(self.segments):05d}.ndjson.gz"
+        self.raw = open(os.path.join(self.output_dir, name), 'wb')
+        self.hasher = HashingWriter(self.raw)
+        self.fp = gzip.GzipFile(filename="", mode='wb', fileobj=self.hasher, compresslevel=self.compresslevel, mtime=0)
+        self.segments.append({"file": name, "docs": 0})
+        self.docs = 0
+
+    def close(self):
+        if self.fp is None:
+            return
+        self.fp.close()
+        self.raw.close()
+        self.segments[-1].update(docs=self.docs, bytes=self.hasher.size, sha256=self.hasher.sha256.hexdigest())
+        self.fp = None
+
+    def write(self, doc: Dict) -> int:
+        if self.fp is None or self.docs >= self.segment_docs:
+            self.close()
+            self.open()
+        line = (json.dumps(doc, separators=(",", ":")) + "\n").encode()
+        self.fp.write(line)
+        self.docs += 1
+        return len(line)
+
+
+def load_index(directory: str) -> Dict:
+    with open(os.path.join(directory, INDEX_FILE), 'r') as fp:
+        return json.load(fp)
+
+
+def save_json(path: str, data: Dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as fp:
+        json.dump(data, fp, indent=2)
+    os.replace(tmp_path, path)
+
+
+def iter_segment(path: str, start: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """Yields (line number, line) of a gzipped NDJSON file, from line start on."""
+    with gzip.open(path, 'rb') as fp:
+        for number, line in enumerate(fp):
+            if number >= start and line.strip():
+                yield number, line
@@ -0,0 +1,178 @@
+import datetime
+import queue
+import sys
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from migration import save_json
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "unknown"
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds // 60 % 60:02d}m{seconds % 60:02d}s"
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+class Progress:
+    """
+    Live telemetry for a migration run. Worker processes put messages of
+    {"worker", "docs", "bytes", "errors"} on a multiprocessing queue; run()
+    drains it, prints a status line and rewrites the JSON status file every
+    interval seconds, and finish() prints a benchmark summary.
+
+    A worker's clock starts with its first message: until then it is still
+    queued behind the others and is reported as pending, not as stalled.
+    """
+    def __init__(self, action: str, total: Optional[int] = None, status_path: Optional[str] = None, interval: float = 10):
+        self.action = action
+        self.total = total
+        self.status_path = status_path
+        self.interval = interval
+        self.started = time.monotonic()
+        self.started_at = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.docs = self.bytes = self.errors = 0
+        self.workers: Dict[str, Dict] = {}
+        self.last_tick = self.started
+        self.last_docs = 0
+        self.peak_rate = 0.0
+        self.tty = sys.stdout.isatty()
+
+    def worker(self, name: str) -> Dict:
+        return self.workers.setdefault(name, {"docs": 0, "bytes": 0, "errors": 0, "started": None,
+                                              "last_seen": None, "done": False, "finished": None})
+
+    def update(self, message: Dict):
+        worker = self.worker(message["worker"])
+        for field in ("docs", "bytes", "errors"):
+            worker[field] += message.get(field, 0)
+        worker["last_seen"] = time.monotonic()
+        if worker["started"] is None:
+            worker["started"] = worker["last_seen"]
+        self.docs += message.get("docs", 0)
+        self.bytes += message.get("bytes", 0)
+        self.errors += message.get("errors", 0)
+
+    def worker_failed(self, name: str):
+        self.worker(name)["errors"] += 1
+        self.errors += 1
+
+    def run(self, messages, futures: Dict[Future, str], on_message: Callable[[Dict], None] = None):
+        """Drains messages until every future is done and the queue is empty."""
+        for name in futures.values():
+            self.worker(name)
+        while True:
+            finished = True
+            for future, name in futures.items():
+                if future.done():
+                    worker = self.worker(name)
+                    if not worker["done"]:
+                        worker["done"] = True
+                        worker["finished"] = time.monotonic()
+                else:
+                    finished = False
+            try:
+                message = messages.get(timeout=1)
+                self.update(message)
+                if on_message:
+                    on_message(message)
+            except queue.Empty:
+                if finished:
+                    break
+            self.tick()
+
+    def status(self) -> Dict:
+        now = time.monotonic()
+        elapsed = now - self.started
+        rate = self.docs / elapsed if elapsed else 0.0
+        eta = (self.total - self.docs) / rate if self.total is not None and rate else None
+        active = [w for w in self.workers.values() if not w["done"] and w["started"] is not None]
+        pending = [w for w in self.workers.values() if not w["done"] and w["started"] is None]
+        leader = max((w["docs"] for w in self.workers.values()), default=0)
+        return {
+            "action": self.action,
+            "started": self.started_at,
+            "elapsed_seconds": round(elapsed, 1),
+            "docs": self.docs,
+            "total_docs": self.total,
+            "bytes": self.bytes,
+            "errors": self.errors,
+            "docs_per_second": round(rate, 1),
+            "bytes_per_second": round(self.bytes / elapsed if elapsed else 0.0, 1),
+            "eta_seconds": round(eta) if eta is not None else None,
+            "active_workers": len(active),
+            "pending_workers": len(pending),
+            "workers": {
+                name: {
+                    "docs": w["docs"],
+                    "bytes": w["bytes"],
+                    "errors": w["errors"],
+                    "done": w["done"],
+                    "pending": not w["done"] and w["started"] is None,
+                    "docs_per_second": round(w["docs"] / max((w["finished"] or now) - w["started"], 1e-6), 1)
+                    if w["started"] is not None else 0.0,
+                    # How far a worker trails the furthest one, and how long since it last reported
+                    "docs_behind": leader - w["docs"] if w["started"] is not None else None,
+                    "seconds_since_update": round(now - w["last_seen"], 1)
+                    if not w["done"] and w["last_seen"] is not None else 0,
+                }
+                for name, w in sorted(self.workers.items())
+            },
+        }
+
+    def tick(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last_tick < self.interval:
+            return
+        if now > self.last_tick:
+            self.peak_rate = max(self.peak_rate, (self.docs - self.last_docs) / (now - self.last_tick))
+        self.last_tick = now
+        self.last_docs = self.docs
+
+        status = self.status()
+        done = f"{self.docs}/{self.total}" if self.total is not None else str(self.docs)
+        line = (f"  {self.action}: {done} docs, {status['docs_per_second']:.0f} docs/s, "
+                f"{format_bytes(status['bytes_per_second'])}/s, ETA {format_duration(status['eta_seconds'])}, "
+                f"{self.errors} errors")
+        stalled = [(name, w) for name, w in status["workers"].items() if not w["done"] and not w["pending"]]
+        if stalled:
+            name, slowest = max(stalled, key=lambda item: item[1]["seconds_since_update"])
+            line += f", slowest {name} {slowest['seconds_since_update']:.0f}s since update"
+        if status["pending_workers"]:
+            line += f", {status['pending_workers']} pending"
+        print(f"\r{line}\033[K" if self.tty else line, end="" if self.tty else "\n", flush=True)
+        self.write_status(status)
+
+    def write_status(self, status: Dict):
+        if self.status_path:
+            save_json(self.status_path, status)
+
+    def finish(self) -> Dict:
+        """Prints and records the benchmark summary of the run."""
+        self.tick(force=True)
+        if self.tty:
+            print()
+        status = self.status()
+        status["state"] = "finished"
+        status["peak_docs_per_second"] = round(self.peak_rate, 1)
+        self.write_status(status)
+
+        print(f"{self.action.capitalize()} benchmark:")
+        print(f"  Documents:    {self.docs} ({self.errors} errors)")
+        print(f"  Data:         {format_bytes(self.bytes)} uncompressed")
+        print(f"  Elapsed:      {format_duration(status['elapsed_seconds'])}")
+        print(f"  Throughput:   {status['docs_per_second']:.0f} docs/s average, {self.peak_rate:.0f} docs/s peak, "
+              f"{format_bytes(status['bytes_per_second'])}/s")
+        print(f"  Workers:      {len(self.workers)}, "
+              f"{min((w['docs_per_second'] for w in status['workers'].values()), default=0):.0f}-"
+              f"{max((w['docs_per_second'] for w in status['workers'].values()), default=0):.0f} docs/s each")
+        return status
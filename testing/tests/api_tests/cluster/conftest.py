@@ -5,6 +5,8 @@ import warnings
 import pytest
 import urllib3
 
+from api_tests.index_inventory import IndexInventory
+
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -14,24 +16,30 @@ def suppress_insecure_request_warning():
     warnings.simplefilter("ignore", urllib3.exceptions.InsecureRequestWarning)
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def es_host():
     return os.getenv("ES_HOST", os.getenv("ELASTIC_HOST", "localhost"))
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def es_port():
     return os.getenv("ES_PORT", os.getenv("ELASTIC_PORT", "9200"))
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def username():
     return os.getenv("ES_USERNAME", os.getenv("ELASTIC_USERNAME", "elastic"))
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def password():
     return os.getenv(
         "elastic",
         os.getenv("ES_PASSWORD", os.getenv("ELASTIC_PASSWORD", "password1")),
     )
+
+
+@pytest.fixture(scope="session")
+def inventory(es_host, es_port, username, password):
+    # Shared by the session, tests that change indices call inventory.refresh()
+    return IndexInventory(es_host, es_port, username, password, ttl=60)
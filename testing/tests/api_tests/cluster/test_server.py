@@ -10,7 +10,13 @@ import urllib3
 import os
 
 
-from api_tests.helpers import make_request, load_json_schema
+from api_tests.helpers import (
+    make_request,
+    load_json_schema,
+    get_newest_indices,
+    get_index_mapping,
+    get_index_settings,
+)
 
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -143,8 +149,10 @@ def test_logging_policy(es_host, es_port, username, password):
 
 def test_logs_mapping(es_host, es_port, username, password):
     
-    url = f"https://{es_host}:{es_port}/logs-*/_mapping"
-    response = make_request(url, username, password)
+    # Only the newest backing index of each data stream is sampled
+    indices = get_newest_indices(es_host, es_port, username, password, "logs-*")
+    assert indices, "No logs-* indices found"
+    response = get_index_mapping(es_host, es_port, username, password, indices)
 
     assert response.status_code == 200, f"Expected 200, got {response.status_code}"    
     assert ".ds-logs-elastic_agent.endpoint_security-default-" in response.text
@@ -172,8 +180,10 @@ def test_logs_mapping(es_host, es_port, username, password):
 
 def test_logs_settings(es_host, es_port, username, password):
     
-    url = f"https://{es_host}:{es_port}/logs-*/_settings"
-    response = make_request(url, username, password)
+    # Only the newest backing index of each data stream is sampled
+    indices = get_newest_indices(es_host, es_port, username, password, "logs-*")
+    assert indices, "No logs-* indices found"
+    response = get_index_settings(es_host, es_port, username, password, indices)
 
     assert response.status_code == 200, f"Expected 200, got {response.status_code}"    
     assert ".ds-logs-endpoint.events.process-default-" in response.text
@@ -243,8 +253,10 @@ def test_elastic_agent_logs_search(es_host, es_port, username, password):
         
 def test_metrics_mapping(es_host, es_port, username, password):
     
-    url = f"https://{es_host}:{es_port}/metrics-*/_mapping"
-    response = make_request(url, username, password)
+    # Only the newest backing index of each data stream is sampled
+    indices = get_newest_indices(es_host, es_port, username, password, "metrics-*")
+    assert indices, "No metrics-* indices found"
+    response = get_index_mapping(es_host, es_port, username, password, indices)
 
     assert response.status_code == 200, f"Expected 200, got {response.status_code}"    
     #assert ".ds-metrics-system.process.summary-default" in response.text
@@ -275,8 +287,10 @@ def test_metrics_mapping(es_host, es_port, username, password):
 
 def test_metrics_settings(es_host, es_port, username, password):
     
-    url = f"https://{es_host}:{es_port}/metrics-*/_settings"
-    response = make_request(url, username, password)
+    # Only the newest backing index of each data stream is sampled
+    indices = get_newest_indices(es_host, es_port, username, password, "metrics-*")
+    assert indices, "No metrics-* indices found"
+    response = get_index_settings(es_host, es_port, username, password, indices)
 
     assert response.status_code == 200, f"Expected 200, got {response.status_code}"    
     assert ".ds-metrics-system.process.summary-default-" in response.text
@@ -326,8 +340,14 @@ def test_metrics_search(es_host, es_port, username, password):
     
 def test_wazuh_alert_mapping(es_host, es_port, username, password):
     
-    url = f"https://{es_host}:{es_port}/wazuh-alerts-4.x-*/_mapping"
-    response = make_request(url, username, password)
+    # Daily indices share one template, so the newest one is representative
+    indices = get_newest_indices(es_host, es_port, username, password, "wazuh-alerts-4.x-*")
+    assert indices, "No wazuh-alerts-4.x-* indices found"
+    # Two levels of leaf types is enough to list every top level field, objects included
+    response = get_index_mapping(
+        es_host, es_port, username, password, indices[-1:],
+        filter_path="*.mappings.properties.*.type,*.mappings.properties.*.properties.*.type",
+    )
     assert response.status_code == 200, f"Expected 200, got {response.status_code}"    
     data = json.loads(response.text)
     
@@ -363,8 +383,12 @@ def test_wazuh_alert_mapping(es_host, es_port, username, password):
     
 def test_wazuh_alert_settings(es_host, es_port, username, password):
     
-    url = f"https://{es_host}:{es_port}/wazuh-alerts-4.x-*/_settings"
-    response = make_request(url, username, password)
+    indices = get_newest_indices(es_host, es_port, username, password, "wazuh-alerts-4.x-*")
+    assert indices, "No wazuh-alerts-4.x-* indices found"
+    response = get_index_settings(
+        es_host, es_port, username, password, indices[-1:],
+        filter_path="*.settings.index.query.default_field",
+    )
     assert response.status_code == 200, f"Expected 200, got {response.status_code}"    
     data = json.loads(response.text)
     
@@ -382,8 +406,10 @@ def test_wazuh_alert_settings(es_host, es_port, username, password):
     
 def test_wazuh_manager_vulnerabilities(es_host, es_port, username, password):
     
-    url = f"https://{es_host}:{es_port}/wazuh-states-vulnerabilities-wazuh-manager/_settings"
-    response = make_request(url, username, password)
+    response = get_index_settings(
+        es_host, es_port, username, password, ["wazuh-states-vulnerabilities-wazuh-manager"],
+        filter_path="*.settings.index.query.default_field",
+    )
     assert response.status_code == 200, f"Expected 200, got {response.status_code}"    
     data = json.loads(response.text)
     
@@ -399,44 +425,46 @@ def test_wazuh_manager_vulnerabilities(es_host, es_port, username, password):
             act_data_fields.sort() == data_fields.sort()
     ), "Wazuh data fields do not match"
     
-def test_elastic_indices(es_host, es_port, username, password):
-    url = f"https://{es_host}:{es_port}/_cat/indices/"
-    response = make_request(url, username, password)
-
-    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
-    assert ("open .ds-logs-system.system-default" in response.text)                   
-    assert ("open .ds-metrics-system.process-default" in response.text)                  
-    assert ("open elastalert_status" in response.text)                                                      
-    #assert ("open .ds-logs-endpoint.events.api-default" in response.text)              
-    assert ("open .ds-metrics-endpoint.policy-default" in response.text)                       
-    assert ("open .ds-metrics-elastic_agent.metricbeat-default" in response.text)                         
-    assert ("open elastalert_status_error" in response.text)                                                
-    assert ("open .ds-logs-system.security-default" in response.text)              
-    assert ("open .ds-metrics-fleet_server.agent_versions-default" in response.text)    
-    assert ("open .ds-logs-endpoint.events.library-default" in response.text)             
-    assert ("open wazuh-states-vulnerabilities-wazuh-manager" in response.text)                             
-    assert ("open .ds-logs-endpoint.events.process-default" in response.text)            
-    assert ("open .ds-logs-endpoint.events.registry-default" in response.text)           
-    assert ("open .ds-metrics-elastic_agent.fleet_server-default" in response.text)      
-    assert ("open .ds-logs-elastic_agent.filebeat-default" in response.text)             
-    assert ("open .ds-metrics-elastic_agent.endpoint_security-default" in response.text) 
-    assert ("open .ds-logs-elastic_agent.fleet_server-default" in response.text)         
-    assert ("open .ds-metrics-fleet_server.agent_status-default" in response.text)      
-    assert ("open .ds-logs-elastic_agent-default" in response.text)                                       
-    assert ("open elastalert_status_silence" in response.text)                                              
-    assert ("open .ds-metrics-elastic_agent.filebeat_input-default" in response.text)    
-    assert ("open .ds-metrics-elastic_agent.filebeat-default" in response.text)           
-    assert ("open .ds-logs-elastic_agent.metricbeat-default" in response.text)                         
-    assert ("open .ds-logs-system.application-default" in response.text)                 
-    assert ("open .ds-logs-elastic_agent.endpoint_security-default" in response.text)    
-    assert ("open elastalert_status_status" in response.text)                                               
-    assert ("open elastalert_status_past" in response.text)                                                 
-    #assert ("open .ds-logs-system.auth-default" in response.text)
-    #assert ("open .ds-logs-system.syslog-default" in response.text)
-    assert ("open .ds-logs-endpoint.events.network-default" in response.text)          
-    assert ("open .ds-logs-endpoint.events.file-default" in response.text)              
-    assert ("open wazuh-alerts-4.x" in response.text)                                            
-    assert ("open .ds-metrics-elastic_agent.elastic_agent" in response.text)
+def test_elastic_indices(inventory):
+    open_indices = inventory.index_names("*", status="open")
+    assert open_indices, "No open indices found"
+
+    def has_open(prefix):
+        return any(index.startswith(prefix) for index in open_indices)
+
+    assert has_open(".ds-logs-system.system-default")                   
+    assert has_open(".ds-metrics-system.process-default")                  
+    assert has_open("elastalert_status")                                                      
+    #assert has_open(".ds-logs-endpoint.events.api-default")              
+    assert has_open(".ds-metrics-endpoint.policy-default")                       
+    assert has_open(".ds-metrics-elastic_agent.metricbeat-default")                         
+    assert has_open("elastalert_status_error")                                                
+    assert has_open(".ds-logs-system.security-default")              
+    assert has_open(".ds-metrics-fleet_server.agent_versions-default")    
+    assert has_open(".ds-logs-endpoint.events.library-default")             
+    assert has_open("wazuh-states-vulnerabilities-wazuh-manager")                             
+    assert has_open(".ds-logs-endpoint.events.process-default")            
+    assert has_open(".ds-logs-endpoint.events.registry-default")           
+    assert has_open(".ds-metrics-elastic_agent.fleet_server-default")      
+    assert has_open(".ds-logs-elastic_agent.filebeat-default")             
+    assert has_open(".ds-metrics-elastic_agent.endpoint_security-default") 
+    assert has_open(".ds-logs-elastic_agent.fleet_server-default")         
+    assert has_open(".ds-metrics-fleet_server.agent_status-default")      
+    assert has_open(".ds-logs-elastic_agent-default")                                       
+    assert has_open("elastalert_status_silence")                                              
+    assert has_open(".ds-metrics-elastic_agent.filebeat_input-default")    
+    assert has_open(".ds-metrics-elastic_agent.filebeat-default")           
+    assert has_open(".ds-logs-elastic_agent.metricbeat-default")                         
+    assert has_open(".ds-logs-system.application-default")                 
+    assert has_open(".ds-logs-elastic_agent.endpoint_security-default")    
+    assert has_open("elastalert_status_status")                                               
+    assert has_open("elastalert_status_past")                                                 
+    #assert has_open(".ds-logs-system.auth-default")
+    #assert has_open(".ds-logs-system.syslog-default")
+    assert has_open(".ds-logs-endpoint.events.network-default")          
+    assert has_open(".ds-logs-endpoint.events.file-default")              
+    assert has_open("wazuh-alerts-4.x")                                            
+    assert has_open(".ds-metrics-elastic_agent.elastic_agent")
     
 def test_fleet_server(es_host, es_port, username, password):
     
@@ -1,10 +1,18 @@
 # conftest.py for connectivity tests
 
 import os
+import sys
 import warnings
+from pathlib import Path
+
 import pytest
 import urllib3
 
+# The probe engine ships with the scripts, not as a package
+sys.path.insert(0, str(Path(__file__).resolve().parents[4] / "scripts" / "probe"))
+
+from probe import lme_probes, run_probes  # noqa: E402
+
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -12,11 +20,11 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 def suppress_insecure_request_warning():
     warnings.simplefilter("ignore", urllib3.exceptions.InsecureRequestWarning)
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def es_host():
     return os.getenv("ES_HOST", os.getenv("ELASTIC_HOST", "localhost"))
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def es_port():
     return os.getenv("ES_PORT", os.getenv("ELASTIC_PORT", "9200"))
 
@@ -42,3 +50,8 @@ def all_service_ports():
         'wazuh_udp': [514]
     }
 
+@pytest.fixture(scope="session")
+def probe_results(es_host, es_port):
+    """Probes every LME port concurrently once per session, keyed by (kind, port)"""
+    results = run_probes(lme_probes(es_host, es_port), timeout=10)
+    return {(result.probe.kind, result.probe.port): result for result in results}
@@ -7,6 +7,8 @@ import os
 import time
 import urllib3
 
+from api_tests.index_inventory import IndexInventory, InventoryError
+
 
 def make_request(url, username, password, body=None):
     auth = HTTPBasicAuth(username, password)
@@ -37,25 +39,79 @@ def post_request(url, username, password, body):
     return response
 
 
+def get_newest_indices(hostname, port, username, password, pattern):
+    """
+    Resolves an index pattern to one index per data stream (its newest backing
+    index) plus any standalone indices, without fetching mappings or settings.
+
+    Args:
+        pattern: Index pattern such as "logs-*" or "wazuh-alerts-4.x-*".
+
+    Returns:
+        A sorted list of index names, or an empty list if the request fails.
+    """
+    url = (
+        f"https://{hostname}:{port}/_resolve/index/{pattern}"
+        "?filter_path=indices.name,indices.data_stream,data_streams.name,data_streams.backing_indices"
+    )
+    response = make_request(url, username, password)
+
+    if response.status_code != 200:
+        print(f"Error resolving {pattern}. Status code: {response.status_code}")
+        return []
+
+    data = response.json()
+    # Backing indices are listed oldest generation first
+    newest = [
+        stream["backing_indices"][-1]
+        for stream in data.get("data_streams", [])
+        if stream.get("backing_indices")
+    ]
+    standalone = [
+        index["name"] for index in data.get("indices", []) if "data_stream" not in index
+    ]
+
+    return sorted(newest + standalone)
+
+
+def get_index_mapping(hostname, port, username, password, indices, filter_path="*.mappings.properties.*.type"):
+    """
+    Fetches the mapping of the given indices, trimmed server side with filter_path.
+
+    The default filter_path keeps only the types of top level leaf fields, which
+    is enough to show an index has a mapping without pulling the whole tree.
+    """
+    url = f"https://{hostname}:{port}/{','.join(indices)}/_mapping?filter_path={filter_path}"
+    return make_request(url, username, password)
+
+
+def get_index_settings(hostname, port, username, password, indices, filter_path="*.settings.index.creation_date"):
+    """
+    Fetches the settings of the given indices, trimmed server side with filter_path.
+    """
+    url = f"https://{hostname}:{port}/{','.join(indices)}/_settings?filter_path={filter_path}"
+    return make_request(url, username, password)
+
+
 def load_json_schema(file_path):
     with open(file_path, "r") as file:
         return json.load(file)
     
 def get_latest_winlogbeat_index(hostname, port, username, password):
-    url = f"https://{hostname}:{port}/_cat/indices/winlogbeat-*?h=index&s=index:desc&format=json"
-    response = make_request(url, username, password)
-    
-    if response.status_code == 200:
-        indices = json.loads(response.text)
-        if indices:
-            latest_index = indices[0]["index"]
-            return latest_index
-        else:
-            print("No winlogbeat indices found.")
-    else:
-        print(f"Error retrieving winlogbeat indices. Status code: {response.status_code}")
-    
-    return None
+    # A new inventory each time, data is inserted between calls
+    inventory = IndexInventory(hostname, port, username, password)
+
+    try:
+        # By name, winlogbeat indices carry their date
+        latest_index = inventory.latest_index("winlogbeat-*", sort="index:desc")
+    except InventoryError as e:
+        print(f"Error retrieving winlogbeat indices: {e}")
+        return None
+
+    if latest_index is None:
+        print("No winlogbeat indices found.")
+
+    return latest_index
 
 def insert_winlog_data(es_host, es_port, username, password, filter_query_filename, fixture_filename, filter_num):
     # Get the current date
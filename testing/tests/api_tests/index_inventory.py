@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Cheap index and data stream enumeration for Elasticsearch.
+
+Everything is requested as JSON with only the columns that are needed (h=),
+sorted server side (s=) and trimmed with filter_path, so listing a cluster with
+thousands of indices stays small. Responses are cached, for ttl seconds if one
+is given, otherwise until refresh() is called, so an inventory shared by a whole
+test session (the inventory fixture in the conftest files) is refreshed by any
+test that changes the indices before it asks again.
+
+Only the standard library is used, so it also runs on an LME host:
+
+    python3 index_inventory.py --host localhost --pattern 'logs-*' --data-streams
+"""
+import argparse
+import base64
+import json
+import os
+import ssl
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+DEFAULT_COLUMNS = ("index", "status", "health", "docs.count", "store.size", "creation.date")
+
+
+class InventoryError(Exception):
+    pass
+
+
+class IndexInventory:
+    def __init__(self, host, port, username, password, scheme="https", verify=False, timeout=30, ttl=None):
+        self.base_url = f"{scheme}://{host}:{port}"
+        self.timeout = timeout
+        self.ttl = ttl
+        token = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.headers = {"Authorization": f"Basic {token}", "Accept": "application/json"}
+        self.context = ssl.create_default_context()
+        if not verify:
+            self.context.check_hostname = False
+            self.context.verify_mode = ssl.CERT_NONE
+        self._cache = {}
+
+    def _get(self, path, params, first_line=False):
+        """
+        GETs path as JSON, or with first_line only the first line of the plain
+        text response, without reading the rest of it.
+        """
+        key = (path, tuple(sorted(params.items())), first_line)
+        if key in self._cache:
+            fetched, data = self._cache[key]
+            if self.ttl is None or time.monotonic() - fetched < self.ttl:
+                return data
+
+        url = f"{self.base_url}/{path}?{urllib.parse.urlencode(params)}"
+        headers = dict(self.headers, Accept="text/plain") if first_line else self.headers
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout, context=self.context) as response:
+                if first_line:
+                    data = response.readline().decode().strip() or None
+                else:
+                    data = json.load(response)
+        except urllib.error.HTTPError as e:
+            # A pattern that matches nothing is not an error for an inventory
+            if e.code == 404:
+                data = None
+            else:
+                raise InventoryError(f"GET {path} failed with status {e.code}") from e
+        except urllib.error.URLError as e:
+            raise InventoryError(f"GET {path} failed: {e.reason}") from e
+
+        self._cache[key] = (time.monotonic(), data)
+        return data
+
+    def refresh(self):
+        """Drops every cached response, the next call of each query asks the cluster again."""
+        self._cache.clear()
+
+    def indices(self, pattern="*", columns=DEFAULT_COLUMNS, sort="index", limit=None):
+        """
+        Lists indices matching pattern, hidden ones (such as .ds- backing indices) included.
+
+        Args:
+            pattern: Index pattern.
+            columns: _cat/indices columns to return, each row is a dict keyed by them.
+            sort: Server side sort, e.g. "index" or "creation.date:desc".
+            limit: Maximum number of rows to return. _cat has no size parameter,
+                so this is applied to the response, see latest_index for a
+                single row.
+
+        Returns:
+            A list of dicts, one per index.
+        """
+        params = {
+            "format": "json",
+            "h": ",".join(columns),
+            "s": sort,
+            "bytes": "b",
+            "expand_wildcards": "all",
+        }
+        rows = self._get(f"_cat/indices/{urllib.parse.quote(pattern, safe='*,')}", params) or []
+        return rows[:limit] if limit else rows
+
+    def index_names(self, pattern="*", status=None):
+        rows = self.indices(pattern, columns=("index", "status"))
+        return [row["index"] for row in rows if status is None or row["status"] == status]
+
+    def latest_index(self, pattern, sort="creation.date:desc"):
+        """
+        Returns the first index matching pattern in sort order, by default the
+        most recently created one, or None.
+
+        Sorted on the server and fetched as plain text with only the index
+        column, so just the first line is read.
+        """
+        params = {"h": "index", "s": sort, "expand_wildcards": "all"}
+        return self._get(f"_cat/indices/{urllib.parse.quote(pattern, safe='*,')}", params, first_line=True)
+
+    def data_streams(self, pattern="*"):
+        """
+        Lists data streams matching pattern with their backing indices, oldest first.
+
+        Returns:
+            A dict of data stream name to list of backing index names.
+        """
+        params = {
+            "expand_wildcards": "all",
+            "filter_path": "data_streams.name,data_streams.indices.index_name",
+        }
+        data = self._get(f"_data_stream/{urllib.parse.quote(pattern, safe='*,')}", params) or {}
+        return {
+            stream["name"]: [index["index_name"] for index in stream.get("indices", [])]
+            for stream in data.get("data_streams", [])
+        }
+
+    def write_indices(self, pattern="*"):
+        """Returns the current write (newest backing) index of each data stream."""
+        return {name: indices[-1] for name, indices in self.data_streams(pattern).items() if indices}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List Elasticsearch indices or data streams as JSON.")
+    parser.add_argument("--host", default=os.getenv("ES_HOST", "localhost"))
+    parser.add_argument("--port", default=os.getenv("ES_PORT", "9200"))
+    parser.add_argument("--username", default=os.getenv("ES_USERNAME", "elastic"))
+    parser.add_argument(
+        "--password-env",
+        default="ES_PASSWORD",
+        help="Environment variable holding the password (default: ES_PASSWORD)",
+    )
+    parser.add_argument("--pattern", default="*")
+    parser.add_argument("--sort", default="index")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--names-only", action="store_true", help="Print only index names, one per line")
+    parser.add_argument(
+        "--data-streams", action="store_true", help="List data streams and their backing indices instead"
+    )
+    args = parser.parse_args(argv)
+
+    password = os.getenv(args.password_env)
+    if password is None:
+        parser.error(f"{args.password_env} is not set")
+
+    inventory = IndexInventory(args.host, args.port, args.username, password)
+    try:
+        if args.data_streams:
+            print(json.dumps(inventory.data_streams(args.pattern), indent=2))
+        elif args.names_only:
+            rows = inventory.indices(args.pattern, columns=("index",), sort=args.sort, limit=args.limit)
+            print("\n".join(row["index"] for row in rows))
+        else:
+            print(json.dumps(inventory.indices(args.pattern, sort=args.sort, limit=args.limit), indent=2))
+    except InventoryError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -63,27 +63,28 @@ def test_elastic_root(es_host, es_port, username, password):
     validate(instance=response.json(), schema=schema)
 
 #@pytest.mark.skip(reason="These indices were changed in the new LME version")
-def test_elastic_indices(es_host, es_port, username, password):
-    url = f"https://{es_host}:{es_port}/_cat/indices/"
-    response = make_request(url, username, password)
+def test_elastic_indices(inventory):
+    open_indices = inventory.index_names("*", status="open")
+    assert open_indices, "No open indices found"
 
-    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
-             
-    assert ("open elastalert_status" in response.text)                                                 
-    assert ("open .ds-metrics-fleet_server.agent_status-default" in response.text)
-    assert ("open .ds-metrics-elastic_agent.metricbeat-default" in response.text)   
-    assert ("open .ds-metrics-elastic_agent.fleet_server-default" in response.text) 
-    assert ("open elastalert_status_silence" in response.text)                                         
-    assert ("open .ds-metrics-elastic_agent.filebeat-default" in response.text)     
-    assert ("open .ds-metrics-elastic_agent.filebeat_input-default" in response.text)
-    assert ("open .internal.alerts-security.alerts-default" in response.text)                  
-    assert ("open elastalert_status_error" in response.text)                                           
-    assert ("open .ds-metrics-fleet_server.agent_versions-default" in response.text)
-    assert ("open elastalert_status_status" in response.text)                                          
-    assert ("open elastalert_status_past" in response.text)                                            
-    assert ("open wazuh-states-vulnerabilities-wazuh-manager" in response.text)                        
-    assert ("open metrics-endpoint.metadata_current_default" in response.text)  # Endpoint metrics may not exist yet                                
-    assert ("open .ds-logs-elastic_agent-default" in response.text)                 
-    assert ("open wazuh-alerts-4.x" in response.text)                                     
-    assert ("open .ds-metrics-elastic_agent.elastic_agent-default" in response.text)
-    assert ("open .ds-logs-elastic_agent.fleet_server-default" in response.text) 
+    def has_open(prefix):
+        return any(index.startswith(prefix) for index in open_indices)
+
+    assert has_open("elastalert_status")                                                 
+    assert has_open(".ds-metrics-fleet_server.agent_status-default")
+    assert has_open(".ds-metrics-elastic_agent.metricbeat-default")   
+    assert has_open(".ds-metrics-elastic_agent.fleet_server-default") 
+    assert has_open("elastalert_status_silence")                                         
+    assert has_open(".ds-metrics-elastic_agent.filebeat-default")     
+    assert has_open(".ds-metrics-elastic_agent.filebeat_input-default")
+    assert has_open(".internal.alerts-security.alerts-default")                  
+    assert has_open("elastalert_status_error")                                           
+    assert has_open(".ds-metrics-fleet_server.agent_versions-default")
+    assert has_open("elastalert_status_status")                                          
+    assert has_open("elastalert_status_past")                                            
+    assert has_open("wazuh-states-vulnerabilities-wazuh-manager")                        
+    assert has_open("metrics-endpoint.metadata_current_default")  # Endpoint metrics may not exist yet                                
+    assert has_open(".ds-logs-elastic_agent-default")                 
+    assert has_open("wazuh-alerts-4.x")                                     
+    assert has_open(".ds-metrics-elastic_agent.elastic_agent-default")
+    assert has_open(".ds-logs-elastic_agent.fleet_server-default") 
@@ -0,0 +1,24 @@
+# conftest.py
+
+import pytest
+
+from backup_tests.helpers import CHUNKS_DIR, make_tree
+from chunkstore import ChunkStore
+
+
+@pytest.fixture
+def repo(tmp_path):
+    path = tmp_path / "repo"
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def store(repo):
+    # zlib needs no optional module
+    return ChunkStore(repo / CHUNKS_DIR, "zlib")
+
+
+@pytest.fixture
+def source(tmp_path):
+    return make_tree(tmp_path / "source")
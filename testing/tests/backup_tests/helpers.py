@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# The backup engine is a set of scripts, not a package
+BACKUP_SCRIPTS = Path(__file__).resolve().parents[3] / "scripts" / "backup"
+sys.path.insert(0, str(BACKUP_SCRIPTS))
+
+from manifest import Manifest, scan_source  # noqa: E402
+
+CHUNKS_DIR = ".chunks"
+# Small chunks, so a file of a few KB spans several of them
+CHUNK_SIZE = 1024
+
+
+def run_lme_backup(*args):
+    """Runs lme-backup.py with args, returns the completed process."""
+    return subprocess.run(
+        [sys.executable, str(BACKUP_SCRIPTS / "lme-backup.py"), *map(str, args)],
+        capture_output=True,
+        text=True,
+    )
+
+
+def make_tree(root):
+    """A small source tree with nested files, an empty file, a symlink and an empty directory."""
+    (root / "config").mkdir(parents=True)
+    (root / "config" / "lme.yml").write_text("cluster: lme\n")
+    (root / "data").mkdir()
+    (root / "data" / "segment.bin").write_bytes(os.urandom(5 * CHUNK_SIZE + 100))
+    (root / "data" / "empty").write_bytes(b"")
+    (root / "empty_dir").mkdir()
+    os.symlink("config/lme.yml", root / "current.yml")
+    return root
+
+
+def tree_contents(root):
+    """Relative path -> file bytes, symlink target or None for directories."""
+    contents = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = Path(dirpath) / name
+            relative = str(path.relative_to(root))
+            if path.is_symlink():
+                contents[relative] = ("symlink", os.readlink(path))
+            elif path.is_dir():
+                contents[relative] = None
+            else:
+                contents[relative] = path.read_bytes()
+    return contents
+
+
+def make_backup(repo, store, name, sources, created=None):
+    """
+    Backs up sources ({name: path}) into repo/name the way lme-backup.py
+    does, with small chunks. Returns the backup directory.
+    """
+    manifest = Manifest(name)
+    if created is not None:
+        manifest.data["created"] = created
+    for source, path in sources.items():
+        result = scan_source(str(path), store, manifest, chunk_size=CHUNK_SIZE)
+        manifest.sources[source] = {"path": str(path), "status": "SUCCESS", **result}
+    backup_dir = repo / name
+    backup_dir.mkdir()
+    manifest.save(backup_dir)
+    return backup_dir
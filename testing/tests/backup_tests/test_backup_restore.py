@@ -0,0 +1,122 @@
+import os
+
+from backup_tests.helpers import CHUNK_SIZE, make_backup, make_tree, run_lme_backup, tree_contents
+from chunkstore import ChunkStore
+from manifest import Manifest, scan_source
+from restore import restore_source
+
+
+def test_chunk_store_round_trip(store):
+    data = os.urandom(CHUNK_SIZE)
+    digest, _, new = store.put(data)
+    assert new
+    assert store.get(digest) == data
+
+    # The same content is stored once
+    assert store.put(data)[0] == digest
+    assert not store.put(data)[2]
+
+
+def test_chunk_store_compresses_only_when_smaller(store):
+    compressible = b"a" * CHUNK_SIZE
+    random = os.urandom(CHUNK_SIZE)
+    compressible_digest, compressible_size, _ = store.put(compressible)
+    random_digest, random_size, _ = store.put(random)
+
+    assert compressible_size < CHUNK_SIZE
+    assert store.find(compressible_digest).suffix == ".zz"
+    assert random_size == CHUNK_SIZE
+    assert store.find(random_digest).suffix == ""
+    assert store.get(compressible_digest) == compressible
+
+
+def test_backup_restore_round_trip(repo, store, source, tmp_path):
+    backup_dir = make_backup(repo, store, "b1", {"etc": source})
+    manifest = Manifest.load(backup_dir)
+
+    target = tmp_path / "target"
+    stats = restore_source(manifest.entries("etc"), target, store)
+
+    assert tree_contents(target) == tree_contents(source)
+    assert stats["files"] == 3
+    assert os.stat(target / "data" / "segment.bin").st_mtime_ns == os.stat(source / "data" / "segment.bin").st_mtime_ns
+
+
+def test_restore_rewrites_changed_files_and_removes_extra_ones(repo, store, source, tmp_path):
+    manifest = Manifest.load(make_backup(repo, store, "b1", {"etc": source}))
+    target = tmp_path / "target"
+    restore_source(manifest.entries("etc"), target, store)
+
+    (target / "config" / "lme.yml").write_text("changed\n")
+    (target / "extra.txt").write_text("not in the backup\n")
+    stats = restore_source(manifest.entries("etc"), target, store)
+
+    assert tree_contents(target) == tree_contents(source)
+    assert stats["files"] == 1
+    assert stats["removed"] == 1
+    assert stats["unchanged"] == 2
+
+
+def test_unchanged_files_reuse_the_previous_backup(repo, store, source):
+    first = Manifest("b1")
+    result = scan_source(str(source), store, first, chunk_size=CHUNK_SIZE)
+    previous = {entry["path"]: entry for entry in result["entries"]}
+
+    (source / "config" / "lme.yml").write_text("cluster: changed\n")
+    second = scan_source(str(source), store, Manifest("b2"), previous=previous, chunk_size=CHUNK_SIZE)
+
+    assert second["stats"]["reused_files"] == 2
+    assert second["stats"]["read_bytes"] == len("cluster: changed\n")
+
+
+def test_restore_refuses_a_failed_source(repo, source, tmp_path):
+    missing = tmp_path / "missing"
+    result = run_lme_backup(
+        "backup", "--repo", repo, "--name", "b1", "--compression", "zlib",
+        "--source", f"etc_lme={missing}", "--source", f"data={source}",
+    )
+    assert result.returncode == 1
+    assert Manifest.load(repo / "b1").sources["etc_lme"]["status"] == "FAILED"
+
+    target = make_tree(tmp_path / "live")
+    before = tree_contents(target)
+    result = run_lme_backup("restore", "--backup", repo / "b1", "--source", f"etc_lme={target}")
+    assert result.returncode == 1
+    assert "FAILED" in result.stdout
+    assert tree_contents(target) == before
+
+    assert run_lme_backup("status", "--backup", repo / "b1", "--source", "etc_lme").returncode == 1
+    assert run_lme_backup("status", "--backup", repo / "b1", "--source", "data").returncode == 0
+
+
+def test_restore_of_a_failed_source_with_force_empties_the_target(repo, source, tmp_path):
+    run_lme_backup("backup", "--repo", repo, "--name", "b1", "--compression", "zlib",
+                   "--source", f"etc_lme={tmp_path / 'missing'}")
+    target = make_tree(tmp_path / "live")
+
+    result = run_lme_backup("restore", "--backup", repo / "b1", "--source", f"etc_lme={target}", "--force")
+
+    assert result.returncode == 0
+    assert tree_contents(target) == {}
+
+
+def test_cli_backup_restore_round_trip(repo, source, tmp_path):
+    result = run_lme_backup("backup", "--repo", repo, "--name", "b1", "--compression", "zlib",
+                            "--source", f"etc={source}")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert (repo / "b1" / "etc" / "backup_status.txt").read_text() == "SUCCESS\n"
+
+    target = tmp_path / "target"
+    result = run_lme_backup("restore", "--backup", repo / "b1", "--source", f"etc={target}", "--no-reflink")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert tree_contents(target) == tree_contents(source)
+
+
+def test_store_reads_chunks_written_with_another_codec(repo, source, tmp_path):
+    raw_store = ChunkStore(repo / ".chunks", "none")
+    manifest = Manifest.load(make_backup(repo, raw_store, "b1", {"etc": source}))
+
+    target = tmp_path / "target"
+    restore_source(manifest.entries("etc"), target, ChunkStore(repo / ".chunks", "zlib"))
+
+    assert tree_contents(target) == tree_contents(source)
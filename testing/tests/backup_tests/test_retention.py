@@ -0,0 +1,144 @@
+import datetime
+
+from backup_tests.helpers import make_backup, run_lme_backup
+from manifest import list_backups
+from retention import (BackupUsage, RetentionPolicy, collect_garbage, legacy_backups, prune_backups,
+                       repository_usage, select_backups)
+
+
+def usage(name, created, chunks):
+    return BackupUsage(path=None, name=name, created=created, chunks=chunks, files=0,
+                       unique_bytes=0, shared_bytes=0)
+
+
+def hourly_backups(count, start=datetime.datetime(2024, 1, 1), hours=1, size=100):
+    """count backups, hours apart, each with one chunk of its own."""
+    return [usage(f"b{i}", start + datetime.timedelta(hours=i * hours), {f"chunk{i}": size}) for i in range(count)]
+
+
+def names(backups):
+    return [backup.name for backup in backups]
+
+
+def test_nothing_to_select_without_backups():
+    assert select_backups([], RetentionPolicy(keep_last=1)) == []
+
+
+def test_without_keep_rules_every_backup_is_kept():
+    backups = hourly_backups(3)
+    assert select_backups(backups, RetentionPolicy()) == []
+
+
+def test_without_keep_rules_max_bytes_prunes_only_as_far_as_needed():
+    backups = hourly_backups(5)
+    assert select_backups(backups, RetentionPolicy(max_bytes=500)) == []
+    assert names(select_backups(backups, RetentionPolicy(max_bytes=350))) == ["b0", "b1"]
+
+
+def test_without_keep_rules_min_free_prunes_only_as_far_as_needed():
+    backups = hourly_backups(4)
+    policy = RetentionPolicy(min_free_percent=10)
+    assert select_backups(backups, policy, free_bytes=500, fs_bytes=2000) == []
+    assert names(select_backups(backups, policy, free_bytes=150, fs_bytes=2000)) == ["b0"]
+
+
+def test_newest_backup_is_always_kept():
+    backups = hourly_backups(3)
+    assert names(select_backups(backups, RetentionPolicy(keep_daily=1))) == ["b0", "b1"]
+
+
+def test_keep_last():
+    backups = hourly_backups(5)
+    assert names(select_backups(backups, RetentionPolicy(keep_last=2))) == ["b0", "b1", "b2"]
+
+
+def test_keep_daily_keeps_the_newest_backup_of_each_day():
+    # Eight hours apart: three backups a day
+    backups = hourly_backups(9, hours=8)
+    pruned = select_backups(backups, RetentionPolicy(keep_daily=2))
+    assert names(pruned) == ["b0", "b1", "b2", "b3", "b4", "b6", "b7"]
+
+
+def test_keep_weekly_keeps_the_newest_backup_of_each_week():
+    # 2024-01-01 is a Monday, one backup a day for three weeks
+    backups = hourly_backups(21, hours=24)
+    kept = set(names(backups)) - set(names(select_backups(backups, RetentionPolicy(keep_weekly=2))))
+    assert kept == {"b13", "b20"}
+
+
+def test_policies_are_combined():
+    backups = hourly_backups(9, hours=8)
+    pruned = select_backups(backups, RetentionPolicy(keep_last=3, keep_daily=2))
+    assert names(pruned) == ["b0", "b1", "b2", "b3", "b4"]
+
+
+def test_max_bytes_drops_the_oldest_kept_backups():
+    backups = hourly_backups(5)
+    pruned = select_backups(backups, RetentionPolicy(keep_last=5, max_bytes=250))
+    assert names(pruned) == ["b0", "b1", "b2"]
+
+
+def test_max_bytes_counts_shared_chunks_once():
+    start = datetime.datetime(2024, 1, 1)
+    backups = [usage(f"b{i}", start + datetime.timedelta(hours=i), {"shared": 100, f"own{i}": 10}) for i in range(4)]
+    pruned = select_backups(backups, RetentionPolicy(keep_last=4, max_bytes=130))
+    assert names(pruned) == ["b0"]
+
+
+def test_max_bytes_never_drops_the_newest_backup():
+    backups = hourly_backups(3, size=1000)
+    assert names(select_backups(backups, RetentionPolicy(keep_last=3, max_bytes=1))) == ["b0", "b1"]
+
+
+def test_min_free_prunes_until_enough_space_is_freed():
+    backups = hourly_backups(4)
+    # 10% of 2000 bytes must be free, 50 are: pruning two backups frees 200
+    policy = RetentionPolicy(keep_last=4, min_free_percent=10)
+    assert names(select_backups(backups, policy, free_bytes=50, fs_bytes=2000)) == ["b0", "b1"]
+
+
+def test_prune_removes_only_chunks_no_other_backup_uses(repo, store, source):
+    make_backup(repo, store, "b1", {"etc": source}, created="2024-01-01T00:00:00Z")
+    (source / "config" / "lme.yml").write_text("cluster: changed\n")
+    make_backup(repo, store, "b2", {"etc": source}, created="2024-01-02T00:00:00Z")
+
+    backups = repository_usage(repo)
+    assert names(backups) == ["b1", "b2"]
+    old_config = set(backups[0].chunks) - set(backups[1].chunks)
+    assert len(old_config) == 1
+    assert backups[0].unique_bytes == sum(backups[0].chunks[d] for d in old_config)
+
+    stats = prune_backups(repo, store, select_backups(backups, RetentionPolicy(keep_last=1)))
+
+    assert stats["chunks"] == 1
+    assert [path.name for path in list_backups(repo)] == ["b2"]
+    assert not any(store.has(digest) for digest in old_config)
+    assert all(store.has(digest) for digest in backups[1].chunks)
+
+
+def test_garbage_collection_removes_temporary_chunks(repo, store, source):
+    make_backup(repo, store, "b1", {"etc": source})
+    leftover = store.root / "ab" / ".tmp-interrupted"
+    leftover.parent.mkdir(exist_ok=True)
+    leftover.write_bytes(b"partial")
+
+    assert collect_garbage(repo, store)["chunks"] == 1
+    assert not leftover.exists()
+
+
+def test_legacy_backups_are_listed_but_not_pruned(repo, store, source):
+    make_backup(repo, store, "b1", {"etc": source})
+    (repo / "20240101_legacy" / "etc").mkdir(parents=True)
+
+    assert [path.name for path in legacy_backups(repo)] == ["20240101_legacy"]
+    assert names(repository_usage(repo)) == ["b1"]
+
+
+def test_prune_refuses_to_run_without_a_policy(repo, store, source):
+    make_backup(repo, store, "b1", {"etc": source}, created="2024-01-01T00:00:00Z")
+    make_backup(repo, store, "b2", {"etc": source}, created="2024-01-02T00:00:00Z")
+
+    result = run_lme_backup("prune", "--repo", repo)
+
+    assert result.returncode == 1
+    assert [path.name for path in list_backups(repo)] == ["b1", "b2"]
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from backup_tests.helpers import make_backup
+from manifest import Manifest
+from verify import VerifiedCache, verify_backup
+
+
+def segment_chunks(backup_dir):
+    entries = Manifest.load(backup_dir).entries("etc")
+    return next(entry["chunks"] for entry in entries if entry["path"] == "data/segment.bin")
+
+
+def test_verify_passes_an_intact_backup(repo, store, source):
+    report = verify_backup(make_backup(repo, store, "b1", {"etc": source}), store, workers=2)
+
+    assert report["files"] == 3
+    assert report["read_chunks"] == report["chunks"]
+    assert not report["missing_chunks"]
+    assert not report["corrupt_chunks"]
+    assert not report["bad_files"]
+    assert not report["failed_sources"]
+
+
+def test_verify_detects_a_missing_chunk(repo, store, source):
+    backup_dir = make_backup(repo, store, "b1", {"etc": source})
+    digest = segment_chunks(backup_dir)[0]
+    store.find(digest).unlink()
+
+    report = verify_backup(backup_dir, store, workers=2)
+
+    assert report["missing_chunks"] == [digest]
+    assert report["bad_files"] == ["etc/data/segment.bin"]
+
+
+def test_verify_detects_a_corrupt_chunk(repo, store, source):
+    backup_dir = make_backup(repo, store, "b1", {"etc": source})
+    digest = segment_chunks(backup_dir)[1]
+    path = store.find(digest)
+    data = bytearray(path.read_bytes())
+    data[0] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    report = verify_backup(backup_dir, store, workers=2)
+
+    assert report["corrupt_chunks"] == [digest]
+    assert report["bad_files"] == ["etc/data/segment.bin"]
+
+
+def test_verify_rereads_a_chunk_changed_after_it_was_verified(repo, store, source):
+    backup_dir = make_backup(repo, store, "b1", {"etc": source})
+    assert not verify_backup(backup_dir, store, workers=2)["corrupt_chunks"]
+
+    # Same size, so only the mtime tells the cache the chunk was rewritten
+    digest = segment_chunks(backup_dir)[0]
+    path = store.find(digest)
+    path.write_bytes(b"x" * path.stat().st_size)
+
+    report = verify_backup(backup_dir, store, workers=2)
+    assert report["corrupt_chunks"] == [digest]
+
+
+def test_verify_reports_failed_and_missing_sources(repo, store, source):
+    backup_dir = make_backup(repo, store, "b1", {"etc": source})
+    manifest = Manifest.load(backup_dir)
+    manifest.sources["etc_lme"] = {"path": "/etc/lme", "status": "FAILED", "entries": [], "stats": {}}
+    manifest.save(backup_dir)
+
+    report = verify_backup(backup_dir, store, workers=2, required_sources=["etc", "lme"])
+
+    assert report["failed_sources"] == ["etc_lme: FAILED", "lme: MISSING"]
+
+
+def test_concurrent_verifies_each_save_the_cache(repo, store, source):
+    backup_dir = make_backup(repo, store, "b1", {"etc": source})
+    first, second = VerifiedCache(store), VerifiedCache(store)
+    first.chunks = {"a": [1, 2, 3]}
+    second.chunks = {"b": [4, 5, 6]}
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(lambda cache: [cache.save() for _ in range(50)], (first, second)))
+
+    loaded = VerifiedCache(store)
+    loaded.load()
+    assert loaded.chunks in ({"a": [1, 2, 3]}, {"b": [4, 5, 6]})
+    assert not list(store.root.glob(".tmp-*"))
+    assert not verify_backup(backup_dir, store, workers=2)["corrupt_chunks"]
@@ -4,15 +4,21 @@ import os
 import string
 import random
 import re
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.devtestlabs import DevTestLabsClient
-from azure.mgmt.devtestlabs.models import Schedule
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
-from azure.mgmt.resource.subscriptions import SubscriptionClient
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
+from types import SimpleNamespace
+
+# The rest of the Azure SDK is imported where it is used, so --fake runs
+# without it installed
+try:
+    from azure.core.exceptions import ResourceNotFoundError
+except ImportError:
+    from fake_azure_clients import ResourceNotFoundError
+
+# Upper bound on long-running Azure operations awaited at the same time
+DEFAULT_MAX_PARALLEL = 8
 
 
 def generate_password(length=12):
@@ -40,6 +46,9 @@ def generate_password(length=12):
 
 
 def get_default_subscription_id(credential=None):
+    from azure.identity import DefaultAzureCredential
+    from azure.mgmt.resource.subscriptions import SubscriptionClient
+
     if credential is None:
         credential = DefaultAzureCredential()
 
@@ -55,6 +64,12 @@ def get_default_subscription_id(credential=None):
 
 
 def create_clients(subscription_id):
+    from azure.identity import DefaultAzureCredential
+    from azure.mgmt.compute import ComputeManagementClient
+    from azure.mgmt.devtestlabs import DevTestLabsClient
+    from azure.mgmt.network import NetworkManagementClient
+    from azure.mgmt.resource import ResourceManagementClient
+
     credential = DefaultAzureCredential()
     if subscription_id is None:
         subscription_id = get_default_subscription_id(credential)
@@ -75,47 +90,168 @@ def check_ports_protocals_and_priorities(ports, priorities, protocols):
         exit(1)
 
 
-def set_network_rules(
-    network_client,
-    resource_group,
-    allowed_sources_list,
-    nsg_name,
-    ports,
-    priorities,
-    protocols,
-):
+def wait_for_pollers(pollers, max_parallel=DEFAULT_MAX_PARALLEL, return_exceptions=False):
+    """
+    Waits on several long-running operations concurrently with a bounded pool.
+
+    The operations must already have been submitted (the begin_* call returns
+    once Azure accepts the request), so this only overlaps the polling.
+
+    Args:
+        pollers: Dict of label to poller.
+        max_parallel: Maximum number of pollers awaited at once.
+        return_exceptions: Return failures as results instead of raising the
+            first one once every operation has finished.
+
+    Returns:
+        Dict of label to result.
+    """
+    results = {}
+    errors = []
+    if not pollers:
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(max_parallel, len(pollers))) as executor:
+        futures = {
+            executor.submit(poller.result): label
+            for label, poller in pollers.items()
+        }
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                result = future.result()
+                if isinstance(pollers[label], CompletedPoller):
+                    print(f"'{getattr(result, 'name', label)}' is up to date.")
+                else:
+                    print(f"'{getattr(result, 'name', label)}' created successfully.")
+            except Exception as e:
+                print(f"Error creating '{label}': {e}")
+                result = e
+                errors.append(e)
+            results[label] = result
+
+    if errors and not return_exceptions:
+        raise errors[0]
+    return results
+
+
+class CompletedPoller:
+    """Poller stand-in for a resource that is already in the desired state."""
+
+    def __init__(self, resource):
+        self._resource = resource
+
+    def result(self, timeout=None):
+        return self._resource
+
+
+def build_network_rules(allowed_sources_list, ports, priorities, protocols):
     check_ports_protocals_and_priorities(ports, priorities, protocols)
 
+    rules = []
     for i in range(len(ports)):
         port = ports[i]
-        priority = priorities[i]
-        protocol = protocols[i]
-        print(f"\nCreating Network Port {port} rule...")
-
-        nsg_rule_params = {
-            "protocol": protocol,
+        rules.append({
+            "protocol": protocols[i],
             "source_address_prefix": allowed_sources_list,
             "destination_address_prefix": "*",
             "access": "Allow",
             "direction": "Inbound",
             "source_port_range": "*",
             "destination_port_range": str(port),
-            "priority": priority,
+            "priority": priorities[i],
             "name": f"Network_Port_Rule_{port}",
-        }
+        })
+    return rules
+
+
+def _rule_as_dict(rule):
+    if isinstance(rule, dict):
+        return rule
+    if hasattr(rule, "as_dict"):
+        return rule.as_dict()
+    return vars(rule)
 
-        nsg_rule_poller = network_client.security_rules.begin_create_or_update(
-            resource_group_name=resource_group,
-            network_security_group_name=nsg_name,
-            security_rule_name=nsg_rule_params["name"],
-            security_rule_parameters=nsg_rule_params,
+
+def missing_network_rules(existing_rules, rules):
+    """Returns the rules that are absent from, or differ in, existing_rules."""
+    compared = (
+        "protocol", "source_address_prefix", "destination_address_prefix",
+        "access", "direction", "source_port_range", "destination_port_range",
+        "priority",
+    )
+    existing = {
+        rule["name"]: rule for rule in map(_rule_as_dict, existing_rules)
+    }
+    missing = []
+    for rule in rules:
+        current = existing.get(rule["name"])
+        if current is None or any(
+            str(current.get(key)).lower() != str(rule[key]).lower()
+            for key in compared
+        ):
+            missing.append(rule)
+    return missing
+
+
+def set_network_rules(
+    network_client,
+    resource_group,
+    allowed_sources_list,
+    nsg_name,
+    ports,
+    priorities,
+    protocols,
+    nsg_params,
+):
+    """
+    Starts creating the NSG with every inbound rule embedded in one request.
+
+    The PUT replaces the whole rule set, so an existing NSG is read first and
+    only rules that are missing or different are added, keeping the rules
+    created outside this script. If nothing is missing no request is made at
+    all.
+
+    Returns:
+        A poller for the NSG.
+    """
+    rules = build_network_rules(allowed_sources_list, ports, priorities, protocols)
+
+    try:
+        existing_nsg = network_client.network_security_groups.get(
+            resource_group, nsg_name
+        )
+    except ResourceNotFoundError:
+        existing_nsg = None
+
+    if existing_nsg is not None:
+        existing_rules = existing_nsg.security_rules or []
+        missing = missing_network_rules(existing_rules, rules)
+        if not missing:
+            print(f"Network security group '{nsg_name}' rules are up to date.")
+            return CompletedPoller(existing_nsg)
+
+        missing_names = {rule["name"] for rule in missing}
+        print(
+            f"Adding {len(missing)} missing rule(s) to '{nsg_name}': "
+            f"{', '.join(sorted(missing_names))}"
         )
-        nsg_rule = nsg_rule_poller.result()
-        print(f"Network rule '{nsg_rule.name}' created successfully.")
+        rules = [
+            _rule_as_dict(rule) for rule in existing_rules
+            if _rule_as_dict(rule)["name"] not in missing_names
+        ] + missing
 
+    for rule in rules:
+        print(f"Network Port {rule['destination_port_range']} rule: {rule['name']}")
+
+    return network_client.network_security_groups.begin_create_or_update(
+        resource_group_name=resource_group,
+        network_security_group_name=nsg_name,
+        parameters=dict(nsg_params, security_rules=rules),
+    )
 
 
-def create_public_ip(network_client, resource_group, location, machine_name):
+def begin_public_ip(network_client, resource_group, location, machine_name):
     print(f"\nCreating public IP address for {machine_name}")
     
     # Generate a valid domain name label
@@ -132,7 +268,7 @@ def create_public_ip(network_client, resource_group, location, machine_name):
             "domain_name_label": unique_dns_name
         },
     }
-    public_ip_poller = (
+    return (
         network_client.public_ip_addresses
         .begin_create_or_update(
             resource_group.name,
@@ -140,15 +276,9 @@ def create_public_ip(network_client, resource_group, location, machine_name):
             public_ip_params
         )
     )
-    public_ip = public_ip_poller.result()
-    print(
-        f"Public IP address '{public_ip.name}' with "
-        f"ip {public_ip.ip_address} created successfully."
-    )
-    return public_ip
 
 
-def create_network_interface(
+def begin_network_interface(
         network_client, resource_group, location, machine_name,
         subnet_id, private_ip_address, public_ip, nsg_id
         ):
@@ -170,18 +300,21 @@ def create_network_interface(
             "id": nsg_id
         }
     }
-    nic_poller = network_client.network_interfaces.begin_create_or_update(
+    return network_client.network_interfaces.begin_create_or_update(
         resource_group.name, f"{machine_name}-nic", nic_params
     )
-    nic = nic_poller.result()
-    print(f"Network interface '{nic.name}' created successfully with associated NSG.")
-    return nic
 
 
 def set_auto_shutdown(
         devtestlabs_client, subscription_id, resource_group_name, location,
         vm_name, auto_shutdown_time, auto_shutdown_email
         ):
+    try:
+        from azure.mgmt.devtestlabs.models import Schedule
+    except ImportError:
+        # Only reached with --fake, whose client takes any object
+        Schedule = SimpleNamespace
+
     print(
             f"\nCreating Auto-Shutdown Rule for {vm_name} "
             f"at time {auto_shutdown_time}...")
@@ -221,49 +354,17 @@ def save_to_parent_directory(filename, content):
     print(f"File saved: {file_path}")
 
 
-def create_windows_server(
-    compute_client,
-    network_client,
-    resource_group,
+def windows_server_params(
     location,
     vm_admin,
     vm_password,
-    vnet_name,
-    subnet_name,
-    nsg_name,
+    nic,
     project,
     today,
     current_user,
-    subscription_id  
 ):
-    server_name = "ws1"  
-    print(f"\nCreating Windows Server {server_name}...")
-
-    # Create public IP address using the existing function
-    public_ip = create_public_ip(network_client, resource_group, location, server_name)
-
-    # Create NIC using the existing function
-    subnet_id = (
-        f"/subscriptions/{subscription_id}/"
-        f"resourceGroups/{resource_group.name}/"
-        f"providers/Microsoft.Network/"
-        f"virtualNetworks/{vnet_name}/"
-        f"subnets/{subnet_name}"
-    )
-    nsg = network_client.network_security_groups.get(resource_group.name, nsg_name)
-    nic = create_network_interface(
-        network_client,
-        resource_group,
-        location,
-        server_name,
-        subnet_id,
-        "10.1.0.4",  
-        public_ip,
-        nsg.id
-    )
-
-    # Create VM
-    vm_params = {
+    server_name = "ws1"
+    return {
         'location': location,
         'os_profile': {
             'computer_name': server_name,
@@ -293,18 +394,6 @@ def create_windows_server(
         }
     }
 
-    try:
-        vm_result = compute_client.virtual_machines.begin_create_or_update(
-            resource_group.name,
-            server_name,
-            vm_params
-        ).result()
-        print(f"Windows Server {server_name} created successfully.")
-        return server_name
-    except Exception as e:
-        print(f"Error creating Windows Server: {str(e)}")
-        return None
-
 
 # All arguments are keyword arguments
 def main(
@@ -333,14 +422,23 @@ def main(
     auto_shutdown_time: str = None,
     auto_shutdown_email: str = None,
     add_windows_server: bool = False,
+    max_parallel: int = DEFAULT_MAX_PARALLEL,
+    fake: bool = False,
 ):
+    if fake:
+        # Exercise the orchestration locally without touching Azure
+        from fake_azure_clients import create_fake_clients
+        client_factory = create_fake_clients
+    else:
+        client_factory = create_clients
     (
         resource_client,
         network_client,
         compute_client,
         devtestlabs_client,
         subscription_id
-    ) = create_clients(subscription_id)
+    ) = client_factory(subscription_id)
+    start_time = time.monotonic()
 
     # Variables used for Azure tags
     current_user = os.getenv("USER", "unknown")
@@ -387,7 +485,14 @@ def main(
     )
     print(f"Resource group '{resource_group.name}' created successfully.")
 
-    # Setup network
+    # Everything below only depends on the resource group, so the
+    # independent operations are submitted together and awaited concurrently
+    windows_server_name = "ws1"
+    machines = {machine_name: ls_ip}
+    if add_windows_server:
+        machines[windows_server_name] = "10.1.0.4"
+
+    # Setup network and public IPs
     print("\nCreating virtual network...")
     vnet_params = {
         "location": location,
@@ -399,13 +504,12 @@ def main(
             "project": project,
         },
     }
-    vnet_poller = network_client.virtual_networks.begin_create_or_update(
+    pollers = {}
+    pollers["vnet"] = network_client.virtual_networks.begin_create_or_update(
         resource_group_name=resource_group.name,
         virtual_network_name=vnet_name,
         parameters=vnet_params,
     )
-    vnet = vnet_poller.result()
-    print(f"Virtual network '{vnet.name}' created successfully.")
 
     print("\nCreating network security group...")
     nsg_params = {
@@ -416,24 +520,26 @@ def main(
             "project": project,
         },
     }
-    nsg_poller = network_client.network_security_groups.begin_create_or_update(
-        resource_group_name=resource_group.name,
-        network_security_group_name="NSG1",
-        parameters=nsg_params,
-    )
-    nsg = nsg_poller.result()
-    print(f"Network security group '{nsg.name}' created successfully.")
-
-    set_network_rules(
+    pollers["nsg"] = set_network_rules(
         network_client,
         resource_group.name,
         allowed_sources,
-        nsg.name,
+        "NSG1",
         ports,
         priorities,
         protocols,
+        nsg_params,
     )
 
+    for name in machines:
+        pollers[f"{name}-public-ip"] = begin_public_ip(
+            network_client, resource_group, location, name
+        )
+
+    results = wait_for_pollers(pollers, max_parallel)
+    nsg = results["nsg"]
+    public_ips = {name: results[f"{name}-public-ip"] for name in machines}
+    public_ip = public_ips[machine_name]
 
     # Create the VM
     vm_password = generate_password()
@@ -445,6 +551,12 @@ def main(
             f"{resource_group.name}.password.txt", vm_password
     )
 
+    print(f"\nWriting public_ip to {resource_group.name}.ip.txt")
+    save_to_parent_directory(
+            f"{resource_group.name}.ip.txt",
+            public_ip.ip_address
+        )
+
     subnet_id = (
             f"/subscriptions/{subscription_id}/"
             f"resourceGroups/{resource_group.name}/"
@@ -453,26 +565,21 @@ def main(
             f"subnets/{subnet_name}"
             )
 
-    public_ip = create_public_ip(
-            network_client, resource_group, location, machine_name
-            )
-
-    print(f"\nWriting public_ip to {resource_group.name}.ip.txt")
-    save_to_parent_directory(
-            f"{resource_group.name}.ip.txt",
-            public_ip.ip_address
-        )
-
-    nic = create_network_interface(
-                network_client,
-                resource_group,
-                location,
-                machine_name,
-                subnet_id,
-                ls_ip,
-                public_ip,
-                nsg.id
-            )
+    # NICs only need the NSG, subnet and public IPs
+    pollers = {}
+    for name, private_ip_address in machines.items():
+        pollers[f"{name}-nic"] = begin_network_interface(
+                    network_client,
+                    resource_group,
+                    location,
+                    name,
+                    subnet_id,
+                    private_ip_address,
+                    public_ips[name],
+                    nsg.id
+                )
+    results = wait_for_pollers(pollers, max_parallel)
+    nics = {name: results[f"{name}-nic"] for name in machines}
 
     print(f"\nCreating {machine_name}...")
     ls1_params = {
@@ -501,7 +608,7 @@ def main(
         "network_profile": {
             "network_interfaces": [
                 {
-                    "id": nic.id,
+                    "id": nics[machine_name].id,
                 }
             ],
         },
@@ -511,13 +618,34 @@ def main(
             "project": project,
         },
     }
-    ls1_poller = compute_client.virtual_machines.begin_create_or_update(
+    pollers = {}
+    pollers[machine_name] = compute_client.virtual_machines.begin_create_or_update(
         resource_group_name=resource_group.name,
         vm_name=machine_name,
         parameters=ls1_params,
     )
-    ls1 = ls1_poller.result()
-    print(f"Virtual machine '{ls1.name}' created successfully.")
+
+    # Add Windows server if the flag is set
+    if add_windows_server:
+        print(f"\nCreating Windows Server {windows_server_name}...")
+        pollers[windows_server_name] = compute_client.virtual_machines.begin_create_or_update(
+            resource_group.name,
+            windows_server_name,
+            windows_server_params(
+                location,
+                vm_admin,
+                vm_password,
+                nics[windows_server_name],
+                project,
+                today,
+                current_user,
+            ),
+        )
+
+    # A failed Windows server should not fail the whole lab
+    results = wait_for_pollers(pollers, max_parallel, return_exceptions=True)
+    if isinstance(results[machine_name], Exception):
+        raise results[machine_name]
 
     # Configure Auto-Shutdown
     if auto_shutdown_time:
@@ -538,30 +666,13 @@ def main(
     print(f"Password: {vm_password}")
     print("SAVE THE ABOVE INFO\n")
 
-    # Add Windows server if the flag is set
     if add_windows_server:
-        print("\nAdding Windows server...")
-        windows_server = create_windows_server(
-            compute_client,
-            network_client,
-            resource_group,
-            location,
-            vm_admin,
-            vm_password,
-            vnet_name,
-            subnet_name,
-            "NSG1",  # nsg_name
-            project,
-            today,
-            current_user,
-            subscription_id  
-        )
-        if windows_server:
-            print(f"Windows Server {windows_server} created successfully.")
-        else:
+        if isinstance(results[windows_server_name], Exception):
             print("Failed to create Windows Server.")
+        else:
+            print(f"Windows Server {windows_server_name} created successfully.")
 
-    print("Done.")
+    print(f"Done in {time.monotonic() - start_time:.1f}s.")
 
 
 if __name__ == "__main__":
@@ -715,6 +826,19 @@ if __name__ == "__main__":
         action="store_true",
         help="Add a Windows server with default settings",
     )
+    parser.add_argument(
+        "-mp",
+        "--max-parallel",
+        type=int,
+        default=DEFAULT_MAX_PARALLEL,
+        help="Maximum number of Azure operations awaited at once. "
+             f"Default: {DEFAULT_MAX_PARALLEL}",
+    )
+    parser.add_argument(
+        "--fake",
+        action="store_true",
+        help="Use in-memory fake Azure clients to test the orchestration locally",
+    )
     parser.add_argument(
         "--use-rhel",
         action="store_true",
@@ -772,4 +896,6 @@ if __name__ == "__main__":
         auto_shutdown_time=args.auto_shutdown_time,
         auto_shutdown_email=args.auto_shutdown_email,
         add_windows_server=args.add_windows_server,
+        max_parallel=args.max_parallel,
+        fake=args.fake,
     )
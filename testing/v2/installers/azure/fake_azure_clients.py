@@ -0,0 +1,256 @@
+"""
+In-memory stand-ins for the Azure management clients used by
+build_azure_linux_network.py.
+
+They implement just enough of the SDK surface (begin_* pollers, get,
+create_or_update) to run the builder end to end without credentials or
+network access. Each long-running operation sleeps for a fixed latency when
+its result is awaited, and every call is recorded, so the orchestration and
+its concurrency can be checked locally:
+
+    python build_azure_linux_network.py -g test-rg -s 10.0.0.1/32 -y --fake
+"""
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+try:
+    from azure.core.exceptions import ResourceNotFoundError
+except ImportError:
+    class ResourceNotFoundError(Exception):
+        """Stand-in for the SDK exception, so the fakes run without the Azure SDK."""
+
+
+class FakeState:
+    """Shared call log and in-flight counters for one set of fake clients."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = []
+        self.resources = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def record(self, operation, name):
+        with self._lock:
+            self.calls.append((operation, name))
+
+    def store(self, kind, resource_group, name, resource):
+        with self._lock:
+            self.resources[(kind, resource_group, name)] = resource
+
+    def lookup(self, kind, resource_group, name):
+        with self._lock:
+            return self.resources.get((kind, resource_group, name))
+
+    def wait(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class FakePoller:
+    def __init__(self, state, make_resource):
+        self._state = state
+        self._make_resource = make_resource
+        self._result = None
+        self._lock = threading.Lock()
+
+    def result(self, timeout=None):
+        with self._lock:
+            if self._result is None:
+                self._state.wait()
+                self._result = self._make_resource()
+        return self._result
+
+    def done(self):
+        return self._result is not None
+
+
+def _resource_id(resource_group, provider, kind, name):
+    return (
+        f"/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/"
+        f"{resource_group}/providers/{provider}/{kind}/{name}"
+    )
+
+
+def _get(params, key, default=None):
+    if isinstance(params, dict):
+        return params.get(key, default)
+    return getattr(params, key, default)
+
+
+def _as_rule(rule):
+    if isinstance(rule, dict):
+        return SimpleNamespace(**rule)
+    return rule
+
+
+class _ResourceGroups:
+    def __init__(self, state):
+        self._state = state
+
+    def create_or_update(self, resource_group_name, parameters):
+        self._state.record("resource_groups.create_or_update", resource_group_name)
+        return SimpleNamespace(name=resource_group_name, location=_get(parameters, "location"))
+
+
+class _VirtualNetworks:
+    def __init__(self, state):
+        self._state = state
+
+    def begin_create_or_update(self, resource_group_name, virtual_network_name, parameters):
+        self._state.record("virtual_networks.begin_create_or_update", virtual_network_name)
+        return FakePoller(self._state, lambda: SimpleNamespace(
+            name=virtual_network_name,
+            id=_resource_id(resource_group_name, "Microsoft.Network", "virtualNetworks", virtual_network_name),
+        ))
+
+
+class _NetworkSecurityGroups:
+    def __init__(self, state):
+        self._state = state
+
+    def begin_create_or_update(self, resource_group_name, network_security_group_name, parameters):
+        self._state.record("network_security_groups.begin_create_or_update", network_security_group_name)
+
+        def make():
+            nsg = SimpleNamespace(
+                name=network_security_group_name,
+                id=_resource_id(
+                    resource_group_name, "Microsoft.Network", "networkSecurityGroups", network_security_group_name
+                ),
+                location=_get(parameters, "location"),
+                tags=_get(parameters, "tags"),
+                security_rules=[_as_rule(rule) for rule in _get(parameters, "security_rules") or []],
+            )
+            self._state.store("nsg", resource_group_name, network_security_group_name, nsg)
+            return nsg
+
+        return FakePoller(self._state, make)
+
+    def get(self, resource_group_name, network_security_group_name):
+        self._state.record("network_security_groups.get", network_security_group_name)
+        nsg = self._state.lookup("nsg", resource_group_name, network_security_group_name)
+        if nsg is None:
+            raise ResourceNotFoundError(f"Network security group '{network_security_group_name}' not found")
+        return nsg
+
+
+class _SecurityRules:
+    def __init__(self, state):
+        self._state = state
+
+    def begin_create_or_update(
+        self, resource_group_name, network_security_group_name, security_rule_name, security_rule_parameters
+    ):
+        self._state.record("security_rules.begin_create_or_update", security_rule_name)
+
+        def make():
+            rule = _as_rule(dict(security_rule_parameters, name=security_rule_name))
+            nsg = self._state.lookup("nsg", resource_group_name, network_security_group_name)
+            if nsg is not None:
+                nsg.security_rules = [r for r in nsg.security_rules if r.name != security_rule_name] + [rule]
+            return rule
+
+        return FakePoller(self._state, make)
+
+
+class _PublicIpAddresses:
+    def __init__(self, state):
+        self._state = state
+        self._next_ip = 10
+
+    def begin_create_or_update(self, resource_group_name, public_ip_address_name, parameters):
+        self._state.record("public_ip_addresses.begin_create_or_update", public_ip_address_name)
+        self._next_ip += 1
+        ip_address = f"198.51.100.{self._next_ip}"
+        return FakePoller(self._state, lambda: SimpleNamespace(
+            name=public_ip_address_name,
+            id=_resource_id(resource_group_name, "Microsoft.Network", "publicIPAddresses", public_ip_address_name),
+            ip_address=ip_address,
+        ))
+
+
+class _NetworkInterfaces:
+    def __init__(self, state):
+        self._state = state
+
+    def begin_create_or_update(self, resource_group_name, network_interface_name, parameters):
+        self._state.record("network_interfaces.begin_create_or_update", network_interface_name)
+        return FakePoller(self._state, lambda: SimpleNamespace(
+            name=network_interface_name,
+            id=_resource_id(resource_group_name, "Microsoft.Network", "networkInterfaces", network_interface_name),
+        ))
+
+
+class _VirtualMachines:
+    def __init__(self, state):
+        self._state = state
+
+    def begin_create_or_update(self, resource_group_name, vm_name, parameters):
+        self._state.record("virtual_machines.begin_create_or_update", vm_name)
+        return FakePoller(self._state, lambda: SimpleNamespace(
+            name=vm_name,
+            id=_resource_id(resource_group_name, "Microsoft.Compute", "virtualMachines", vm_name),
+            vm_id=str(uuid.uuid4()),
+        ))
+
+
+class _GlobalSchedules:
+    def __init__(self, state):
+        self._state = state
+
+    def create_or_update(self, resource_group_name, name, schedule):
+        self._state.record("global_schedules.create_or_update", name)
+        return SimpleNamespace(name=name)
+
+
+class FakeResourceManagementClient:
+    def __init__(self, state):
+        self.resource_groups = _ResourceGroups(state)
+
+
+class FakeNetworkManagementClient:
+    def __init__(self, state):
+        self.virtual_networks = _VirtualNetworks(state)
+        self.network_security_groups = _NetworkSecurityGroups(state)
+        self.security_rules = _SecurityRules(state)
+        self.public_ip_addresses = _PublicIpAddresses(state)
+        self.network_interfaces = _NetworkInterfaces(state)
+
+
+class FakeComputeManagementClient:
+    def __init__(self, state):
+        self.virtual_machines = _VirtualMachines(state)
+
+
+class FakeDevTestLabsClient:
+    def __init__(self, state):
+        self.global_schedules = _GlobalSchedules(state)
+
+
+def create_fake_clients(subscription_id=None, latency=1.0, state=None):
+    """
+    Returns clients in the same order as build_azure_linux_network.create_clients.
+
+    Pass a FakeState to inspect the recorded calls and peak concurrency afterwards.
+    """
+    if state is None:
+        state = FakeState(latency)
+    if subscription_id is None:
+        subscription_id = "00000000-0000-0000-0000-000000000000"
+    return (
+        FakeResourceManagementClient(state),
+        FakeNetworkManagementClient(state),
+        FakeComputeManagementClient(state),
+        FakeDevTestLabsClient(state),
+        subscription_id,
+    )